@@ -4,12 +4,17 @@ The intended target is OCR text extracted from visual sources using upstream CLA
 """
 
 import argparse
+import json
 import logging
+import threading
+import time
+from typing import Optional, Union
 
 # Imports needed for Clams and MMIF.
 # Non-NLP Clams applications will require AnnotationTypes
 
 from clams import ClamsApp, Restifier
+from flask import Response
 from mmif import Mmif, View, Annotation, Document, AnnotationTypes, DocumentTypes
 from mmif.utils import sequence_helper as sqh
 
@@ -18,80 +23,389 @@ from lapps.discriminators import Uri
 
 import metadata
 
-import pandas as pd
-from utils.clean_ocr import clean_ocr
-from utils.rfb import bind_role_fillers
+from utils.alignment import get_annotations_of_type, index_aligned_text_documents
+from utils.batching import TokenBudgetBatcher
+from utils.cache import RFBCache
+from utils.chyron_rules import recognize_chyron
+from utils.clean_ocr import clean_ocr_lines
+from utils.csv_writer import role_filler_csv
+from utils.dedup import RunDeduplicator
+from utils.incremental import PreviousBindings
+from utils.metrics import DOCUMENTS, FAST_PATH_DOCUMENTS, PAIRS, StageTimer, expose_metrics
+from utils.microbatch import MicroBatcher
+from utils.model import BACKENDS, DECODERS, DEFAULT_MODEL, DEFAULT_ONNX_DIR, rfb_model
+from utils.rfb import bind_role_fillers_batch, respell_pairs, tag_inputs, word_input_lengths
+from utils.scrolling import ScrollTracker, roll_pairs, visible_pairs
 
 
 class RoleFillerBinder(ClamsApp):
 
-    def __init__(self):
+    def __init__(self, cache: Optional[RFBCache] = None, queue: Optional[MicroBatcher] = None):
         super().__init__()
+        self.cache = cache
+        # when set, model inputs of concurrent requests are tagged together in shared batches
+        self.queue = queue
+        # the stage timer of the request each thread is working on
+        self._request = threading.local()
 
     def _appmetadata(self):
         # see https://sdk.clams.ai/autodoc/clams.app.html#clams.app.ClamsApp._load_appmetadata
         # Also check out ``metadata.py`` in this directory. 
         pass
 
+    def annotate(self, mmif: Union[str, dict, Mmif], **runtime_params) -> str:
+        # the input MMIF is parsed before `_annotate` is called, so parsing is timed here
+        timer = StageTimer()
+        with timer.stage('parse'):
+            if not isinstance(mmif, Mmif):
+                mmif = Mmif(mmif)
+        self._request.timer = timer
+        try:
+            return super().annotate(mmif, **runtime_params)
+        finally:
+            self._request.timer = None
+
     def _annotate(self, mmif: Mmif, **parameters) -> Mmif:
         # see https://sdk.clams.ai/autodoc/clams.app.html#clams.app.ClamsApp._annotate
+        start = time.perf_counter()
+        timer = getattr(self._request, 'timer', None) or StageTimer()
         self.logger.debug(f"Parameters: {parameters}")
         if not isinstance(mmif, Mmif):
-            mmif = Mmif(mmif)
+            with timer.stage('parse'):
+                mmif = Mmif(mmif)
 
         # TODO: Add support for user-defined labels.
         #  However, they MUST map to tokens the RFB model has been trained on.
         labelmap = {'I': 'chyron', 'N': 'chyron', 'Y': 'chyron', 'C': 'credits', 'R': 'credits'}
 
+        # TextDocuments already bound by an earlier run with the same app version and parameters are skipped
+        previous = PreviousBindings(mmif, self.metadata.identifier, parameters) if parameters['incremental'] else None
+
+        # first pass: collect every eligible TextDocument, so the model can run on all of them in batches
+        pending = []
+        # near-duplicate frames are mapped to the index of their representative frame in `pending`
+        dedup = RunDeduplicator(parameters['nearDuplicateThreshold']) if parameters['skipNearDuplicates'] else None
+        reused = {}
+        # chyrons bound by rules, by index in `pending`
+        ruled = {}
+        # frames of scrolling credit rolls: the roll and TimePoint of each frame, and for frames tagged incrementally,
+        # the inputs to tag instead of the whole frame and the lines of the frame, by index in `pending`
+        scroll = ScrollTracker(parameters['scrollContext']) if parameters['scrollingCredits'] else None
+        roll_of = {}
+        timepoint_of = {}
+        segments = {}
+        segment_lines = {}
+        timepoint_views = [[(tp_ann, tp_ann.get('label'))
+                            for tp_ann in get_annotations_of_type(view, AnnotationTypes.TimePoint)]
+                           for view in mmif.get_all_views_contain(AnnotationTypes.TimePoint)]
+        # only TimePoints with a supported label are looked up in the alignments
+        aligned_tds = index_aligned_text_documents(tp_ann for tp_anns in timepoint_views
+                                                   for tp_ann, tp_label in tp_anns if tp_label in labelmap)
+        for tp_anns in timepoint_views:
+            if dedup is not None:
+                dedup.reset()
+            if scroll is not None:
+                scroll.reset()
+            for tp_ann, tp_label in tp_anns:
+                if tp_label not in labelmap:
+                    if dedup is not None:
+                        dedup.reset()
+                    if scroll is not None:
+                        scroll.reset()
+                    continue
+                scene: str = labelmap[tp_label]
+                if scroll is not None and scene != 'credits':
+                    scroll.reset()
+                for td_ann in aligned_tds.get(tp_ann.long_id, ()):
+                    if previous is not None and previous.is_bound(td_ann, tp_ann):
+                        continue
+                    self.logger.debug(f"Queueing {scene.upper()} TextDocument `{td_ann.long_id}` anchored to "
+                                      f"TimePoint `{tp_ann.long_id}` labeled `{tp_label}`")
+                    ocr_text = rf'{td_ann.text_value}'
+                    with timer.stage('clean_ocr'):
+                        lines = clean_ocr_lines(ocr_text)
+                        input_seq = " ".join(word for line in lines for word in line)
+                    DOCUMENTS.inc(scene=scene)
+                    if dedup is not None:
+                        representative = dedup.match(tp_label, input_seq)
+                        if representative is not None:
+                            self.logger.debug(f"TextDocument `{td_ann.long_id}` is a near-duplicate of "
+                                              f"`{pending[representative][0].long_id}`")
+                            reused[len(pending)] = representative
+                        else:
+                            dedup.start(tp_label, input_seq, len(pending))
+                    if scroll is not None and scene == 'credits':
+                        # near-duplicates are planned too, as the next frame is aligned with them
+                        spans = scroll.plan(lines)
+                        roll_of[len(pending)] = scroll.rolls
+                        timepoint_of[len(pending)] = tp_ann.long_id
+                        if spans is not None and len(pending) not in reused:
+                            segments[len(pending)] = [" ".join(word for line in lines[start:end] for word in line)
+                                                      for start, end in spans]
+                            segment_lines[len(pending)] = lines
+                    if parameters['chyronFastPath'] and scene == 'chyron' and len(pending) not in reused:
+                        with timer.stage('chyron_rules'):
+                            pairs = recognize_chyron(lines)
+                        if pairs is not None:
+                            ruled[len(pending)] = pairs
+                    pending.append((td_ann, scene, input_seq))
+
+        if previous is not None and previous.views:
+            self.logger.debug(f"Skipped {previous.skipped} TextDocuments bound in views {previous.view_ids}")
+            if not pending:
+                # nothing new since the last run, which already holds all the results
+                timer.seconds['annotate'] = time.perf_counter() - start
+                timer.observe()
+                return mmif
+
+        # second pass: run the model on the queued sequences and record the results
+        to_tag = [idx for idx in range(len(pending)) if idx not in reused and idx not in ruled and idx not in segments]
+        # the new lines of incrementally tagged credits frames are tagged along with the other sequences
+        segment_inputs = [(idx, text) for idx, texts in segments.items() for text in texts]
+        self.logger.debug(f"Processing {len(to_tag)} TextDocuments and {len(segment_inputs)} segments of scrolling "
+                          f"credits in batches of up to {parameters['batchSize']} sequences and "
+                          f"{parameters['maxBatchTokens']} tokens")
+        batcher = TokenBudgetBatcher(max_tokens=parameters['maxBatchTokens'] or None,
+                                     max_batch_size=parameters['batchSize'])
+        input_tokens = []
+        tagged = bind_role_fillers_batch([pending[idx][2] for idx in to_tag] + [text for _, text in segment_inputs],
+                                         [pending[idx][1] for idx in to_tag] + ['credits'] * len(segment_inputs),
+                                         cache=self.cache, batcher=batcher,
+                                         window_size=parameters['windowSize'] or None,
+                                         window_overlap=parameters['windowOverlap'], queue=self.queue,
+                                         timer=timer, input_tokens=input_tokens)
+        if self.queue is not None:
+            self.logger.debug(f"Micro-batching stats: {self.queue.stats()}")
+        else:
+            self.logger.debug(f"Batching stats: {batcher.stats()}")
+        results = [None] * len(pending)
+        for idx, parsed in zip(to_tag, tagged):
+            results[idx] = parsed
+        for idx in segments:
+            results[idx] = []
+        for (idx, _), parsed in zip(segment_inputs, tagged[len(to_tag):]):
+            results[idx] = results[idx] + parsed
+        if ruled:
+            with timer.stage('chyron_rules'):
+                spelled = respell_pairs(rfb_model.tagger, [pair for pairs in ruled.values() for pair in pairs])
+            for idx, pairs in ruled.items():
+                results[idx], spelled = spelled[:len(pairs)], spelled[len(pairs):]
+        for idx, representative in reused.items():
+            results[idx] = results[representative]
+        # the frames of each roll, in order
+        rolls = {}
+        for idx, roll in roll_of.items():
+            rolls.setdefault(roll, []).append(idx)
+        for idxs in rolls.values():
+            for previous_idx, idx in zip(idxs, idxs[1:]):
+                if idx in reused:
+                    results[idx] = results[reused[idx]]
+                elif idx in segments:
+                    # the pairs of the lines shared with the previous frame are those found in that frame
+                    results[idx] = roll_pairs([visible_pairs(results[previous_idx], segment_lines[idx]), results[idx]])
+
         rfb_view = mmif.new_view()
         self.sign_view(rfb_view, parameters)
-        rfb_view.new_contain(DocumentTypes.TextDocument)
-        rfb_view.new_contain(AnnotationTypes.Alignment)
-
-        for view in mmif.get_all_views_contain(AnnotationTypes.TimePoint):
-            for tp_ann in view.get_annotations(AnnotationTypes.TimePoint):
-                for aligned in tp_ann.get_all_aligned():
-                    if aligned.at_type == DocumentTypes.TextDocument:
-                        td_ann = aligned
-                        tp_label = tp_ann.get('label')
-                        self.logger.debug(f"Found a TextDocument `{td_ann.long_id}`"
-                                          f" anchored to TimePoint `{tp_ann.long_id}` labeled `{tp_label}`")
-                        if tp_label in labelmap.keys():
-                            scene: str = labelmap[tp_label]
-                            self.logger.debug(f"Processing {scene.upper()} TextDocument `{td_ann.long_id}` ")
-                            ocr_text = rf'{td_ann.text_value}'
-                            input_seq = " ".join(clean_ocr(ocr_text))
-                            parsed = bind_role_fillers(input_seq, scene)
-                            self.logger.debug(f"Found {len(parsed)} Role-Filler pairs.")
-                            if not parsed:
-                                continue
-                            else:
-                                csv_string = pd.DataFrame.from_dict(parsed).to_csv()
-                                new_doc = rfb_view.new_textdocument(text=csv_string)
-                                rfb_view.new_annotation(
-                                    at_type=AnnotationTypes.Alignment, source=td_ann.long_id, target=new_doc.long_id
-                                )
-                                self.logger.debug(
-                                    f"Created annotation `{new_doc.long_id}` anchored to `{td_ann.long_id}`"
-                                )
+        output_format = parameters['outputFormat']
+        if output_format == 'annotations':
+            rfb_view.new_contain(AnnotationTypes.Annotation)
+        else:
+            rfb_view.new_contain(DocumentTypes.TextDocument)
+        if output_format == 'csv':
+            rfb_view.new_contain(AnnotationTypes.Alignment)
+        if rolls:
+            rfb_view.new_contain(AnnotationTypes.TimeFrame)
+        if previous is not None and previous.views:
+            # results of the skipped TextDocuments are in the earlier views, and are not copied
+            rfb_view.metadata.set_additional_property('previousViews', previous.view_ids)
+            rfb_view.metadata.set_additional_property('skippedBoundDocuments', previous.skipped)
+        if dedup is not None:
+            self.logger.debug(f"Skipped {dedup.skipped} near-duplicate TextDocuments")
+            rfb_view.metadata.set_additional_property('skippedNearDuplicates', dedup.skipped)
+        if scroll is not None:
+            rfb_view.metadata.set_additional_property(
+                'scrollingCredits', self._scrolling_report(pending, roll_of, reused, segments, scroll.rolls,
+                                                           dict(zip(to_tag, input_tokens)),
+                                                           input_tokens[len(to_tag):], timer))
+        if parameters['chyronFastPath']:
+            FAST_PATH_DOCUMENTS.inc(len(ruled))
+            self.logger.debug(f"Bound {len(ruled)} of {len(pending)} TextDocuments by rules, without the model")
+            rfb_view.metadata.set_additional_property('fastPathDocuments', len(ruled))
+        if self.cache is not None:
+            self.logger.debug(f"Cache stats: {self.cache.stats()}")
+        # all pairs of the MMIF in one CSV document, with the TextDocument of each pair as first column
+        consolidated = []
+        for idx, ((td_ann, _, _), parsed) in enumerate(zip(pending, results)):
+            self.logger.debug(f"Found {len(parsed)} Role-Filler pairs in `{td_ann.long_id}`.")
+            if not parsed:
+                continue
+            PAIRS.inc(len(parsed))
+            if output_format == 'annotations':
+                roll = {'roll': roll_of[idx]} if idx in roll_of else {}
+                rfb_view.new_annotation(AnnotationTypes.Annotation, document=td_ann.long_id,
+                                        pairs=[[pair['Role'], pair['Filler']] for pair in parsed], **roll)
+                continue
+            if output_format == 'document':
+                consolidated.extend({'Document': td_ann.long_id, **pair} for pair in parsed)
+                continue
+            with timer.stage('csv'):
+                csv_string = role_filler_csv(parsed)
+            new_doc = rfb_view.new_textdocument(text=csv_string)
+            rfb_view.new_annotation(
+                at_type=AnnotationTypes.Alignment, source=td_ann.long_id, target=new_doc.long_id
+            )
+            self.logger.debug(
+                f"Created annotation `{new_doc.long_id}` anchored to `{td_ann.long_id}`"
+            )
+        if consolidated:
+            with timer.stage('csv'):
+                csv_string = role_filler_csv(consolidated)
+            rfb_view.new_textdocument(text=csv_string)
+        # each scrolling credit roll is a TimeFrame over the TimePoints of its frames, holding the TextDocuments of the
+        # frames and their deduplicated pairs (named apart from the `pairs` of the frames, which they repeat)
+        for roll, idxs in rolls.items():
+            rfb_view.new_annotation(AnnotationTypes.TimeFrame, label='credits', roll=roll,
+                                    targets=list(dict.fromkeys(timepoint_of[idx] for idx in idxs)),
+                                    documents=[pending[idx][0].long_id for idx in idxs],
+                                    rollPairs=[[pair['Role'], pair['Filler']]
+                                               for pair in roll_pairs([results[idx] for idx in idxs])])
+        timer.seconds['annotate'] = time.perf_counter() - start
+        timer.observe()
+        self.logger.debug(f"Stage timings (ms): {timer.summary()}")
+        if parameters['recordTimings']:
+            rfb_view.metadata.set_additional_property('timings', timer.summary())
         return mmif
 
+    def _scrolling_report(self, pending: list, roll_of: dict, reused: dict, segments: dict, rolls: int,
+                          frame_tokens: dict, segment_tokens: list, timer: StageTimer) -> dict:
+        """
+        Reports the number of rolls and credits frames, and the model input tokens the frames took, from the token
+        counts of the tagging (`frame_tokens` by index in `pending` for frames tagged in full, and `segment_tokens` for
+        the inputs of frames tagged incrementally), along with the tokens tagging every frame in full would have taken.
+        Those are counted from the distinct words of the frames, which share most of them, and not by tokenizing every
+        frame again.
+        """
+        frames = [idx for idx in roll_of if idx not in reused]
+        tagged_tokens = sum(frame_tokens.get(idx, 0) for idx in frames) + sum(segment_tokens)
+        with timer.stage('tokenize'):
+            full_tokens = sum(word_input_lengths(rfb_model.tagger, ['credits'] * len(frames),
+                                                 [pending[idx][2] for idx in frames]))
+        self.logger.debug(f"Tagged {len(segments)} of {len(frames)} credits frames incrementally: "
+                          f"{tagged_tokens} of {full_tokens} input tokens")
+        report = {'rolls': rolls, 'frames': len(frames), 'incrementalFrames': len(segments),
+                  'taggedTokens': tagged_tokens, 'fullTokens': full_tokens,
+                  'avoidedTokens': full_tokens - tagged_tokens}
+        return report
+
+
+def prometheus_metrics() -> Response:
+    """
+    Reports per-stage latency histograms and document, pair and sequence length counters of this process in the
+    Prometheus text format.
+    """
+    return Response(response=expose_metrics(), status=200, mimetype='text/plain; version=0.0.4')
+
+
+def model_readiness() -> Response:
+    """
+    Reports whether the RFB model is loaded, along with load and warmup timings.
+    Responds with HTTP 200 once the model is in memory, and HTTP 503 before that, unless the model is loaded lazily
+    by the first request: nothing else would load it, so the app is ready to take that request.
+    """
+    status = rfb_model.status()
+    return Response(response=json.dumps(status), status=200 if status['loaded'] or status['lazy'] else 503,
+                    mimetype='application/json')
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("--port", action="store", default="5000", help="set port to listen")
     parser.add_argument("--production", action="store_true", help="run gunicorn server")
+    parser.add_argument("--model", action="store", default=DEFAULT_MODEL,
+                        help="HuggingFace model name or path to a local checkpoint of the RFB model")
+    parser.add_argument("--backend", action="store", default="pytorch", choices=BACKENDS,
+                        help="inference backend of the RFB model; `int8` runs the model with dynamically quantized "
+                             "int8 linear layers on CPU, `onnx` runs an ONNX export of the model with ONNX Runtime "
+                             "(requires `optimum[onnxruntime]`)")
+    parser.add_argument("--decoder", action="store", default="pipeline", choices=DECODERS,
+                        help="how model outputs are decoded into tags; `fast` tokenizes and decodes whole batches at "
+                             "once instead of using the post-processing of the HuggingFace pipeline, with the same "
+                             "results")
+    parser.add_argument("--onnx-dir", action="store", default=DEFAULT_ONNX_DIR,
+                        help="directory where ONNX exports of the model are cached")
+    parser.add_argument("--warmup", action="store_true",
+                        help="load the model and run a dummy sequence through it before accepting requests "
+                             "(otherwise the model is loaded on the first request); always done in production mode, "
+                             "where each worker is warmed up right after it is forked, unless `--lazy` is set")
+    parser.add_argument("--lazy", action="store_true",
+                        help="in production mode, load the model of each worker on its first request instead of "
+                             "warming up each worker after it is forked")
+    parser.add_argument("--preload", action="store_true",
+                        help="in production mode, load the model weights once in the main process before forking "
+                             "the workers, so that all workers share one copy of the weights (not available with the "
+                             "`onnx` backend)")
+    parser.add_argument("--workers", action="store", type=int, default=None,
+                        help="number of gunicorn worker processes in production mode (default: 2 * CPU cores + 1)")
+    parser.add_argument("--threads", action="store", type=int, default=None,
+                        help="number of intra-op threads the model uses in each process (default: one per core); "
+                             "with several workers, keep workers times threads at most the number of cores "
+                             "(see `python3 -m benchmarks.autotune`)")
+    parser.add_argument("--interop-threads", action="store", type=int, default=None,
+                        help="number of inter-op threads the model uses in each process (default: backend default)")
+    parser.add_argument("--micro-batch", action="store", type=int, default=0,
+                        help="maximum number of sequences in a batch shared by concurrent requests; sequences of all "
+                             "requests are queued and tagged together by a single inference thread, instead of each "
+                             "request running its own batches (0 to disable, then the `batchSize` and "
+                             "`maxBatchTokens` runtime parameters apply)")
+    parser.add_argument("--micro-batch-wait-ms", action="store", type=float, default=10.0,
+                        help="maximum time in milliseconds a queued sequence waits for others to share a batch with")
+    parser.add_argument("--micro-batch-tokens", action="store", type=int, default=4096,
+                        help="maximum number of subword tokens, counting padding, in a forward pass of a shared batch "
+                             "(0 for no limit)")
+    parser.add_argument("--cache-size", action="store", type=int, default=10000,
+                        help="maximum number of results kept in the in-memory result cache (0 to disable caching)")
+    parser.add_argument("--cache-dir", action="store", default=None,
+                        help="directory for a persistent on-disk result cache, shared across restarts")
 
     parsed_args = parser.parse_args()
 
+    warmup = parsed_args.warmup or (parsed_args.production and not parsed_args.lazy)
+    # a model left to load on the first request is reported as ready by /ready, as nothing else would load it
+    rfb_model.lazy = not warmup
+    rfb_model.configure(parsed_args.model, backend=parsed_args.backend, onnx_dir=parsed_args.onnx_dir,
+                        intra_op_threads=parsed_args.threads, inter_op_threads=parsed_args.interop_threads,
+                        decoder=parsed_args.decoder)
+
     # create the app instance
-    app = RoleFillerBinder()
+    cache = RFBCache(max_size=parsed_args.cache_size, cache_dir=parsed_args.cache_dir) \
+        if parsed_args.cache_size > 0 else None
+    queue = None
+    if parsed_args.micro_batch > 0:
+        queue_batcher = TokenBudgetBatcher(max_tokens=parsed_args.micro_batch_tokens or None)
+        queue = MicroBatcher(lambda inputs: tag_inputs(rfb_model.tagger, inputs, queue_batcher),
+                             max_batch_size=parsed_args.micro_batch, max_wait_ms=parsed_args.micro_batch_wait_ms)
+    app = RoleFillerBinder(cache=cache, queue=queue)
 
     http_app = Restifier(app, port=int(parsed_args.port))
+    http_app.flask_app.add_url_rule('/ready', 'ready', model_readiness)
+    http_app.flask_app.add_url_rule('/metrics', 'metrics', prometheus_metrics)
     # for running the application in production mode
     if parsed_args.production:
-        http_app.serve_production()
+        options = {}
+        if parsed_args.workers:
+            options['workers'] = parsed_args.workers
+        if parsed_args.preload:
+            rfb_model.preload()
+
+        def post_fork(server, worker):
+            rfb_model.apply_threads()
+            if warmup:
+                rfb_model.warmup()
+        options['post_fork'] = post_fork
+        http_app.serve_production(**options)
     # development mode
     else:
         app.logger.setLevel(logging.DEBUG)
+        if warmup:
+            rfb_model.warmup()
         http_app.run()
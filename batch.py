@@ -0,0 +1,247 @@
+"""
+Offline batch annotation of MMIF files with the RFB app, without the HTTP server.
+
+Each worker process loads its own copy of the model, and annotates `--files-per-worker` files at a time in concurrent
+threads, whose sequences are tagged together in shared batches (see `utils/microbatch.py`), so that MMIFs with only a
+few TextDocuments still make full batches. Outputs are written to a temporary file that is renamed once complete,
+and inputs whose output already exists are skipped, so an interrupted run resumes where it stopped when the same
+command is run again. Progress and throughput are reported as files complete.
+
+Usage:
+    python3 batch.py --input-dir path/to/mmifs --output-dir path/to/out [--workers 4] [--params batchSize=32]
+    python3 batch.py --manifest files.txt --output-dir path/to/out
+
+A manifest lists one input MMIF per line, optionally followed by a tab and the path of its output; inputs without
+one are written to `--output-dir` under their own file name.
+"""
+
+import argparse
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+from tqdm import tqdm
+
+from utils.model import BACKENDS, DECODERS, DEFAULT_MODEL, DEFAULT_ONNX_DIR
+
+logger = logging.getLogger(__name__)
+
+# the app instance of the worker process, set up by `init_worker`, or the error that prevented it
+_app = None
+_init_error = None
+
+
+def list_jobs(input_dir: Optional[str] = None, output_dir: Optional[str] = None, manifest: Optional[str] = None,
+              pattern: str = '*.mmif') -> List[Tuple[Path, Path]]:
+    """
+    Lists the (input, output) paths of the MMIFs to annotate.
+
+    Args:
+        input_dir (str): Directory searched recursively for input files matching `pattern`. Outputs keep their path
+            relative to it, under `output_dir`.
+        output_dir (str): Directory the outputs are written to.
+        manifest (str): File listing inputs instead of `input_dir`, one per line, each optionally followed by a tab
+            and the path of its output. Blank lines and lines starting with `#` are ignored.
+        pattern (str): Glob pattern of the input files in `input_dir`.
+
+    Returns:
+        List[Tuple[Path, Path]]: The input and output path of each file, in a stable order.
+    """
+    if manifest is not None:
+        jobs = []
+        with open(manifest) as f:
+            for line in f:
+                line = line.rstrip('\n')
+                if not line.strip() or line.startswith('#'):
+                    continue
+                input_path, _, output_path = line.partition('\t')
+                if not output_path:
+                    if output_dir is None:
+                        raise ValueError(f"No output path for `{input_path}` in the manifest, and no output directory")
+                    output_path = Path(output_dir) / Path(input_path).name
+                jobs.append((Path(input_path), Path(output_path)))
+        return jobs
+    if input_dir is None or output_dir is None:
+        raise ValueError("Either a manifest or both an input and an output directory are needed")
+    return [(path, Path(output_dir) / path.relative_to(input_dir)) for path in sorted(Path(input_dir).rglob(pattern))]
+
+
+def init_worker(model: str, backend: str, decoder: str, onnx_dir: str, threads: Optional[int], micro_batch: int,
+                micro_batch_tokens: int, cache_size: int) -> None:
+    """
+    Loads and warms up the model of the worker process, and creates its app instance. Errors are kept for
+    `annotate_files` to raise, as a pool would otherwise replace a worker whose initializer fails, endlessly.
+    """
+    global _app, _init_error
+    try:
+        from app import RoleFillerBinder
+        from utils.batching import TokenBudgetBatcher
+        from utils.cache import RFBCache
+        from utils.microbatch import MicroBatcher
+        from utils.model import rfb_model
+        from utils.rfb import tag_inputs
+
+        # a tagger already set in this process (e.g. a stand-in in tests) is kept
+        if not rfb_model.is_loaded:
+            rfb_model.configure(model, backend=backend, onnx_dir=onnx_dir, intra_op_threads=threads, decoder=decoder)
+            rfb_model.warmup()
+        batcher = TokenBudgetBatcher(max_tokens=micro_batch_tokens or None)
+        queue = MicroBatcher(lambda inputs: tag_inputs(rfb_model.tagger, inputs, batcher),
+                             max_batch_size=micro_batch)
+        _app = RoleFillerBinder(cache=RFBCache(max_size=cache_size) if cache_size > 0 else None, queue=queue)
+    except Exception as e:
+        logger.exception("Could not set up the worker")
+        _init_error = f"{type(e).__name__}: {e}"
+
+
+def annotate_file(input_path: Path, output_path: Path, parameters: dict) -> Optional[str]:
+    """Annotates one MMIF file and writes the output atomically. Returns an error message if it failed."""
+    try:
+        output = _app.annotate(input_path.read_text(), **parameters)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        partial_path = output_path.with_name(f'.{output_path.name}.partial')
+        partial_path.write_text(output)
+        os.replace(partial_path, output_path)
+        return None
+    except Exception as e:
+        logger.exception(f"Could not annotate `{input_path}`")
+        return f"{type(e).__name__}: {e}"
+
+
+def annotate_files(jobs: List[Tuple[Path, Path]], parameters: dict) -> Tuple[List[Tuple[Path, Optional[str]]], int]:
+    """
+    Annotates files concurrently in the worker process, so that their sequences share batches.
+
+    Returns:
+        Tuple[List[Tuple[Path, Optional[str]]], int]: The input path and error message (None on success) of each
+            file, and the number of TextDocuments processed.
+    """
+    from utils.metrics import DOCUMENTS
+
+    if _init_error is not None:
+        raise RuntimeError(f"The worker could not be set up: {_init_error}")
+    documents = DOCUMENTS.total()
+    with ThreadPoolExecutor(max_workers=len(jobs), thread_name_prefix='rfb-batch') as executor:
+        errors = list(executor.map(lambda job: annotate_file(*job, parameters), jobs))
+    return [(input_path, error) for (input_path, _), error in zip(jobs, errors)], int(DOCUMENTS.total() - documents)
+
+
+def run(jobs: List[Tuple[Path, Path]], worker_args: tuple, parameters: dict, workers: int = 1,
+        files_per_worker: int = 8, overwrite: bool = False, progress: bool = True) -> dict:
+    """
+    Annotates MMIF files in a pool of worker processes.
+
+    Args:
+        jobs (List[Tuple[Path, Path]]): The input and output path of each file, as returned by `list_jobs`.
+        worker_args (tuple): The arguments of `init_worker`.
+        parameters (dict): The runtime parameters of the app, as lists of strings (as `ClamsApp.annotate` takes them).
+        workers (int): Number of worker processes, each with its own model. With 1, files are annotated in process.
+        files_per_worker (int): Number of files each worker annotates at a time, sharing batches.
+        overwrite (bool): Annotate files again even if their output exists, instead of skipping them.
+        progress (bool): Show a progress bar with the throughput.
+
+    Returns:
+        dict: Numbers of annotated, failed and skipped files, of processed TextDocuments, the elapsed time and the
+            throughput, and the error message of each failed file.
+    """
+    todo = [job for job in jobs if overwrite or not job[1].exists()]
+    groups = [todo[start:start + files_per_worker] for start in range(0, len(todo), files_per_worker)]
+    report = {'annotated': 0, 'failed': 0, 'skipped': len(jobs) - len(todo), 'documents': 0, 'errors': {}}
+    start = time.perf_counter()
+    bar = tqdm(total=len(todo), unit='file', disable=not progress)
+
+    def record(group_result):
+        results, documents = group_result
+        report['documents'] += documents
+        for input_path, error in results:
+            if error is None:
+                report['annotated'] += 1
+            else:
+                report['failed'] += 1
+                report['errors'][str(input_path)] = error
+        bar.update(len(results))
+        bar.set_postfix(docs_per_s=f"{report['documents'] / (time.perf_counter() - start):.1f}",
+                        failed=report['failed'])
+
+    if not groups:
+        logger.info("All outputs exist already, nothing to annotate")
+    elif workers <= 1:
+        init_worker(*worker_args)
+        if _init_error is not None:
+            raise RuntimeError(f"Could not set up the app: {_init_error}")
+        for group in groups:
+            record(annotate_files(group, parameters))
+    else:
+        # spawned rather than forked, so that no worker inherits threads or model state from this process
+        ctx = multiprocessing.get_context('spawn')
+        with ctx.Pool(workers, initializer=init_worker, initargs=worker_args) as pool:
+            for group_result in pool.imap_unordered(_annotate_group, [(group, parameters) for group in groups]):
+                record(group_result)
+    bar.close()
+    report['seconds'] = time.perf_counter() - start
+    report['files_per_second'] = (report['annotated'] + report['failed']) / report['seconds']
+    report['documents_per_second'] = report['documents'] / report['seconds']
+    return report
+
+
+def _annotate_group(args):
+    return annotate_files(*args)
+
+
+def parse_parameters(value: str) -> dict:
+    return dict(pair.split('=', 1) for pair in value.split(',')) if value else {}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Annotates MMIF files with the RFB app, without the HTTP server.')
+    parser.add_argument('--input-dir', type=str, default=None,
+                        help='Directory of input MMIF files, searched recursively')
+    parser.add_argument('--manifest', type=str, default=None,
+                        help='File listing input MMIF files, one per line, each optionally followed by a tab and its '
+                             'output path (instead of --input-dir)')
+    parser.add_argument('--output-dir', type=str, default=None, help='Directory to write the output MMIF files to')
+    parser.add_argument('--pattern', type=str, default='*.mmif', help='Glob pattern of the input files in --input-dir')
+    parser.add_argument('--params', type=parse_parameters, default={},
+                        help='Comma-separated runtime parameters of the app, e.g. `batchSize=32,chyronFastPath=true`')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of worker processes, each loading its own model (1 to annotate in process); keep '
+                             'workers times --threads at most the number of cores')
+    parser.add_argument('--files-per-worker', type=int, default=8,
+                        help='Number of files a worker annotates at a time, whose sequences share batches')
+    parser.add_argument('--overwrite', action='store_true',
+                        help='Annotate files again even if their output exists (by default, they are skipped, so '
+                             'that an interrupted run resumes where it stopped)')
+    parser.add_argument('--model', type=str, default=DEFAULT_MODEL,
+                        help='HuggingFace model name or path to a local checkpoint of the RFB model')
+    parser.add_argument('--backend', type=str, default='pytorch', choices=BACKENDS, help='Inference backend')
+    parser.add_argument('--decoder', type=str, default='pipeline', choices=DECODERS,
+                        help='How model outputs are decoded into tags')
+    parser.add_argument('--onnx-dir', type=str, default=DEFAULT_ONNX_DIR,
+                        help='Directory where ONNX exports of the model are cached')
+    parser.add_argument('--threads', type=int, default=None,
+                        help='Number of intra-op threads of the model in each worker (default: one per core)')
+    parser.add_argument('--micro-batch', type=int, default=64,
+                        help='Maximum number of sequences in a batch shared by the files of a worker')
+    parser.add_argument('--micro-batch-tokens', type=int, default=4096,
+                        help='Maximum number of subword tokens, counting padding, in a shared batch (0 for no limit)')
+    parser.add_argument('--cache-size', type=int, default=10000,
+                        help='Maximum number of results kept in the result cache of each worker (0 to disable)')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    jobs = list_jobs(args.input_dir, args.output_dir, args.manifest, args.pattern)
+    worker_args = (args.model, args.backend, args.decoder, args.onnx_dir, args.threads, args.micro_batch,
+                   args.micro_batch_tokens, args.cache_size)
+    report = run(jobs, worker_args, {name: [value] for name, value in args.params.items()}, workers=args.workers,
+                 files_per_worker=args.files_per_worker, overwrite=args.overwrite)
+    print(f"{report['annotated']} files annotated, {report['failed']} failed, {report['skipped']} skipped (already "
+          f"done) in {report['seconds']:.1f} s: {report['files_per_second']:.2f} files/s, "
+          f"{report['documents_per_second']:.1f} TextDocuments/s")
+    for input_path, error in report['errors'].items():
+        print(f"failed: {input_path}: {error}", file=sys.stderr)
+    sys.exit(1 if report['failed'] else 0)
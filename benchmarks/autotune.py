@@ -0,0 +1,151 @@
+"""
+Sweep of worker process and thread counts for the current machine.
+
+For every (workers, threads) pair of the grid, starts `workers` processes that each load the model with `threads`
+intra-op threads (and one inter-op thread), then lets them tag a fixed corpus of requests drawn from
+`model_in_data/rfb_test.json`, as gunicorn workers would. Reports the throughput in sequences per second and the
+p50/p95/p99 latency of a request, and recommends the setting with the highest throughput among those whose p95
+latency is at most `--max-p95-ratio` times the lowest p95 latency of the sweep. A setting whose workers do not all
+load the model, or stop answering, within `--timeout` seconds is reported as failed and left out of the
+recommendation.
+
+Usage: python3 -m benchmarks.autotune [--workers 1,2,4] [--threads 1,2,4] [--backend pytorch] [--timeout 600]
+"""
+
+import argparse
+import multiprocessing
+import os
+import queue
+import sys
+import threading
+import time
+
+import numpy as np
+
+from tests.helpers import load_sequences
+from utils.model import BACKENDS, DEFAULT_MODEL
+
+
+def build_requests(count: int, size: int) -> list:
+    """Cuts the test split into `count` requests of `size` (scene types, OCR results), cycling through the split."""
+    sequences = load_sequences('test')
+    requests = []
+    for i in range(count):
+        chunk = [sequences[(i * size + j) % len(sequences)] for j in range(size)]
+        requests.append(([scene_type for scene_type, _ in chunk], [' '.join(tokens) for _, tokens in chunk]))
+    return requests
+
+
+def worker(model: str, backend: str, threads: int, tasks, latencies, ready, timeout: float) -> None:
+    """Loads the model, then tags requests from `tasks` until it gets None, reporting the latency of each."""
+    from utils.model import rfb_model
+    from utils.rfb import bind_role_fillers_batch
+
+    rfb_model.configure(model, backend=backend, intra_op_threads=threads, inter_op_threads=1)
+    rfb_model.warmup()
+    ready.wait(timeout)
+    while True:
+        task = tasks.get()
+        if task is None:
+            break
+        scene_types, ocr_results = task
+        start = time.perf_counter()
+        bind_role_fillers_batch(ocr_results, scene_types)
+        latencies.put(time.perf_counter() - start)
+
+
+def run(model: str, backend: str, workers: int, threads: int, requests: list, timeout: float) -> dict:
+    """
+    Tags all requests with `workers` processes of `threads` threads each, and returns throughput and latencies, or
+    the reason of the failure when a worker did not load its model or did not report a latency within `timeout`
+    seconds (e.g. because it crashed).
+    """
+    ctx = multiprocessing.get_context('spawn')
+    tasks, latencies = ctx.Queue(), ctx.Queue()
+    ready = ctx.Barrier(workers + 1)
+    for request in requests:
+        tasks.put(request)
+    for _ in range(workers):
+        tasks.put(None)
+    processes = [ctx.Process(target=worker, args=(model, backend, threads, tasks, latencies, ready, timeout))
+                 for _ in range(workers)]
+    for process in processes:
+        process.start()
+    stage = "loading the model"
+    try:
+        # time from the moment every worker has loaded its model
+        ready.wait(timeout)
+        stage = "tagging"
+        start = time.perf_counter()
+        results = [latencies.get(timeout=timeout) for _ in requests]
+        elapsed = time.perf_counter() - start
+    except (threading.BrokenBarrierError, queue.Empty):
+        exit_codes = [process.exitcode for process in processes]
+        for process in processes:
+            process.terminate()
+            process.join()
+        return {"workers": workers, "threads": threads,
+                "error": f"timed out after {timeout:g} s while {stage} (worker exit codes: {exit_codes})"}
+    for process in processes:
+        process.join()
+    results_ms = np.array(results) * 1000
+    return {
+        "workers": workers,
+        "threads": threads,
+        "throughput": sum(len(ocr_results) for _, ocr_results in requests) / elapsed,
+        "p50_ms": float(np.percentile(results_ms, 50)),
+        "p95_ms": float(np.percentile(results_ms, 95)),
+        "p99_ms": float(np.percentile(results_ms, 99)),
+    }
+
+
+def parse_counts(value: str) -> list:
+    return [int(count) for count in value.split(',')]
+
+
+if __name__ == '__main__':
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    default_counts = ','.join(str(2 ** i) for i in range(cores.bit_length()) if 2 ** i <= cores)
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=parse_counts, default=default_counts,
+                        help='Comma-separated worker counts to try (default: powers of 2 up to the number of cores)')
+    parser.add_argument('--threads', type=parse_counts, default=default_counts,
+                        help='Comma-separated intra-op thread counts per worker to try (default: powers of 2 up to '
+                             'the number of cores)')
+    parser.add_argument('--oversubscribe', action='store_true',
+                        help='Also try settings where workers times threads exceeds the number of cores')
+    parser.add_argument('--requests', type=int, default=60, help='Number of requests in the corpus')
+    parser.add_argument('--request-size', type=int, default=20, help='Number of sequences per request')
+    parser.add_argument('--model', type=str, default=DEFAULT_MODEL,
+                        help='HuggingFace model name or path to a local checkpoint')
+    parser.add_argument('--backend', type=str, default='pytorch', choices=BACKENDS, help='Inference backend')
+    parser.add_argument('--max-p95-ratio', type=float, default=2.0,
+                        help='Maximum p95 latency of the recommended setting, relative to the lowest p95 latency')
+    parser.add_argument('--timeout', type=float, default=600,
+                        help='Seconds to wait for the workers of a setting to load the model, and for each latency '
+                             'report, before the setting is reported as failed')
+    args = parser.parse_args()
+
+    requests = build_requests(args.requests, args.request_size)
+    print(f"{cores} cores, {len(requests)} requests of {args.request_size} sequences")
+    print(f"{'workers':>8} {'threads':>8} {'seq/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+    reports = []
+    for workers in args.workers:
+        for threads in args.threads:
+            if workers * threads > cores and not args.oversubscribe:
+                continue
+            report = run(args.model, args.backend, workers, threads, requests, args.timeout)
+            if 'error' in report:
+                print(f"{workers:>8} {threads:>8} failed: {report['error']}", flush=True)
+                continue
+            reports.append(report)
+            print(f"{workers:>8} {threads:>8} {report['throughput']:>8.1f} {report['p50_ms']:>8.1f} "
+                  f"{report['p95_ms']:>8.1f} {report['p99_ms']:>8.1f}", flush=True)
+
+    if not reports:
+        sys.exit("no setting completed the sweep")
+    best_p95 = min(report['p95_ms'] for report in reports)
+    best = max((report for report in reports if report['p95_ms'] <= args.max_p95_ratio * best_p95),
+               key=lambda report: report['throughput'])
+    print(f"recommended: --workers {best['workers']} --threads {best['threads']} --interop-threads 1 "
+          f"({best['throughput']:.1f} seq/s, p95 {best['p95_ms']:.1f} ms)")
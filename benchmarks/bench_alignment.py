@@ -0,0 +1,64 @@
+"""
+Benchmark of the TimePoint to TextDocument lookup of `_annotate`: asking every TimePoint for its aligned annotations
+(`get_all_aligned`) before checking its label, versus the alignment index, on a synthetic MMIF of many TimePoints.
+
+Usage: python3 -m benchmarks.bench_alignment [--timepoints 50000] [--repeat 3]
+"""
+
+import argparse
+import time
+
+from mmif import AnnotationTypes, DocumentTypes, Mmif
+
+from tests.helpers import generate_mmif
+from utils.alignment import get_annotations_of_type, index_aligned_text_documents
+
+LABELMAP = {'I': 'chyron', 'N': 'chyron', 'Y': 'chyron', 'C': 'credits', 'R': 'credits'}
+
+
+def build_mmif_json(timepoints: int, seed: int = 0) -> str:
+    """
+    Builds the JSON of a synthetic MMIF where about 70% of the TimePoints have a supported label, and 80% have OCR
+    text.
+    """
+    label_mix = {**{label: 0.14 for label in 'INYCR'}, **{label: 0.1 for label in 'BSO'}}
+    return generate_mmif(timepoints, label_mix, ocr_rate=0.8, seed=seed)
+
+
+def lookup_per_timepoint(mmif: Mmif) -> int:
+    """The lookup `_annotate` used to do: every TimePoint's aligned annotations, before checking its label."""
+    found = 0
+    for view in mmif.get_all_views_contain(AnnotationTypes.TimePoint):
+        for tp_ann in view.get_annotations(AnnotationTypes.TimePoint):
+            tp_label = tp_ann.get('label')
+            for aligned in tp_ann.get_all_aligned():
+                if aligned.at_type == DocumentTypes.TextDocument and tp_label in LABELMAP:
+                    found += 1
+    return found
+
+
+def lookup_indexed(mmif: Mmif) -> int:
+    """The lookup `_annotate` does now: label filter first, then the alignment index."""
+    tp_anns = [tp_ann for view in mmif.get_all_views_contain(AnnotationTypes.TimePoint)
+               for tp_ann in get_annotations_of_type(view, AnnotationTypes.TimePoint)
+               if tp_ann.get('label') in LABELMAP]
+    index = index_aligned_text_documents(tp_anns)
+    return sum(len(index.get(tp_ann.long_id, ())) for tp_ann in tp_anns)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--timepoints', type=int, default=50000, help='Number of TimePoints in the synthetic MMIF')
+    parser.add_argument('--repeat', type=int, default=3, help='Number of timing repetitions')
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    mmif = Mmif(build_mmif_json(args.timepoints), validate=False)
+    print(f"{args.timepoints} TimePoints, MMIF built and parsed in {time.perf_counter() - start:.2f} s")
+    for name, lookup in (("per TimePoint", lookup_per_timepoint), ("indexed", lookup_indexed)):
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            found = lookup(mmif)
+            timings.append(time.perf_counter() - start)
+        print(f"{name}: {min(timings) * 1000:.1f} ms ({found} TextDocuments to tag)")
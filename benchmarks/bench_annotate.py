@@ -0,0 +1,105 @@
+"""
+End-to-end benchmark of `RoleFillerBinder.annotate` on synthetic MMIFs (see `benchmarks.synthetic_mmif`).
+
+Runs a series of requests through the app, once with the real model and once with a stub tagger that tokenizes like
+the model but predicts fixed tags without a forward pass, so that the cost of the model can be told apart from the
+cost of the rest of the app (MMIF parsing, OCR cleaning, batching, parsing tags, CSV serialization). Reports the
+throughput in TextDocuments per second, the p50/p95/p99 latency of a request, and the peak memory of the process.
+Each tagger runs in a fresh process, so that their peak memory is measured separately.
+
+Runs offline: pass a locally saved checkpoint with `--model` (a hub name only works if it is already in the local
+HuggingFace cache).
+
+Usage: python3 -m benchmarks.bench_annotate --model path/to/checkpoint [--tagger model,stub] [--timepoints 300]
+"""
+
+import os
+
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+import argparse
+import multiprocessing
+import resource
+import time
+
+import numpy as np
+
+from tests.helpers import DEFAULT_LABEL_MIX, StubTagger, count_documents, generate_mmif, parse_label_mix, parse_range
+from utils.model import DECODERS, DEFAULT_MODEL
+
+TAGGERS = ("model", "stub")
+
+
+def run(tagger: str, model: str, decoder: str, requests: list, warmup: int, parameters: dict) -> dict:
+    """Runs each request through the app with the given tagger, and returns throughput, latencies and peak memory."""
+    from app import RoleFillerBinder
+    from utils.model import rfb_model
+
+    if tagger == "stub":
+        rfb_model.set_tagger(StubTagger(model))
+    else:
+        rfb_model.configure(model, decoder=decoder)
+        rfb_model.warmup()
+    app = RoleFillerBinder()
+    params = {name: [value] for name, value in parameters.items()}
+    for mmif_json in requests[:warmup]:
+        app.annotate(mmif_json, **params)
+    latencies = []
+    for mmif_json in requests:
+        start = time.perf_counter()
+        app.annotate(mmif_json, **params)
+        latencies.append(time.perf_counter() - start)
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "tagger": tagger,
+        "docs_per_second": sum(count_documents(mmif_json) for mmif_json in requests) / sum(latencies),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        # kilobytes on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def parse_parameters(value: str) -> dict:
+    return dict(pair.split('=', 1) for pair in value.split(',')) if value else {}
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', type=str, default=DEFAULT_MODEL,
+                        help='Path to a local checkpoint, or the name of a model in the local HuggingFace cache')
+    parser.add_argument('--decoder', type=str, default='pipeline', choices=DECODERS,
+                        help='Decoder of the model outputs, for the `model` tagger')
+    parser.add_argument('--tagger', type=lambda value: value.split(','), default=list(TAGGERS),
+                        help=f'Comma-separated taggers to run, among {", ".join(TAGGERS)}')
+    parser.add_argument('--requests', type=int, default=20, help='Number of timed requests')
+    parser.add_argument('--warmup', type=int, default=2, help='Number of untimed requests run first')
+    parser.add_argument('--timepoints', type=int, default=300, help='Number of TimePoints per request')
+    parser.add_argument('--labels', type=parse_label_mix, default=DEFAULT_LABEL_MIX,
+                        help='Relative weights of TimePoint labels, e.g. `I=3,N=1,Y=1,C=2,R=1,B=1,S=1`')
+    parser.add_argument('--chyron-words', type=parse_range, default=None,
+                        help='Range of the number of OCR words of chyrons, as MIN:MAX (default: as sampled)')
+    parser.add_argument('--credits-words', type=parse_range, default=None,
+                        help='Range of the number of OCR words of credits, as MIN:MAX (default: as sampled)')
+    parser.add_argument('--noise', type=float, default=0.05, help='Probability of OCR-like noise per word')
+    parser.add_argument('--run-length', type=float, default=1.0,
+                        help='Mean number of consecutive TimePoints of the same scene')
+    parser.add_argument('--params', type=parse_parameters, default={},
+                        help='Comma-separated runtime parameters of the app, e.g. `batchSize=32,recordTimings=true`')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+
+    word_ranges = {scene_type: word_range for scene_type, word_range in
+                   (('chyron', args.chyron_words), ('credits', args.credits_words)) if word_range}
+    requests = [generate_mmif(args.timepoints, args.labels, word_ranges, args.noise, run_length=args.run_length,
+                              seed=args.seed + i) for i in range(args.requests)]
+    documents = sum(count_documents(mmif_json) for mmif_json in requests)
+    print(f"{len(requests)} requests of {args.timepoints} TimePoints, {documents} TextDocuments to tag")
+    print(f"{'tagger':>8} {'docs/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'peak MB':>8}")
+    ctx = multiprocessing.get_context('spawn')
+    for tagger in args.tagger:
+        with ctx.Pool(1) as pool:
+            report = pool.apply(run, (tagger, args.model, args.decoder, requests, args.warmup, args.params))
+        print(f"{report['tagger']:>8} {report['docs_per_second']:>8.1f} {report['p50_ms']:>8.1f} "
+              f"{report['p95_ms']:>8.1f} {report['p99_ms']:>8.1f} {report['peak_rss_mb']:>8.1f}", flush=True)
@@ -0,0 +1,68 @@
+"""
+Evaluation of the rule-based chyron fast path (`chyronFastPath`) on the chyrons of a `model_in_data` split.
+
+Reports the share of chyrons the rules bind without the model, how often their role-filler pairs agree with those of
+the model and with the gold labels, and the time per chyron of the rules and of the model. The pairs of the rules and
+of the gold labels are respelled as the app does (see `respell_pairs`), as the model's tokenizer respaces punctuation
+("New.York" comes out as "New. York").
+
+The data set keeps no line breaks, so the OCR lines the rules work on are rebuilt from the gold labels: every gold
+span (and every run of untagged words) is taken as one line, as name and title are on separate lines on screen.
+
+Usage: python3 -m benchmarks.bench_chyron_rules [--split test] [--model path/to/checkpoint]
+"""
+
+import os
+
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+import argparse
+import json
+import time
+
+from tests.helpers import DATA_DIR, gold_spans
+from utils.chyron_rules import recognize_chyron
+from utils.model import DEFAULT_MODEL, rfb_model
+from utils.rfb import bind_role_fillers_batch, parse_sequence_tags, respell_pairs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--split', type=str, default='test', help='Split of `model_in_data` to evaluate on')
+    parser.add_argument('--model', type=str, default=DEFAULT_MODEL,
+                        help='Path to a local checkpoint, or the name of a model in the local HuggingFace cache')
+    args = parser.parse_args()
+
+    with open(DATA_DIR / f'rfb_{args.split}.json') as f:
+        rows = [row for row in map(json.loads, f) if row['tokens'][0] == 'chyron']
+    spans = [gold_spans(row['tokens'][1:], row['labels'][1:]) for row in rows]
+    lines = [[words for _, words in chyron_spans] for chyron_spans in spans]
+    gold = [parse_sequence_tags([(tag, " ".join(words)) for tag, words in chyron_spans if tag != "O"], 'chyron')
+            for chyron_spans in spans]
+
+    rfb_model.configure(args.model)
+    rfb_model.warmup()
+    gold = [respell_pairs(rfb_model.tagger, pairs) for pairs in gold]
+
+    start = time.perf_counter()
+    ruled = [recognize_chyron(chyron_lines) for chyron_lines in lines]
+    ruled = [respell_pairs(rfb_model.tagger, pairs) if pairs is not None else None for pairs in ruled]
+    rules_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    tagged = bind_role_fillers_batch([" ".join(row['tokens'][1:]) for row in rows], ['chyron'] * len(rows),
+                                     batch_size=1)
+    model_seconds = time.perf_counter() - start
+
+    covered = [idx for idx, pairs in enumerate(ruled) if pairs is not None]
+    print(f"{len(rows)} chyrons in the {args.split} split")
+    print(f"bound by rules (model skipped): {len(covered)} ({len(covered) / len(rows):.1%})")
+    if covered:
+        for name, reference in (("model", tagged), ("gold labels", gold)):
+            agree = sum(ruled[idx] == reference[idx] for idx in covered)
+            print(f"rules agree with the {name}: {agree} of {len(covered)} ({agree / len(covered):.1%})")
+        agree = sum(tagged[idx] == gold[idx] for idx in covered)
+        print(f"model agrees with the gold labels on the same chyrons: {agree} of {len(covered)} "
+              f"({agree / len(covered):.1%})")
+    print(f"rules: {rules_seconds / len(rows) * 1e6:.1f} µs per chyron, "
+          f"model: {model_seconds / len(rows) * 1e3:.2f} ms per chyron")
@@ -0,0 +1,58 @@
+"""
+Microbenchmarks for `clean_ocr` on realistic OCR text, compared with the original implementation.
+
+Documents are built from the `model_in_data` sequences: short chyrons, single credit cards, and long scrolling credit
+rolls (hundreds of lines, with the noise lines and merged words typical of OCR on moving text).
+
+Usage: python3 -m benchmarks.bench_clean_ocr [--rolls 50] [--repeat 5]
+"""
+
+import argparse
+import random
+import timeit
+
+from tests.helpers import CLEAN_OCR_NOISE, legacy_clean_ocr, load_sequences
+from utils.clean_ocr import clean_ocr, clean_ocr_batch
+
+
+def make_documents(scene_type: str, count: int, sequences_per_doc: int, seed: int = 0):
+    """Builds OCR-like documents by stacking `model_in_data` sequences of a scene type, a few words per line."""
+    rng = random.Random(seed)
+    sequences = [tokens for split in ('train', 'val', 'test') for scene, tokens in load_sequences(split)
+                 if scene == scene_type]
+    documents = []
+    for _ in range(count):
+        lines = []
+        for tokens in rng.choices(sequences, k=sequences_per_doc):
+            for start in range(0, len(tokens), 3):
+                line = ' '.join(tokens[start:start + 3])
+                if rng.random() < 0.2:
+                    line += rng.choice(CLEAN_OCR_NOISE)
+                lines.append(line)
+            if rng.random() < 0.3:
+                lines.append(rng.choice(['-', '&', '...', '|', '']))
+        documents.append('\n'.join(lines))
+    return documents
+
+
+def report(name: str, documents, repeat: int):
+    words = sum(len(document.split()) for document in documents)
+    legacy = min(timeit.repeat(lambda: [legacy_clean_ocr(d) for d in documents], number=1, repeat=repeat))
+    single = min(timeit.repeat(lambda: [clean_ocr(d) for d in documents], number=1, repeat=repeat))
+    batch = min(timeit.repeat(lambda: clean_ocr_batch(documents), number=1, repeat=repeat))
+    print(f"{name:<14}{len(documents):>6}{words / len(documents):>10.0f}"
+          f"{legacy / len(documents) * 1e6:>12.1f}{single / len(documents) * 1e6:>12.1f}"
+          f"{batch / len(documents) * 1e6:>12.1f}{legacy / batch:>9.2f}x")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rolls', type=int, default=50, help='Number of long credit rolls to clean')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of timing repetitions (best is reported)')
+    args = parser.parse_args()
+
+    print(f"{'documents':<14}{'count':>6}{'words/doc':>10}{'legacy µs':>12}{'clean µs':>12}{'batch µs':>12}"
+          f"{'speedup':>10}")
+    report('chyrons', make_documents('chyron', 2000, 1), args.repeat)
+    report('credit cards', make_documents('credits', 1000, 2), args.repeat)
+    report('credit rolls', make_documents('credits', args.rolls, 60), args.repeat)
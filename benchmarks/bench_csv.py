@@ -0,0 +1,68 @@
+"""
+Benchmark of CSV serialization of role-filler pairs: the streaming `csv` writer used by the app versus the pandas
+DataFrame round trip it replaced, per document, and the import time of the app server with and without pandas.
+
+Usage: python3 -m benchmarks.bench_csv [--documents 2000] [--repeat 5]
+"""
+
+import argparse
+import random
+import statistics
+import subprocess
+import sys
+import timeit
+
+import pandas as pd
+
+from tests.helpers import load_sequences
+from utils.csv_writer import role_filler_csv
+
+
+def make_pairs(count: int, seed: int = 0):
+    """Builds role-filler pair lists of realistic sizes, 1 to 3 pairs for chyrons and up to 30 for credits."""
+    rng = random.Random(seed)
+    words = [token for _, tokens in load_sequences('train') for token in tokens]
+    documents = []
+    for _ in range(count):
+        size = rng.randint(1, 3) if rng.random() < 0.7 else rng.randint(4, 30)
+        documents.append([{'Role': ' '.join(rng.sample(words, rng.randint(0, 3))),
+                           'Filler': ' '.join(rng.sample(words, rng.randint(1, 3)))} for _ in range(size)])
+    return documents
+
+
+def import_seconds(statement: str, repeat: int) -> float:
+    """Median time a fresh interpreter takes to run `statement`, excluding the interpreter startup."""
+    def run(code):
+        timer = f"import time; s = time.perf_counter(); {code}; print(time.perf_counter() - s)"
+        return float(subprocess.run([sys.executable, '-c', timer], capture_output=True, text=True,
+                                    check=True).stdout.split()[-1])
+    return statistics.median(run(statement) for _ in range(repeat))
+
+
+def imports_pandas(statement: str) -> bool:
+    """Returns True if running `statement` in a fresh interpreter imports pandas, directly or transitively."""
+    check = f"import sys; {statement}; print('pandas' in sys.modules)"
+    return subprocess.run([sys.executable, '-c', check], capture_output=True, text=True,
+                          check=True).stdout.split()[-1] == 'True'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--documents', type=int, default=2000, help='Number of documents to serialize')
+    parser.add_argument('--repeat', type=int, default=5, help='Number of timing repetitions')
+    args = parser.parse_args()
+
+    documents = make_pairs(args.documents)
+    with_pandas = min(timeit.repeat(lambda: [pd.DataFrame.from_dict(pairs).to_csv() for pairs in documents],
+                                    number=1, repeat=args.repeat))
+    with_csv = min(timeit.repeat(lambda: [role_filler_csv(pairs) for pairs in documents],
+                                 number=1, repeat=args.repeat))
+    print(f"serialization per document: pandas {with_pandas / len(documents) * 1e6:.1f} µs, "
+          f"csv {with_csv / len(documents) * 1e6:.1f} µs ({with_pandas / with_csv:.1f}x faster)")
+
+    app_import = import_seconds('import app', args.repeat)
+    pandas_import = import_seconds('import pandas', args.repeat)
+    print(f"server import time: {app_import:.2f} s (pandas alone: {pandas_import:.2f} s)")
+    if imports_pandas('import app'):
+        # e.g. `deepdiff`, a dependency of mmif-python, imports pandas when it is installed
+        print("note: pandas is still imported transitively by a dependency of the server")
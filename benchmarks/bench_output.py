@@ -0,0 +1,61 @@
+"""
+Benchmark of the output formats of the app (the `outputFormat` runtime parameter) on a long synthetic MMIF (see
+`benchmarks.synthetic_mmif`), with credits-heavy content by default.
+
+Annotates the same MMIF once per format, with the stub tagger of `tests.helpers` (the output format does
+not depend on the model), and reports for each output: its size, the number of annotations in the RFB view, the time
+to deserialize it and to serialize it again (as every downstream CLAMS app does), and the time a downstream consumer
+takes to read all the role-filler pairs back from the RFB view.
+
+Serializing with mmif-python takes time quadratic in the number of documents of the MMIF, so the default MMIF (500
+TimePoints, about 16 minutes of video sampled every two seconds) already takes minutes to run through.
+
+Usage: python3 -m benchmarks.bench_output [--timepoints 500] [--labels C=4,R=2,I=2,N=1,B=1] [--repeat 1]
+"""
+
+import os
+
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+import argparse
+import timeit
+
+from mmif import Mmif
+
+from tests.helpers import OUTPUT_FORMATS, StubTagger, generate_mmif, parse_label_mix, read_pairs
+from utils.model import DEFAULT_MODEL
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', type=str, default=DEFAULT_MODEL,
+                        help='Path to a local checkpoint, or the name of a model in the local HuggingFace cache, '
+                             'whose tokenizer the stub tagger uses')
+    parser.add_argument('--timepoints', type=int, default=500, help='Number of TimePoints of the MMIF')
+    parser.add_argument('--labels', type=parse_label_mix, default={'C': 4, 'R': 2, 'I': 2, 'N': 1, 'B': 1},
+                        help='Relative weights of TimePoint labels')
+    parser.add_argument('--repeat', type=int, default=1, help='Number of timing repetitions')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+
+    from app import RoleFillerBinder
+    from utils.model import rfb_model
+
+    mmif_json = generate_mmif(args.timepoints, args.labels, seed=args.seed)
+    rfb_model.set_tagger(StubTagger(args.model))
+    app = RoleFillerBinder()
+    print(f"input: {args.timepoints} TimePoints, {len(mmif_json) / 1e6:.1f} MB")
+    print(f"{'format':>12} {'MB':>7} {'annotations':>12} {'load s':>7} {'dump s':>7} {'read s':>7} {'pairs':>7}")
+    pairs = None
+    for output_format in OUTPUT_FORMATS:
+        output = app.annotate(mmif_json, outputFormat=[output_format])
+        mmif = Mmif(output)
+        read = read_pairs(mmif, output_format)
+        # all formats hold the same pairs
+        assert pairs is None or sorted(read) == pairs
+        pairs = sorted(read)
+        load_seconds = min(timeit.repeat(lambda: Mmif(output), number=1, repeat=args.repeat))
+        dump_seconds = min(timeit.repeat(lambda: mmif.serialize(sanitize=True), number=1, repeat=args.repeat))
+        read_seconds = min(timeit.repeat(lambda: read_pairs(mmif, output_format), number=1, repeat=args.repeat))
+        num_annotations = len(mmif.views.get_last_contentful_view().annotations)
+        print(f"{output_format:>12} {len(output.encode('utf-8')) / 1e6:>7.2f} {num_annotations:>12} "
+              f"{load_seconds:>7.2f} {dump_seconds:>7.2f} {read_seconds:>7.3f} {len(read):>7}", flush=True)
@@ -0,0 +1,81 @@
+"""
+Benchmark of the incremental tagging of scrolling credit rolls (the `scrollingCredits` runtime parameter) on a
+synthetic MMIF of scrolling credits (see `benchmarks.synthetic_mmif`).
+
+Annotates the same MMIF with every frame tagged in full, then with only the newly visible lines of each frame tagged,
+for each number of context lines, and reports the model input tokens and the time of the annotation (serialization
+excluded), with the share of the distinct role-filler pairs of full tagging that are found incrementally. Recall is
+only meaningful with a trained checkpoint, as the predictions of an untrained one change with any change of context.
+
+Usage: python3 -m benchmarks.bench_scrolling --model path/to/checkpoint [--tagger stub] [--scroll-lines 2]
+    [--context 1,2,4]
+"""
+
+import os
+
+os.environ.setdefault("HF_HUB_OFFLINE", "1")
+
+import argparse
+import json
+
+from mmif import Mmif
+
+from benchmarks.bench_annotate import TAGGERS
+from tests.helpers import StubTagger, generate_mmif, parse_label_mix, parse_range, read_pairs
+from utils.model import DEFAULT_MODEL
+
+
+def annotate(app, mmif_json: str, **parameters) -> tuple:
+    """Returns the distinct (role, filler) pairs of the output, its `scrollingCredits` report and the annotation
+    time in milliseconds."""
+    output = Mmif(app.annotate(mmif_json, recordTimings=['true'], **parameters))
+    view = output.views.get_last_contentful_view()
+    metadata = json.loads(view.metadata.serialize())
+    return ({(role, filler) for _, role, filler in read_pairs(output, 'csv')}, metadata.get('scrollingCredits'),
+            metadata['timings']['annotate'])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', type=str, default=DEFAULT_MODEL,
+                        help='Path to a local checkpoint, or the name of a model in the local HuggingFace cache')
+    parser.add_argument('--tagger', type=str, default='model', choices=TAGGERS,
+                        help='Tagger to run; `stub` only tokenizes, so pairs are not comparable between modes')
+    parser.add_argument('--timepoints', type=int, default=300, help='Number of TimePoints of the MMIF')
+    parser.add_argument('--labels', type=parse_label_mix, default={'C': 3, 'R': 1, 'B': 1},
+                        help='Relative weights of TimePoint labels')
+    parser.add_argument('--credits-words', type=parse_range, default=(60, 80),
+                        help='Range of the number of OCR words of a credits frame, as MIN:MAX')
+    parser.add_argument('--run-length', type=float, default=10.0,
+                        help='Mean number of consecutive TimePoints of the same scene')
+    parser.add_argument('--scroll-lines', type=int, default=2,
+                        help='Number of lines credits scroll by from one TimePoint to the next')
+    parser.add_argument('--noise', type=float, default=0.05, help='Probability of OCR-like noise per word')
+    parser.add_argument('--context', type=lambda value: [int(v) for v in value.split(',')], default=[1, 2, 4],
+                        help='Comma-separated numbers of context lines to run the incremental mode with')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+
+    from app import RoleFillerBinder
+    from utils.model import rfb_model
+
+    mmif_json = generate_mmif(args.timepoints, args.labels, {'credits': args.credits_words}, args.noise,
+                              run_length=args.run_length, scroll_lines=args.scroll_lines, seed=args.seed)
+    if args.tagger == 'stub':
+        rfb_model.set_tagger(StubTagger(args.model))
+    else:
+        rfb_model.configure(args.model)
+        rfb_model.warmup()
+    app = RoleFillerBinder()
+    full_pairs, _, full_ms = annotate(app, mmif_json)
+    rows = []
+    for context in args.context:
+        pairs, report, ms = annotate(app, mmif_json, scrollingCredits=['true'], scrollContext=[str(context)])
+        recall = len(pairs & full_pairs) / len(full_pairs) if full_pairs else 1.0
+        rows.append((f'context={context}', report, ms, pairs, recall))
+    print(f"credits frames: {rows[0][1]['frames']}, rolls: {rows[0][1]['rolls']}")
+    print(f"{'mode':>14} {'tokens':>8} {'avoided':>8} {'ms':>9} {'pairs':>6} {'recall':>7}")
+    print(f"{'full':>14} {rows[0][1]['fullTokens']:>8} {0:>8.1%} {full_ms:>9.1f} {len(full_pairs):>6} {1:>7.3f}")
+    for mode, report, ms, pairs, recall in rows:
+        print(f"{mode:>14} {report['taggedTokens']:>8} {report['avoidedTokens'] / report['fullTokens']:>8.1%} "
+              f"{ms:>9.1f} {len(pairs):>6} {recall:>7.3f}")
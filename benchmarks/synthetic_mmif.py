@@ -0,0 +1,41 @@
+"""
+Generator of synthetic MMIF files for benchmarking, shaped like the output of SWT (labeled TimePoints) followed by an
+OCR app (TextDocuments aligned to TimePoints).
+
+OCR text is sampled from the sequences of `model_in_data/*.json` matching the scene type of the TimePoint label, and
+can be stretched to a word count range, broken into lines and mixed with OCR-like noise. Consecutive TimePoints come
+in runs of the same label and near-identical text, as frames sampled from one scene do.
+
+The JSON is written directly rather than through the MMIF API, which gets slow for tens of thousands of annotations.
+The generator itself (`generate_mmif`) is in `tests.helpers`, as the tests use it too.
+
+Usage: python3 -m benchmarks.synthetic_mmif --timepoints 1000 [--labels I=3,N=1,Y=1,C=2,R=1,B=1,S=1] > out.mmif
+"""
+
+import argparse
+
+from tests.helpers import DEFAULT_LABEL_MIX, generate_mmif, parse_label_mix, parse_range
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--timepoints', type=int, default=1000, help='Number of TimePoints')
+    parser.add_argument('--labels', type=parse_label_mix, default=DEFAULT_LABEL_MIX,
+                        help='Relative weights of TimePoint labels, e.g. `I=3,N=1,Y=1,C=2,R=1,B=1,S=1`')
+    parser.add_argument('--chyron-words', type=parse_range, default=None,
+                        help='Range of the number of OCR words of chyrons, as MIN:MAX (default: as sampled)')
+    parser.add_argument('--credits-words', type=parse_range, default=None,
+                        help='Range of the number of OCR words of credits, as MIN:MAX (default: as sampled)')
+    parser.add_argument('--noise', type=float, default=0.05, help='Probability of OCR-like noise per word')
+    parser.add_argument('--ocr-rate', type=float, default=0.9, help='Share of TimePoints with OCR text')
+    parser.add_argument('--run-length', type=float, default=1.0,
+                        help='Mean number of consecutive TimePoints of the same scene')
+    parser.add_argument('--scroll-lines', type=int, default=0,
+                        help='Number of lines runs of credits scroll by from one TimePoint to the next')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed')
+    args = parser.parse_args()
+
+    word_ranges = {scene_type: word_range for scene_type, word_range in
+                   (('chyron', args.chyron_words), ('credits', args.credits_words)) if word_range}
+    print(generate_mmif(args.timepoints, args.labels, word_ranges, args.noise, args.ocr_rate, args.run_length,
+                        args.scroll_lines, args.seed))
@@ -0,0 +1,118 @@
+"""
+Measurement of the memory of gunicorn workers in production mode, with the model loaded by each worker on its first
+request versus preloaded once in the main process before the fork (`--preload`).
+
+For each worker, reports the unique set size (USS, memory no other process shares, i.e. what each extra worker
+costs), the proportional set size (PSS, shared memory split evenly between the processes sharing it) and the resident
+set size (RSS). Linux only, as it reads `/proc/<pid>/smaps_rollup`.
+
+Usage: python3 -m benchmarks.worker_memory [--workers 4] [--model clamsproject/bert-base-cased-ner-rfb]
+"""
+
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from mmif import AnnotationTypes, Document, DocumentTypes, Mmif
+
+from tests.helpers import load_sequences
+from utils.model import DEFAULT_MODEL
+
+APP_DIR = Path(__file__).parent.parent
+
+
+def build_mmif(count: int = 20) -> str:
+    """Builds a small MMIF of labeled TimePoints aligned with OCR TextDocuments from the test split."""
+    mmif = Mmif({"metadata": {"mmif": "http://mmif.clams.ai/1.0.0"}, "documents": [], "views": []})
+    mmif.add_document(Document({"@type": DocumentTypes.VideoDocument,
+                                "properties": {"id": "d1", "mime": "video/mp4", "location": "file:///video.mp4"}}))
+    swt_view = mmif.new_view()
+    swt_view.metadata.app = "http://apps.clams.ai/swt-detection/v1"
+    swt_view.new_contain(AnnotationTypes.TimePoint, document="d1")
+    ocr_view = mmif.new_view()
+    ocr_view.metadata.app = "http://apps.clams.ai/doctr-wrapper/v1"
+    ocr_view.new_contain(DocumentTypes.TextDocument)
+    ocr_view.new_contain(AnnotationTypes.Alignment)
+    for i, (scene_type, tokens) in enumerate(load_sequences('test')[:count]):
+        tp = swt_view.new_annotation(AnnotationTypes.TimePoint, timePoint=i * 1000,
+                                     label="C" if scene_type == "credits" else "I")
+        td = ocr_view.new_textdocument(text=" ".join(tokens))
+        ocr_view.new_annotation(AnnotationTypes.Alignment, source=tp.long_id, target=td.long_id)
+    return mmif.serialize()
+
+
+def memory_mb(pid: int) -> dict:
+    """Returns the USS, PSS and RSS of a process in MB."""
+    fields = {}
+    with open(f"/proc/{pid}/smaps_rollup") as smaps:
+        for line in smaps:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                fields[parts[0].rstrip(":")] = int(parts[1]) / 1024
+    return {"uss": fields["Private_Clean"] + fields["Private_Dirty"], "pss": fields["Pss"], "rss": fields["Rss"]}
+
+
+def child_pids(pid: int) -> list:
+    """Returns the pids of the direct children of a process."""
+    with open(f"/proc/{pid}/task/{pid}/children") as children:
+        return [int(child) for child in children.read().split()]
+
+
+def measure(workers: int, preload: bool, model: str, requests: int) -> list:
+    """Starts the app in production mode, sends requests to it concurrently, and returns the memory of each worker."""
+    with socket.socket() as sock:
+        sock.bind(("localhost", 0))
+        port = sock.getsockname()[1]
+    cmd = [sys.executable, "app.py", "--production", "--port", str(port), "--workers", str(workers),
+           "--model", model] + (["--preload"] if preload else [])
+    server = subprocess.Popen(cmd, cwd=APP_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        url = f"http://localhost:{port}"
+        while True:
+            if server.poll() is not None:
+                raise RuntimeError(f"The app exited with status {server.returncode}: {' '.join(cmd)}")
+            try:
+                urllib.request.urlopen(f"{url}/ready")
+                break
+            except urllib.error.HTTPError:
+                # 503 until the model is loaded, which is fine, the server is up
+                break
+            except urllib.error.URLError:
+                time.sleep(0.5)
+        body = build_mmif().encode("utf-8")
+        # concurrent requests, so that every worker gets some and loads the model if not preloaded
+        with ThreadPoolExecutor(max_workers=requests) as pool:
+            list(pool.map(lambda _: urllib.request.urlopen(urllib.request.Request(url, data=body, method="POST"))
+                          .read(), range(requests)))
+        return [memory_mb(pid) for pid in child_pids(server.pid)]
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=4, help='Number of gunicorn workers')
+    parser.add_argument('--model', type=str, default=DEFAULT_MODEL,
+                        help='HuggingFace model name or path to a local checkpoint')
+    parser.add_argument('--requests', type=int, default=0,
+                        help='Number of concurrent requests to send (default: 4 per worker)')
+    args = parser.parse_args()
+
+    for preload in (False, True):
+        memory = measure(args.workers, preload, args.model, args.requests or 4 * args.workers)
+        summary = {key: statistics.mean(worker[key] for worker in memory) for key in ("uss", "pss", "rss")}
+        print(f"{'preloaded' if preload else 'per-worker'} model, {len(memory)} workers: "
+              f"unique {summary['uss']:.0f} MB, proportional {summary['pss']:.0f} MB, "
+              f"resident {summary['rss']:.0f} MB per worker (mean); "
+              f"total unique {sum(worker['uss'] for worker in memory):.0f} MB")
+    sys.stdout.flush()
+    os._exit(0)
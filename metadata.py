@@ -47,6 +47,109 @@ def appmetadata() -> AppMetadata:
     out_al.add_description(
         'Alignment anchoring new RFB TextDocument to the original OCR TextDocument.'
     )
+    out_ann = metadata.add_output(AnnotationTypes.Annotation)
+    out_ann.add_description('With `outputFormat=annotations` (instead of the TextDocuments and Alignments): for each '
+                            'OCR TextDocument with role-filler pairs, an annotation anchored to it by its `document` '
+                            'property, holding the pairs as a list of [role, filler] lists in its `pairs` property. '
+                            'With `scrollingCredits`, the annotations of credits frames also hold the number of their '
+                            'roll in a `roll` property.')
+    out_tf = metadata.add_output(AnnotationTypes.TimeFrame, label='credits')
+    out_tf.add_description('With `scrollingCredits`, whatever the output format: for each scrolling credit roll, a '
+                           'time frame over the TimePoints of its frames (`targets`), holding the number of the roll '
+                           'in its `roll` property, the OCR TextDocuments of the frames in its `documents` property, '
+                           'and the distinct role-filler pairs of the roll as a list of [role, filler] lists in its '
+                           '`rollPairs` property. It is not anchored to any TextDocument, so the pairs of the frames '
+                           'are not counted twice.')
+
+    # runtime parameters
+    metadata.add_parameter(
+        name='batchSize', type='integer', default=16,
+        description='Maximum number of OCR text sequences to pass through the RFB model at once. All eligible '
+                    'TextDocuments in the input MMIF are collected first, sorted by length and then tagged in '
+                    'batches. Larger batches improve throughput at the cost of memory. Not used when the app is started '
+                    'with `--micro-batch`, as batches are then shared between concurrent requests.'
+    )
+    metadata.add_parameter(
+        name='maxBatchTokens', type='integer', default=4096,
+        description='Maximum number of subword tokens in a batch, counting padding (number of sequences times the '
+                    'longest sequence of the batch). Keeps batches of long credit rolls small and batches of short '
+                    'chyrons large. 0 means no token limit, only `batchSize` applies.'
+    )
+    metadata.add_parameter(
+        name='windowSize', type='integer', default=0,
+        description='Maximum number of subword tokens in a single model input. OCR text sequences longer than this '
+                    '(typically long scrolling credits) are split into overlapping windows, each prefixed by the '
+                    'scene type, which are tagged in the same batches as other sequences and stitched back together. '
+                    '0 means the maximum input length of the model (512 for BERT).'
+    )
+    metadata.add_parameter(
+        name='windowOverlap', type='integer', default=64,
+        description='Maximum number of subword tokens shared by two consecutive windows of a long sequence (the '
+                    'window stride is `windowSize` minus this overlap). Predictions in the overlap are taken from '
+                    'the window in which the words are farther from the edge. Only used for sequences longer than '
+                    '`windowSize`.'
+    )
+    metadata.add_parameter(
+        name='skipNearDuplicates', type='boolean', default=False,
+        description='When true, within a run of consecutive TimePoints with the same label, frames whose cleaned OCR '
+                    'text is a near-duplicate of the first frame of the run are not tagged again. Instead, they reuse '
+                    'the role-filler pairs of that first frame. The number of skipped frames is recorded in the view '
+                    'metadata as `skippedNearDuplicates`.'
+    )
+    metadata.add_parameter(
+        name='nearDuplicateThreshold', type='number', default=0.9,
+        description='Minimum similarity ratio (from 0 to 1, based on matching character blocks) between the cleaned '
+                    'OCR text of two frames for one to count as a near-duplicate of the other. Only used when '
+                    '`skipNearDuplicates` is true.'
+    )
+    metadata.add_parameter(
+        name='scrollingCredits', type='boolean', default=False,
+        description='When true, consecutive credits TimePoints (`C` and `R`) are handled as a scrolling credit roll. '
+                    'The OCR lines of each frame are aligned with those of the previous frame, and only the newly '
+                    'visible lines are tagged, with `scrollContext` lines of context around them, instead of the '
+                    'whole frame; the pairs of the lines a frame shares with the previous one are carried over from '
+                    'that frame. Each roll also gets a TimeFrame with the TextDocuments of its frames and its '
+                    'deduplicated role-filler pairs. The number of rolls, of incrementally tagged frames and of model '
+                    'input tokens (with the number of tokens avoided compared with tagging every frame in full) are '
+                    'recorded in the view metadata as `scrollingCredits`.'
+    )
+    metadata.add_parameter(
+        name='scrollContext', type='integer', default=2,
+        description='Number of lines above and below the newly visible lines of a scrolling credit roll frame that '
+                    'are tagged with them, so that a filler is bound to its role in a line already seen. Only used '
+                    'when `scrollingCredits` is true.'
+    )
+    metadata.add_parameter(
+        name='chyronFastPath', type='boolean', default=False,
+        description='When true, chyrons whose OCR text is a name on one line and a title or affiliation on the next '
+                    'are bound by rules, without running the model. Chyrons the rules are not confident about still '
+                    'go through the model. The number of TextDocuments bound by rules is recorded in the view '
+                    'metadata as `fastPathDocuments`.'
+    )
+    metadata.add_parameter(
+        name='outputFormat', type='string', choices=['csv', 'annotations', 'document'], default='csv',
+        description='How role-filler pairs are recorded. `csv`: for each OCR TextDocument with pairs, a TextDocument '
+                    'holding them as CSV, aligned to it by an Alignment. `annotations`: for each OCR TextDocument '
+                    'with pairs, an Annotation with the TextDocument as `document` property and the pairs as a list '
+                    'of [role, filler] lists in its `pairs` property. '
+                    '`document`: a single TextDocument holding all the pairs of the MMIF as CSV, with the OCR '
+                    'TextDocument of each pair in a `Document` column.'
+    )
+    metadata.add_parameter(
+        name='incremental', type='boolean', default=False,
+        description='When true, TextDocuments already processed by an earlier view of this app in the input MMIF, '
+                    'with the same app version and the same parameters (apart from batching and reporting ones), are '
+                    'not processed again. The new view only holds the results of the other TextDocuments, and lists '
+                    'the earlier views in its metadata as `previousViews`, along with the number of skipped '
+                    'TextDocuments as `skippedBoundDocuments`. When there is nothing new to process, no view is '
+                    'added.'
+    )
+    metadata.add_parameter(
+        name='recordTimings', type='boolean', default=False,
+        description='When true, the time spent in each processing stage of the request (MMIF parsing, `clean_ocr`, '
+                    'tokenization, model forward, tag parsing, CSV serialization and the whole annotation), in '
+                    'milliseconds, is recorded in the view metadata as `timings`.'
+    )
 
     return metadata
 
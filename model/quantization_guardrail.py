@@ -0,0 +1,124 @@
+"""
+Accuracy guardrail for the dynamic int8 quantized inference mode (`--backend int8` of the app).
+
+Runs the test split through the full-precision model and through its dynamically quantized version, and reports for
+each the seqeval scores (using the same metric setup as `run_ner.py`), the per-sequence latency and the resident
+memory. Each model is evaluated in a fresh process, so that memory figures do not interfere.
+
+Exits with a non-zero status if the F1 of the quantized model is more than `--max_f1_drop` below the F1 of the
+full-precision model.
+
+Usage: python3 quantization_guardrail.py --test_file ../model_in_data/rfb_test.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+import evaluate
+import numpy as np
+import torch
+from transformers import AutoModelForTokenClassification, AutoTokenizer
+
+from run_ner import build_compute_metrics
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from utils.model import DEFAULT_MODEL, quantize_dynamic_int8  # noqa: E402
+
+
+def current_rss_mb() -> float:
+    """
+    Returns the resident memory of the current process in MB, or its peak resident memory where the current value
+    is not available (non-Linux systems).
+    """
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+
+
+def evaluate_model(model_name_or_path: str, test_file: str, quantized: bool, threads: int) -> dict:
+    """
+    Tags every sequence of `test_file` one at a time and scores the predictions against the gold labels.
+    """
+    if threads:
+        torch.set_num_threads(threads)
+    rss_start = current_rss_mb()
+    tokenizer = AutoTokenizer.from_pretrained(model_name_or_path)
+    model = AutoModelForTokenClassification.from_pretrained(model_name_or_path).eval()
+    if quantized:
+        model = quantize_dynamic_int8(model)
+    rss_loaded = current_rss_mb()
+    label_list = [model.config.id2label[i] for i in range(model.config.num_labels)]
+    label_to_id = {label: i for i, label in enumerate(label_list)}
+
+    with open(test_file) as f:
+        rows = [json.loads(line) for line in f]
+    logits, labels, latencies = [], [], []
+    with torch.inference_mode():
+        # one untimed pass, so that one-time costs do not skew the latency of the first sequence
+        model(**tokenizer(rows[0]['tokens'], is_split_into_words=True, truncation=True, return_tensors='pt'))
+        for row in rows:
+            encoded = tokenizer(row['tokens'], is_split_into_words=True, truncation=True, return_tensors='pt')
+            start = time.perf_counter()
+            logits.append(model(**encoded).logits[0].numpy())
+            latencies.append(time.perf_counter() - start)
+            # label only the first subword of each word, as `run_ner.py` does
+            label_ids = []
+            previous_word_idx = None
+            for word_idx in encoded.word_ids(batch_index=0):
+                if word_idx is None or word_idx == previous_word_idx:
+                    label_ids.append(-100)
+                else:
+                    label_ids.append(label_to_id[row['labels'][word_idx]])
+                previous_word_idx = word_idx
+            labels.append(label_ids)
+
+    max_len = max(len(label_ids) for label_ids in labels)
+    padded_logits = np.zeros((len(rows), max_len, len(label_list)), dtype=np.float32)
+    padded_labels = np.full((len(rows), max_len), -100)
+    for i, (seq_logits, label_ids) in enumerate(zip(logits, labels)):
+        padded_logits[i, :len(label_ids)] = seq_logits
+        padded_labels[i, :len(label_ids)] = label_ids
+    compute_metrics = build_compute_metrics(evaluate.load("seqeval"), label_list)
+    metrics = compute_metrics((padded_logits, padded_labels))
+
+    latencies_ms = np.array(latencies) * 1000
+    metrics.update({
+        "latency_mean_ms": float(latencies_ms.mean()),
+        "latency_p50_ms": float(np.percentile(latencies_ms, 50)),
+        "latency_p95_ms": float(np.percentile(latencies_ms, 95)),
+        "model_rss_mb": rss_loaded - rss_start,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10,
+    })
+    return metrics
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', type=str, default=DEFAULT_MODEL,
+                        help='HuggingFace model name or path to a local checkpoint')
+    parser.add_argument('--test_file', type=str, default='../model_in_data/rfb_test.json',
+                        help='Path to the line-JSON test split')
+    parser.add_argument('--max_f1_drop', type=float, default=0.01,
+                        help='Maximum allowed drop of F1 (absolute, from 0 to 1) of the quantized model')
+    parser.add_argument('--threads', type=int, default=0,
+                        help='Number of torch threads to use (0 to keep the torch default)')
+    args = parser.parse_args()
+
+    report = {}
+    ctx = multiprocessing.get_context('spawn')
+    for name, quantized in (('fp32', False), ('int8', True)):
+        with ctx.Pool(1) as pool:
+            report[name] = pool.apply(evaluate_model, (args.model, args.test_file, quantized, args.threads))
+    print(json.dumps(report, indent=2))
+
+    f1_drop = report['fp32']['f1'] - report['int8']['f1']
+    print(f"F1 drop of the quantized model: {f1_drop:.4f} (allowed: {args.max_f1_drop:.4f})")
+    if f1_drop > args.max_f1_drop:
+        sys.exit(1)
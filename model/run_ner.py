@@ -1,17 +1,23 @@
 #!/usr/bin/env python
 # coding=utf-8
 
+import copy
 import logging
 import os
+import re
 import sys
+import time
 import warnings
 from dataclasses import dataclass, field
-from typing import Optional
+from typing import Iterator, List, Optional, Sequence
 
 import datasets
 import evaluate
 import numpy as np
+import torch
+import torch.nn.functional as F
 from datasets import ClassLabel, load_dataset
+from torch.utils.data import DataLoader, Sampler
 
 import transformers
 from transformers import (
@@ -23,6 +29,7 @@ from transformers import (
     PretrainedConfig,
     PreTrainedTokenizerFast,
     Trainer,
+    TrainerCallback,
     TrainingArguments,
     set_seed,
 )
@@ -83,15 +90,15 @@ class DataTrainingArguments:
         default=None, metadata={"help": "The name of the dataset to use (via the datasets library)."}
     )
     train_file: Optional[str] = field(
-        default=None, metadata={"help": "The input training data file (a csv or JSON file)."}
+        default=None, metadata={"help": "The input training data file (a csv, JSON or parquet file)."}
     )
     valid_file: Optional[str] = field(
         default=None,
-        metadata={"help": "An optional input evaluation data file to evaluate on (a csv or JSON file)."},
+        metadata={"help": "An optional input evaluation data file to evaluate on (a csv, JSON or parquet file)."},
     )
     test_file: Optional[str] = field(
         default=None,
-        metadata={"help": "An optional input test data file to predict on (a csv or JSON file)."},
+        metadata={"help": "An optional input test data file to predict on (a csv, JSON or parquet file)."},
     )
     text_column_name: Optional[str] = field(
         default=None, metadata={"help": "The column name of text to input in the file (a csv or JSON file)."}
@@ -165,6 +172,16 @@ class DataTrainingArguments:
         default=False,
         metadata={"help": "Whether to return all the entity levels during evaluation or just the overall ones."},
     )
+    max_tokens_per_batch: Optional[int] = field(
+        default=None,
+        metadata={
+            "help": (
+                "If set, build training batches of sequences of similar length holding up to this many tokens, "
+                "padding included, instead of batches of `per_device_train_batch_size` sequences. Requires dynamic "
+                "padding (`pad_to_max_length` false)."
+            )
+        },
+    )
 
     def __post_init__(self):
         if self.dataset_name is None and self.train_file is None and self.valid_file is None:
@@ -172,24 +189,328 @@ class DataTrainingArguments:
         else:
             if self.train_file is not None:
                 extension = self.train_file.split(".")[-1]
-                assert extension in ["csv", "json"], "`train_file` should be a csv or a json file."
+                assert extension in ["csv", "json", "parquet"], \
+                    "`train_file` should be a csv, a json or a parquet file."
             if self.valid_file is not None:
                 extension = self.valid_file.split(".")[-1]
-                assert extension in ["csv", "json"], "`validation_file` should be a csv or a json file."
+                assert extension in ["csv", "json", "parquet"], \
+                    "`validation_file` should be a csv, a json or a parquet file."
+        if self.max_tokens_per_batch is not None and self.pad_to_max_length:
+            raise ValueError("`max_tokens_per_batch` needs dynamic padding, set `pad_to_max_length` to false.")
         self.task_name = self.task_name.lower()
 
 
+@dataclass
+class DistillationArguments:
+    """
+    Arguments for training a smaller student model against the fine-tuned model given as `model_name_or_path` (the
+    teacher), instead of fine-tuning that model itself.
+    """
+
+    student_num_layers: Optional[int] = field(
+        default=None,
+        metadata={
+            "help": (
+                "When set, train a student with this many transformer layers, initialized from a subset of the "
+                "layers of the teacher, on the soft labels of the teacher and the gold labels."
+            )
+        },
+    )
+    student_layers: Optional[str] = field(
+        default=None,
+        metadata={
+            "help": (
+                "Comma-separated indices of the teacher layers the student layers are initialized from. Defaults to "
+                "`student_num_layers` layers evenly spaced from the first to the last layer of the teacher."
+            )
+        },
+    )
+    distill_temperature: float = field(
+        default=2.0, metadata={"help": "Temperature of the softmax over the teacher and student logits."}
+    )
+    distill_alpha: float = field(
+        default=0.5,
+        metadata={"help": "Weight of the loss on the teacher's soft labels; the gold label loss gets the rest."},
+    )
+    latency_samples: int = field(
+        default=200,
+        metadata={"help": "Number of sequences whose forward pass is timed when comparing teacher and student."},
+    )
+
+
+def build_compute_metrics(metric, label_list, return_entity_level_metrics=False):
+    """
+    Builds the `compute_metrics` function passed to the Trainer, which scores token predictions with `metric`
+    (seqeval). Tokens labeled -100 (special tokens and non-first subwords) are ignored.
+    """
+
+    def compute_metrics(p):
+        predictions, labels = p
+        predictions = np.argmax(predictions, axis=2)
+
+        # Remove ignored index (special tokens)
+        true_predictions = [
+            [label_list[p] for (p, l) in zip(prediction, label) if l != -100]
+            for prediction, label in zip(predictions, labels)
+        ]
+        true_labels = [
+            [label_list[l] for (p, l) in zip(prediction, label) if l != -100]
+            for prediction, label in zip(predictions, labels)
+        ]
+
+        results = metric.compute(predictions=true_predictions, references=true_labels)
+        if return_entity_level_metrics:
+            # Unpack nested dictionaries
+            final_results = {}
+            for key, value in results.items():
+                if isinstance(value, dict):
+                    for n, v in value.items():
+                        final_results[f"{key}_{n}"] = v
+                else:
+                    final_results[key] = value
+            return final_results
+        else:
+            return {
+                "precision": results["overall_precision"],
+                "recall": results["overall_recall"],
+                "f1": results["overall_f1"],
+                "accuracy": results["overall_accuracy"],
+            }
+
+    return compute_metrics
+
+
+# the index of the transformer layer in a parameter name, e.g. `bert.encoder.layer.11.output.dense.weight`
+LAYER_KEY_PATTERN = re.compile(r"\.layer\.(\d+)\.")
+
+
+def select_student_layers(teacher_num_layers: int, student_num_layers: int) -> List[int]:
+    """Returns `student_num_layers` teacher layer indices evenly spaced from the first to the last layer."""
+    if not 0 < student_num_layers <= teacher_num_layers:
+        raise ValueError(f"The student must have between 1 and {teacher_num_layers} layers.")
+    if student_num_layers == 1:
+        return [teacher_num_layers - 1]
+    return [round(i * (teacher_num_layers - 1) / (student_num_layers - 1)) for i in range(student_num_layers)]
+
+
+def build_student(teacher, layers: List[int]):
+    """
+    Builds a student token classification model with the architecture of the teacher, but only `len(layers)`
+    transformer layers. The embeddings and the classifier are copied from the teacher, and student layer `i` from
+    teacher layer `layers[i]`, so no other pretrained checkpoint is needed.
+    """
+    config = copy.deepcopy(teacher.config)
+    config.num_hidden_layers = len(layers)
+    student = AutoModelForTokenClassification.from_config(config)
+    student_layer = {teacher_idx: student_idx for student_idx, teacher_idx in enumerate(layers)}
+    state_dict = {}
+    for key, value in teacher.state_dict().items():
+        match = LAYER_KEY_PATTERN.search(key)
+        if match is None:
+            state_dict[key] = value.clone()
+        elif int(match.group(1)) in student_layer:
+            state_dict[key[:match.start(1)] + str(student_layer[int(match.group(1))]) + key[match.end(1):]] = \
+                value.clone()
+    missing, unexpected = student.load_state_dict(state_dict, strict=False)
+    if missing or unexpected:
+        raise ValueError(f"Could not map the teacher weights to the student: missing {missing}, "
+                         f"unexpected {unexpected}")
+    return student
+
+
+def distillation_loss(student_logits, teacher_logits, gold_loss, attention_mask=None, temperature=2.0, alpha=0.5):
+    """
+    Mixes the KL divergence between the temperature-softened label distributions of the teacher and the student, over
+    all non-padding tokens, with the loss on the gold labels. The soft loss is scaled by the squared temperature, so
+    that its gradients keep the same magnitude whatever the temperature.
+    """
+    if attention_mask is not None:
+        mask = attention_mask.bool()
+        student_logits, teacher_logits = student_logits[mask], teacher_logits[mask]
+    num_labels = student_logits.size(-1)
+    soft_loss = F.kl_div(
+        F.log_softmax(student_logits.reshape(-1, num_labels) / temperature, dim=-1),
+        F.softmax(teacher_logits.reshape(-1, num_labels) / temperature, dim=-1),
+        reduction="batchmean",
+    ) * temperature ** 2
+    return alpha * soft_loss + (1 - alpha) * gold_loss
+
+
+class TokenBudgetBatchSampler(Sampler):
+    """
+    Yields batches of dataset indices whose padded size, the number of sequences times the length of the longest one,
+    stays within a token budget. The indices are shuffled, then sorted by length within chunks of `chunk_size`, so that
+    each batch holds sequences of similar length and little padding; the order of the batches is shuffled as well.
+    The shuffle is seeded, and changes every epoch.
+    """
+
+    def __init__(self, lengths: Sequence[int], max_tokens: int, seed: int = 0, chunk_size: int = 1000):
+        if max(lengths) > max_tokens:
+            raise ValueError(f"`max_tokens_per_batch` ({max_tokens}) is shorter than the longest sequence "
+                             f"({max(lengths)} tokens), raise it or lower `max_seq_length`.")
+        self.lengths = np.asarray(lengths)
+        self.max_tokens = max_tokens
+        self.seed = seed
+        self.chunk_size = chunk_size
+        self.epoch = 0
+        self._batches = None
+
+    def _plan(self) -> List[List[int]]:
+        rng = np.random.default_rng(self.seed + self.epoch)
+        indices = rng.permutation(len(self.lengths))
+        batches = []
+        for start in range(0, len(indices), self.chunk_size):
+            chunk = indices[start:start + self.chunk_size]
+            batch, longest = [], 0
+            for idx in chunk[np.argsort(self.lengths[chunk], kind="stable")].tolist():
+                length = max(longest, int(self.lengths[idx]))
+                if batch and length * (len(batch) + 1) > self.max_tokens:
+                    batches.append(batch)
+                    batch, length = [], int(self.lengths[idx])
+                batch.append(idx)
+                longest = length
+            if batch:
+                batches.append(batch)
+        return [batches[i] for i in rng.permutation(len(batches))]
+
+    def __iter__(self) -> Iterator[List[int]]:
+        batches = self._batches if self._batches is not None else self._plan()
+        self._batches = None
+        self.epoch += 1
+        yield from batches
+
+    def __len__(self) -> int:
+        # planned ahead, as the number of batches varies a little from one shuffle to the next
+        if self._batches is None:
+            self._batches = self._plan()
+        return len(self._batches)
+
+
+class ThroughputCallback(TrainerCallback):
+    """
+    Logs the training throughput in real (non-padding) tokens per second, and the share of padding in the training
+    batches, over each logging interval. The values are also added to the log history of the trainer state. Batches are
+    counted by `NERTrainer.training_step`.
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self.real_tokens = 0
+        self.padded_tokens = 0
+        self.start = time.perf_counter()
+
+    def count_batch(self, inputs):
+        mask = inputs.get("attention_mask")
+        if mask is None:
+            mask = torch.ones_like(inputs["input_ids"])
+        self.real_tokens += int(mask.sum())
+        self.padded_tokens += mask.numel()
+
+    def stats(self) -> dict:
+        elapsed = time.perf_counter() - self.start
+        return {
+            "real_tokens_per_second": round(self.real_tokens / elapsed, 1) if elapsed > 0 else 0.0,
+            "padding_ratio": round(1 - self.real_tokens / self.padded_tokens, 4) if self.padded_tokens else 0.0,
+        }
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self._reset()
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        # evaluation logs have no training loss
+        if not logs or "loss" not in logs or not self.padded_tokens:
+            return
+        stats = self.stats()
+        logger.info(f"step {state.global_step}: {stats['real_tokens_per_second']} real tokens/s, "
+                    f"padding ratio {stats['padding_ratio']:.1%}")
+        if state.log_history and state.log_history[-1].get("step") == state.global_step:
+            state.log_history[-1].update(stats)
+        self._reset()
+
+
+class NERTrainer(Trainer):
+    """
+    A Trainer that can batch training sequences by token budget (see `TokenBudgetBatchSampler`), and reports training
+    throughput with a `ThroughputCallback`.
+    """
+
+    def __init__(self, *args, max_tokens_per_batch=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_tokens_per_batch = max_tokens_per_batch
+        self.throughput = ThroughputCallback()
+        self.add_callback(self.throughput)
+
+    def get_train_dataloader(self) -> DataLoader:
+        if self.max_tokens_per_batch is None:
+            return super().get_train_dataloader()
+        lengths = self.train_dataset[self.args.length_column_name]
+        train_dataset = self._remove_unused_columns(self.train_dataset, description="training")
+        batch_sampler = TokenBudgetBatchSampler(lengths, self.max_tokens_per_batch, seed=self.args.seed)
+        return self.accelerator.prepare(DataLoader(
+            train_dataset,
+            batch_sampler=batch_sampler,
+            collate_fn=self.data_collator,
+            num_workers=self.args.dataloader_num_workers,
+            pin_memory=self.args.dataloader_pin_memory,
+        ))
+
+    def training_step(self, model, inputs):
+        self.throughput.count_batch(inputs)
+        return super().training_step(model, inputs)
+
+
+class DistillationTrainer(NERTrainer):
+    """A Trainer that trains the model on the soft labels of a frozen teacher as well as on the gold labels."""
+
+    def __init__(self, *args, teacher_model=None, temperature=2.0, alpha=0.5, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.teacher_model = teacher_model.to(self.args.device).eval()
+        self.temperature = temperature
+        self.alpha = alpha
+
+    def compute_loss(self, model, inputs, return_outputs=False):
+        outputs = model(**inputs)
+        with torch.no_grad():
+            teacher_logits = self.teacher_model(**{k: v for k, v in inputs.items() if k != "labels"}).logits
+        loss = distillation_loss(outputs.logits, teacher_logits, outputs.loss, inputs.get("attention_mask"),
+                                 self.temperature, self.alpha)
+        return (loss, outputs) if return_outputs else loss
+
+
+def measure_latency(model, dataset, max_samples: int) -> float:
+    """
+    Returns the median time in milliseconds of a forward pass over one sequence of a tokenized dataset, without
+    padding, after one untimed pass.
+    """
+    model = model.eval()
+    rows = dataset.select(range(min(len(dataset), max_samples)))
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in rows.column_names]
+    latencies = []
+    with torch.inference_mode():
+        for i, row in enumerate(rows):
+            length = sum(row["attention_mask"])
+            inputs = {name: torch.tensor([row[name][:length]], device=model.device) for name in input_names}
+            start = time.perf_counter()
+            model(**inputs)
+            if i > 0:
+                latencies.append(time.perf_counter() - start)
+    return float(np.median(latencies)) * 1000 if latencies else float("nan")
+
+
 def main():
     # See all possible arguments in src/transformers/training_args.py
     # or by passing the --help flag to this script.
 
-    parser = HfArgumentParser((ModelArguments, DataTrainingArguments, TrainingArguments))
+    parser = HfArgumentParser((ModelArguments, DataTrainingArguments, TrainingArguments, DistillationArguments))
     if len(sys.argv) == 2 and sys.argv[1].endswith(".json"):
         # If we pass only one argument to the script, and it's the path to a json file,
         # let's parse it to get our arguments.
-        model_args, data_args, training_args = parser.parse_json_file(json_file=os.path.abspath(sys.argv[1]))
+        model_args, data_args, training_args, distill_args = parser.parse_json_file(
+            json_file=os.path.abspath(sys.argv[1]))
     else:
-        model_args, data_args, training_args = parser.parse_args_into_dataclasses()
+        model_args, data_args, training_args, distill_args = parser.parse_args_into_dataclasses()
 
     # Setup logging
     logging.basicConfig(
@@ -379,6 +700,17 @@ def main():
     model.config.label2id = {label: i for i, label in enumerate(label_list)}
     model.config.id2label = dict(enumerate(label_list))
 
+    # Distillation: the loaded model is the teacher, and a student built from a subset of its layers is trained
+    teacher = None
+    if distill_args.student_num_layers:
+        teacher = model
+        if distill_args.student_layers:
+            student_layers = [int(idx) for idx in distill_args.student_layers.split(",")]
+        else:
+            student_layers = select_student_layers(teacher.config.num_hidden_layers, distill_args.student_num_layers)
+        logger.info(f"Distilling a student from teacher layers {student_layers} of {teacher.config.num_hidden_layers}")
+        model = build_student(teacher, student_layers)
+
     # Map that sends B-Xxx label to its I-Xxx counterpart
     b_to_i_label = []
     for idx, label in enumerate(label_list):
@@ -425,6 +757,8 @@ def main():
 
             labels.append(label_ids)
         tokenized_inputs["labels"] = labels
+        # real (non-padding) lengths, for length-grouped and token budget batching
+        tokenized_inputs["length"] = [sum(mask) for mask in tokenized_inputs["attention_mask"]]
         return tokenized_inputs
 
     if training_args.do_train:
@@ -481,41 +815,14 @@ def main():
     # Metrics
     metric = evaluate.load("seqeval", cache_dir=model_args.cache_dir)
 
-    def compute_metrics(p):
-        predictions, labels = p
-        predictions = np.argmax(predictions, axis=2)
-
-        # Remove ignored index (special tokens)
-        true_predictions = [
-            [label_list[p] for (p, l) in zip(prediction, label) if l != -100]
-            for prediction, label in zip(predictions, labels)
-        ]
-        true_labels = [
-            [label_list[l] for (p, l) in zip(prediction, label) if l != -100]
-            for prediction, label in zip(predictions, labels)
-        ]
-
-        results = metric.compute(predictions=true_predictions, references=true_labels)
-        if data_args.return_entity_level_metrics:
-            # Unpack nested dictionaries
-            final_results = {}
-            for key, value in results.items():
-                if isinstance(value, dict):
-                    for n, v in value.items():
-                        final_results[f"{key}_{n}"] = v
-                else:
-                    final_results[key] = value
-            return final_results
-        else:
-            return {
-                "precision": results["overall_precision"],
-                "recall": results["overall_recall"],
-                "f1": results["overall_f1"],
-                "accuracy": results["overall_accuracy"],
-            }
+    compute_metrics = build_compute_metrics(metric, label_list, data_args.return_entity_level_metrics)
 
     # Initialize our Trainer
-    trainer = Trainer(
+    trainer_kwargs = {"max_tokens_per_batch": data_args.max_tokens_per_batch}
+    if teacher is not None:
+        trainer_kwargs.update({"teacher_model": teacher, "temperature": distill_args.distill_temperature,
+                               "alpha": distill_args.distill_alpha})
+    trainer = (DistillationTrainer if teacher is not None else NERTrainer)(
         model=model,
         args=training_args,
         train_dataset=train_dataset if training_args.do_train else None,
@@ -523,6 +830,7 @@ def main():
         tokenizer=tokenizer,
         data_collator=data_collator,
         compute_metrics=compute_metrics,
+        **trainer_kwargs,
     )
 
     # Training
@@ -580,6 +888,21 @@ def main():
                 for prediction in true_predictions:
                     writer.write(" ".join(prediction) + "\n")
 
+    # Distillation report: F1 and latency of the teacher and the student, on the test set if any
+    if teacher is not None and (training_args.do_predict or training_args.do_eval):
+        report_dataset = predict_dataset if training_args.do_predict else eval_dataset
+        teacher_trainer = Trainer(model=teacher, args=training_args, tokenizer=tokenizer, data_collator=data_collator,
+                                  compute_metrics=compute_metrics)
+        report = {}
+        for name, scorer, scored_model in (("teacher", teacher_trainer, teacher), ("student", trainer, model)):
+            scores = scorer.evaluate(report_dataset, metric_key_prefix=name)
+            report[f"{name}_f1"] = scores.get(f"{name}_f1", scores.get(f"{name}_overall_f1"))
+            report[f"{name}_layers"] = scored_model.config.num_hidden_layers
+            report[f"{name}_params_m"] = sum(p.numel() for p in scored_model.parameters()) / 1e6
+            report[f"{name}_latency_ms"] = measure_latency(scored_model, report_dataset, distill_args.latency_samples)
+        trainer.log_metrics("distillation", report)
+        trainer.save_metrics("distillation", report)
+
     kwargs = {"finetuned_from": model_args.model_name_or_path, "tasks": "token-classification"}
     if data_args.dataset_name is not None:
         kwargs["dataset_tags"] = data_args.dataset_name
@@ -0,0 +1,38 @@
+"""
+Shared fixtures for tests that need a token classification checkpoint.
+
+By default, a tiny randomly initialized BERT is built from the vocabulary of `model_in_data`, so that these tests run
+offline and quickly. Set `RFB_TEST_MODEL` to a hub name or a local path to run them against a real checkpoint.
+"""
+
+import os
+import re
+
+import pytest
+
+from tests.helpers import load_sequences
+
+LABELS = ['B-FILL', 'B-ROLE', 'I-FILL', 'I-ROLE', 'O']
+
+
+@pytest.fixture(scope='session')
+def checkpoint(tmp_path_factory):
+    if os.environ.get('RFB_TEST_MODEL'):
+        return os.environ['RFB_TEST_MODEL']
+    torch = pytest.importorskip('torch')
+    from transformers import BertConfig, BertForTokenClassification, BertTokenizerFast
+
+    out_dir = tmp_path_factory.mktemp('tiny-rfb')
+    words = {token for split in ('train', 'val', 'test') for _, tokens in load_sequences(split) for token in tokens}
+    chars = sorted(set(''.join(words)) | set('abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'))
+    pieces = sorted({piece for word in words for piece in re.findall(r'\w+', word) if len(piece) <= 6} - set(chars))
+    vocab = ['[PAD]', '[UNK]', '[CLS]', '[SEP]', '[MASK]'] + chars + [f'##{c}' for c in chars] + pieces
+    (out_dir / 'vocab.txt').write_text('\n'.join(vocab) + '\n')
+    tokenizer = BertTokenizerFast(str(out_dir / 'vocab.txt'), do_lower_case=False, model_max_length=512)
+    config = BertConfig(vocab_size=len(vocab), hidden_size=32, num_hidden_layers=2, num_attention_heads=2,
+                        intermediate_size=64, num_labels=len(LABELS), id2label=dict(enumerate(LABELS)),
+                        label2id={label: i for i, label in enumerate(LABELS)})
+    torch.manual_seed(0)
+    BertForTokenClassification(config).save_pretrained(out_dir)
+    tokenizer.save_pretrained(out_dir)
+    return str(out_dir)
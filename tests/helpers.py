@@ -0,0 +1,299 @@
+"""
+Helpers shared by the tests, and used by the benchmarks as well: loading the sequences of `model_in_data` and their
+gold spans, the original `clean_ocr` implementation kept as a reference, the generator of synthetic MMIF files
+(shaped like the output of SWT followed by an OCR app), a stub tagger that stands in for the model, and a reader of
+the role-filler pairs of the app's output.
+"""
+
+import csv
+import io
+import json
+import random
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from mmif import AnnotationTypes, DocumentTypes, Mmif
+
+from utils.alignment import get_annotations_of_type
+
+DATA_DIR = Path(__file__).parent.parent / 'model_in_data'
+
+
+def load_sequences(split='test'):
+    """Returns the (scene type, token list) pairs of a split in `model_in_data`."""
+    with open(DATA_DIR / f'rfb_{split}.json') as f:
+        rows = [json.loads(line) for line in f]
+    return [(row['tokens'][0], row['tokens'][1:]) for row in rows]
+
+
+def gold_spans(tokens: List[str], labels: List[str]) -> List[Tuple[str, List[str]]]:
+    """Groups words into their gold spans, as (tag, words) pairs, with runs of untagged words as "O" spans."""
+    spans = []
+    for token, label in zip(tokens, labels):
+        tag = label.split("-", 1)[-1]
+        if not spans or label.startswith("B-") or tag != spans[-1][0]:
+            spans.append((tag, []))
+        spans[-1][1].append(token)
+    return spans
+
+
+def legacy_clean_ocr(text_document):
+    """The original implementation of `clean_ocr`, kept as the reference output."""
+    def has_alnum(string):
+        return any(char.isalnum() for char in string)
+
+    def has_alpha(string):
+        return any(char.isalpha() for char in string)
+
+    def contains_year(string):
+        return re.search(r"^[12][0-9]{3}$", string) is not None
+
+    def segment_string(string):
+        string = re.sub(r"(?<=[A-Za-z][,.])(?=[A-Za-z])", " ", string)
+        return re.sub(r"(?<=[a-z]{3})(?=[A-Z])", " ", string)
+
+    allowable_chars = {r'&'}
+    cleaned = []
+    for line in text_document.split('\n'):
+        line = line.strip()
+        if not has_alnum(line):
+            continue
+        else:
+            line = segment_string(line)
+            line = [
+                w for w in line.split() if (len(w) > 1 and has_alpha(w)) or w in allowable_chars or contains_year(w)
+            ]
+        if line:
+            cleaned.extend(line)
+    return cleaned
+
+
+# noise mixed into the regression corpus of `clean_ocr`
+CLEAN_OCR_NOISE = ['&', '-', '--', '|', '.', ',', '_', '__ &', '& -', '1984', '2023,', '0999', '3000', 'x', 'A', '7',
+                   '²', '½', 'Ⅻ', 'é', 'Müller', 'O\'Brien', '(R)', 'Dir.,Health', 'ProducerJane', 'abcDEF',
+                   'Ab.Cd', '\r', '\t', '  ', '', '\n', ' ', ' ']
+
+
+LABEL_SCENES = {'I': 'chyron', 'N': 'chyron', 'Y': 'chyron', 'C': 'credits', 'R': 'credits'}
+DEFAULT_LABEL_MIX = {'I': 3, 'N': 1, 'Y': 1, 'C': 2, 'R': 1, 'B': 1, 'S': 1}
+NOISE_TOKENS = ['&', '-', '--', '|', '.', ',', '_', '1984', 'x', 'A', '7', '½', 'é', '(R)', '"', '»']
+
+
+def parse_label_mix(value: str) -> Dict[str, float]:
+    """Parses a label mix given as `I=3,C=1,...` into label weights."""
+    return {label: float(weight) for label, weight in (pair.split('=') for pair in value.split(','))}
+
+
+def parse_range(value: str) -> Tuple[int, int]:
+    """Parses a word count range given as `MIN:MAX`."""
+    low, high = value.split(':')
+    return int(low), int(high)
+
+
+class OCRSampler:
+    """
+    Samples OCR-like text for a scene type from the sequences of `model_in_data`.
+
+    Args:
+        lengths (Dict[str, Tuple[int, int]]): Range of the number of words per scene type. Sequences are concatenated
+            or cut to a length drawn uniformly from the range. Scene types without a range keep the length of a single
+            sequence.
+        noise (float): Probability, per word, of OCR-like noise: a stray symbol, two merged words or a split line.
+        rng (random.Random): Random number generator.
+    """
+
+    def __init__(self, lengths: Optional[Dict[str, Tuple[int, int]]] = None, noise: float = 0.0,
+                 rng: Optional[random.Random] = None):
+        self.lengths = lengths or {}
+        self.noise = noise
+        self.rng = rng or random.Random(0)
+        self.sequences = {'chyron': [], 'credits': []}
+        for split in ('train', 'val', 'test'):
+            for scene_type, tokens in load_sequences(split):
+                self.sequences[scene_type].append(tokens)
+
+    def words(self, scene_type: str) -> list:
+        words = list(self.rng.choice(self.sequences[scene_type]))
+        if scene_type in self.lengths:
+            target = self.rng.randint(*self.lengths[scene_type])
+            while len(words) < target:
+                words.extend(self.rng.choice(self.sequences[scene_type]))
+            words = words[:max(target, 1)]
+        return words
+
+    def text(self, words: list) -> str:
+        """Lays out words in lines, as OCR of a frame would, with noise mixed in."""
+        lines, line = [], []
+        for word in words:
+            if self.rng.random() < self.noise:
+                noise = self.rng.random()
+                if noise < 0.4:
+                    line.append(self.rng.choice(NOISE_TOKENS))
+                elif noise < 0.7 and line:
+                    # merged with the previous word, as OCR often does
+                    line[-1] += self.rng.choice(['', ',', '.'])
+                    line[-1] += word
+                    continue
+                elif line:
+                    lines.append(' '.join(line))
+                    line = []
+            line.append(word)
+            if self.rng.random() < 0.25:
+                lines.append(' '.join(line))
+                line = []
+        lines.append(' '.join(line))
+        return '\n'.join(lines)
+
+    def perturb(self, text: str) -> str:
+        """A near-identical reading of the same frame content: one character changed, dropped or added."""
+        if not text or self.rng.random() < 0.5:
+            return text
+        pos = self.rng.randrange(len(text))
+        edit = self.rng.random()
+        char = self.rng.choice('abcdefghijklmnopqrstuvwxyz.,')
+        if edit < 0.33:
+            return text[:pos] + char + text[pos + 1:]
+        elif edit < 0.66:
+            return text[:pos] + text[pos + 1:]
+        return text[:pos] + char + text[pos:]
+
+
+def generate_mmif(timepoints: int, label_mix: Optional[Dict[str, float]] = None,
+                  lengths: Optional[Dict[str, Tuple[int, int]]] = None, noise: float = 0.0, ocr_rate: float = 0.9,
+                  run_length: float = 1.0, scroll_lines: int = 0, seed: int = 0) -> str:
+    """
+    Generates the JSON of a synthetic MMIF.
+
+    Args:
+        timepoints (int): Number of TimePoints.
+        label_mix (Dict[str, float]): Relative weight of each TimePoint label. Labels other than I/N/Y/C/R stand for
+            scenes the app does not process (e.g. B for bars, S for slate).
+        lengths (Dict[str, Tuple[int, int]]): Range of the number of OCR words per scene type (`chyron`, `credits`).
+        noise (float): Probability of OCR-like noise per word.
+        ocr_rate (float): Share of TimePoints with an aligned TextDocument.
+        run_length (float): Mean number of consecutive TimePoints showing the same scene, with the same label and
+            near-identical text.
+        scroll_lines (int): Number of lines a run of credits scrolls by from one TimePoint to the next, as in a
+            scrolling credit roll: lines leave the top of the frame and new ones enter at the bottom. With 0, the
+            text of credits stays the same through a run.
+        seed (int): Random seed.
+
+    Returns:
+        str: The serialized MMIF.
+    """
+    rng = random.Random(seed)
+    sampler = OCRSampler(lengths, noise, rng)
+    labels, weights = zip(*(label_mix or DEFAULT_LABEL_MIX).items())
+    swt_annotations, ocr_annotations = [], []
+    label, text, remaining = None, None, 0
+    # lines of a scrolling credit roll still to enter the frame
+    upcoming = []
+    for i in range(timepoints):
+        if remaining == 0:
+            label = rng.choices(labels, weights)[0]
+            scene_type = LABEL_SCENES.get(label, rng.choice(['chyron', 'credits']))
+            text = sampler.text(sampler.words(scene_type))
+            remaining = max(1, round(rng.expovariate(1 / run_length))) if run_length > 1 else 1
+        elif scroll_lines and LABEL_SCENES.get(label) == 'credits':
+            while len(upcoming) < scroll_lines:
+                upcoming.extend(sampler.text(sampler.words('credits')).split('\n'))
+            text = '\n'.join(text.split('\n')[scroll_lines:] + upcoming[:scroll_lines])
+            upcoming = upcoming[scroll_lines:]
+        remaining -= 1
+        swt_annotations.append({"@type": str(AnnotationTypes.TimePoint),
+                                "properties": {"id": f"tp_{i}", "timePoint": i * 1000, "label": label}})
+        if rng.random() < ocr_rate:
+            ocr_annotations.append({"@type": str(DocumentTypes.TextDocument),
+                                    "properties": {"id": f"td_{i}", "text": {"@value": sampler.perturb(text)}}})
+            ocr_annotations.append({"@type": str(AnnotationTypes.Alignment),
+                                    "properties": {"id": f"al_{i}", "source": f"v_0:tp_{i}", "target": f"td_{i}"}})
+    view_metadata = {"timestamp": "2024-01-01T00:00:00", "appConfiguration": {}}
+    return json.dumps({
+        "metadata": {"mmif": "http://mmif.clams.ai/1.0.0"},
+        "documents": [{"@type": str(DocumentTypes.VideoDocument),
+                       "properties": {"id": "d1", "mime": "video/mp4", "location": "file:///video.mp4"}}],
+        "views": [
+            {"id": "v_0", "metadata": {**view_metadata, "app": "http://apps.clams.ai/swt-detection/v1",
+                                       "contains": {str(AnnotationTypes.TimePoint): {"document": "d1"}}},
+             "annotations": swt_annotations},
+            {"id": "v_1", "metadata": {**view_metadata, "app": "http://apps.clams.ai/doctr-wrapper/v1",
+                                       "contains": {str(DocumentTypes.TextDocument): {},
+                                                    str(AnnotationTypes.Alignment): {}}},
+             "annotations": ocr_annotations},
+        ],
+    })
+
+
+class StubModel:
+    """Stands in for the model of a pipeline, for `max_input_length` and `model_identity`."""
+
+    def __init__(self, config):
+        self.config = config
+
+
+class StubTagger:
+    """
+    Stands in for the token classification pipeline of the app. Inputs are tokenized with the tokenizer of the
+    checkpoint, as the app batches and windows them by subword length, but no model is run: words after the scene
+    type are tagged alternately as roles and fillers.
+
+    Args:
+        model_name_or_path (str): A HuggingFace hub model name or a path to a local checkpoint directory.
+    """
+
+    def __init__(self, model_name_or_path: str):
+        from transformers import AutoConfig, AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name_or_path)
+        self.model = StubModel(AutoConfig.from_pretrained(model_name_or_path))
+
+    def tag(self, text: str) -> list:
+        self.tokenizer(text, truncation=True)
+        entities, offset = [], 0
+        for i, word in enumerate(text.split(' ')):
+            if i > 0 and word:
+                entities.append({"entity_group": "ROLE" if i % 2 else "FILL", "score": 1.0, "word": word,
+                                 "start": offset, "end": offset + len(word)})
+            offset += len(word) + 1
+        return entities
+
+    def __call__(self, inputs, batch_size: int = 1):
+        if isinstance(inputs, str):
+            return self.tag(inputs)
+        return [self.tag(text) for text in inputs]
+
+
+def count_documents(mmif_json: str) -> int:
+    """Returns the number of TextDocuments in a synthetic MMIF aligned to TimePoints with a supported label."""
+    mmif = json.loads(mmif_json)
+    labels = {ann["properties"]["id"]: ann["properties"]["label"] for ann in mmif["views"][0]["annotations"]}
+    return sum(1 for ann in mmif["views"][1]["annotations"]
+               if "source" in ann["properties"] and labels[ann["properties"]["source"].split(":")[1]] in LABEL_SCENES)
+
+
+OUTPUT_FORMATS = ('csv', 'annotations', 'document')
+
+
+def read_pairs(mmif: Mmif, output_format: str) -> List[Tuple[str, str, str]]:
+    """
+    Reads the (OCR TextDocument, role, filler) triples of the last view of an output, as a consumer would. The
+    pairs of scrolling credit rolls (TimeFrames over several frames) are left out.
+    """
+    view = mmif.views.get_last_contentful_view()
+    if output_format == 'annotations':
+        return [(annotation.get('document'), role, filler)
+                for annotation in get_annotations_of_type(view, AnnotationTypes.Annotation)
+                for role, filler in annotation.get('pairs')]
+    if output_format == 'document':
+        rows = []
+        for document in get_annotations_of_type(view, DocumentTypes.TextDocument):
+            rows.extend((row['Document'], row['Role'], row['Filler'])
+                        for row in csv.DictReader(io.StringIO(document.text_value)))
+        return rows
+    texts = {document.long_id: document.text_value
+             for document in get_annotations_of_type(view, DocumentTypes.TextDocument)}
+    rows = []
+    for alignment in get_annotations_of_type(view, AnnotationTypes.Alignment):
+        rows.extend((alignment.get('source'), row['Role'], row['Filler'])
+                    for row in csv.DictReader(io.StringIO(texts[alignment.get('target')])))
+    return rows
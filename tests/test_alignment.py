@@ -0,0 +1,42 @@
+"""
+Tests for the TimePoint to TextDocument alignment index
+"""
+
+from mmif import AnnotationTypes, Document, DocumentTypes, Mmif
+
+from utils.alignment import get_annotations_of_type, index_aligned_text_documents
+
+
+def build_mmif():
+    mmif = Mmif({"metadata": {"mmif": "http://mmif.clams.ai/1.0.0"}, "documents": [], "views": []})
+    mmif.add_document(Document({"@type": DocumentTypes.VideoDocument,
+                                "properties": {"id": "d1", "mime": "video/mp4", "location": "file:///video.mp4"}}))
+    swt_view = mmif.new_view()
+    swt_view.metadata.app = "http://apps.clams.ai/swt-detection/v1"
+    swt_view.new_contain(AnnotationTypes.TimePoint, document="d1")
+    tps = [swt_view.new_annotation(AnnotationTypes.TimePoint, timePoint=i * 1000, label=label)
+           for i, label in enumerate("ICB")]
+    ocr_view = mmif.new_view()
+    ocr_view.metadata.app = "http://apps.clams.ai/doctr-wrapper/v1"
+    ocr_view.new_contain(DocumentTypes.TextDocument)
+    ocr_view.new_contain(AnnotationTypes.Alignment)
+    tds = [ocr_view.new_textdocument(text=f"text {i}") for i in range(4)]
+    ocr_view.new_annotation(AnnotationTypes.Alignment, source=tps[0].long_id, target=tds[0].long_id)
+    # TimePoints can be on the target side as well, and have several TextDocuments
+    ocr_view.new_annotation(AnnotationTypes.Alignment, source=tds[1].long_id, target=tps[1].long_id)
+    ocr_view.new_annotation(AnnotationTypes.Alignment, source=tps[1].long_id, target=tds[2].long_id)
+    ocr_view.new_annotation(AnnotationTypes.Alignment, source=tps[2].long_id, target=tds[3].long_id)
+    # deserialize, as the app gets it
+    return Mmif(mmif.serialize())
+
+
+def test_index_aligned_text_documents():
+    mmif = build_mmif()
+    tps = [tp for view in mmif.get_all_views_contain(AnnotationTypes.TimePoint)
+           for tp in get_annotations_of_type(view, AnnotationTypes.TimePoint)]
+    assert [tp.get('label') for tp in tps] == list("ICB")
+    index = index_aligned_text_documents(tp for tp in tps if tp.get('label') in {'I', 'C'})
+    assert {tp_id: [td.text_value for td in tds] for tp_id, tds in index.items()} == {
+        tps[0].long_id: ["text 0"],
+        tps[1].long_id: ["text 1", "text 2"],
+    }
@@ -0,0 +1,80 @@
+"""
+Tests for the offline batch annotation of MMIF files
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+from mmif import AnnotationTypes, Mmif
+
+from batch import list_jobs, run
+from tests.helpers import StubTagger, count_documents, generate_mmif
+
+REPO_DIR = Path(__file__).parent.parent
+
+
+def write_inputs(input_dir, num_files):
+    (input_dir / 'sub').mkdir(parents=True)
+    inputs = []
+    for i in range(num_files):
+        path = input_dir / ('sub' if i % 2 else '.') / f'{i}.mmif'
+        path.write_text(generate_mmif(20, seed=i))
+        inputs.append(path)
+    return inputs
+
+
+def test_list_jobs(tmp_path):
+    inputs = write_inputs(tmp_path / 'in', 3)
+    jobs = list_jobs(str(tmp_path / 'in'), str(tmp_path / 'out'))
+    assert sorted(jobs) == sorted((path, tmp_path / 'out' / path.relative_to(tmp_path / 'in')) for path in inputs)
+    manifest = tmp_path / 'manifest.txt'
+    manifest.write_text(f'# inputs\n{inputs[0]}\n\n{inputs[1]}\t{tmp_path / "elsewhere.mmif"}\n')
+    assert list_jobs(manifest=str(manifest), output_dir=str(tmp_path / 'out')) == [
+        (inputs[0], tmp_path / 'out' / '0.mmif'), (inputs[1], tmp_path / 'elsewhere.mmif')]
+
+
+def test_batch_run_and_resume(checkpoint, tmp_path):
+    from utils.model import rfb_model
+
+    inputs = write_inputs(tmp_path / 'in', 5)
+    jobs = list_jobs(str(tmp_path / 'in'), str(tmp_path / 'out'))
+    worker_args = (checkpoint, 'pytorch', 'pipeline', None, None, 64, 4096, 0)
+    rfb_model.set_tagger(StubTagger(checkpoint))
+    try:
+        report = run(jobs, worker_args, {}, files_per_worker=2, progress=False)
+        assert (report['annotated'], report['failed'], report['skipped']) == (5, 0, 0)
+        assert report['documents'] == sum(count_documents(path.read_text()) for path in inputs)
+        for _, output_path in jobs:
+            rfb_view = Mmif(output_path.read_text()).get_view_by_id('v_2')
+            assert len(list(rfb_view.get_annotations(AnnotationTypes.Alignment))) > 0
+
+        # completed outputs are skipped; a missing output and a new, broken input are processed
+        jobs[0][1].unlink()
+        (tmp_path / 'in' / 'broken.mmif').write_text('{"metadata":')
+        report = run(list_jobs(str(tmp_path / 'in'), str(tmp_path / 'out')), worker_args, {}, progress=False)
+    finally:
+        rfb_model.set_tagger(None)
+    assert (report['annotated'], report['failed'], report['skipped']) == (1, 1, 4)
+    assert list(report['errors']) == [str(tmp_path / 'in' / 'broken.mmif')]
+    assert jobs[0][1].exists() and not (tmp_path / 'out' / 'broken.mmif').exists()
+
+
+def test_batch_cli(checkpoint, tmp_path):
+    write_inputs(tmp_path / 'in', 4)
+    command = [sys.executable, 'batch.py', '--input-dir', str(tmp_path / 'in'), '--output-dir', str(tmp_path / 'out'),
+               '--model', checkpoint, '--decoder', 'fast', '--threads', '1', '--params', 'batchSize=8',
+               '--workers', '2', '--files-per-worker', '1']
+    env = dict(os.environ, HF_HUB_OFFLINE='1')
+    done = subprocess.run(command, cwd=REPO_DIR, env=env, capture_output=True, text=True, timeout=300)
+    assert done.returncode == 0, done.stderr
+    assert '4 files annotated, 0 failed, 0 skipped' in done.stdout
+    assert all(Mmif(output_path.read_text()).get_view_by_id('v_2') for _, output_path in
+               list_jobs(str(tmp_path / 'in'), str(tmp_path / 'out')))
+
+    # a worker that cannot load its model fails the run rather than being replaced forever
+    command[command.index('--model') + 1] = str(tmp_path / 'no-such-model')
+    done = subprocess.run(command + ['--overwrite'], cwd=REPO_DIR, env=env, capture_output=True, text=True,
+                          timeout=300)
+    assert done.returncode != 0 and 'could not be set up' in done.stderr
@@ -0,0 +1,21 @@
+"""
+Tests for length-bucketed, token-budget batching
+"""
+
+from utils.batching import TokenBudgetBatcher
+
+
+def test_plan_under_token_budget():
+    batcher = TokenBudgetBatcher(max_tokens=20)
+    lengths = [8, 3, 200, 4, 5, 9]
+    batches = batcher.plan(lengths)
+    # sorted by length, padded size of every batch within the budget except for the oversized sequence
+    assert batches == [[1, 3, 4], [0, 5], [2]]
+    assert sorted(idx for batch in batches for idx in batch) == list(range(len(lengths)))
+    assert batcher.stats()['paddedTokens'] == 3 * 5 + 2 * 9 + 200
+    assert batcher.padding_efficiency == sum(lengths) / (3 * 5 + 2 * 9 + 200)
+
+
+def test_plan_max_batch_size():
+    batcher = TokenBudgetBatcher(max_batch_size=2)
+    assert batcher.plan([5, 4, 3, 2, 1]) == [[4, 3], [2, 1], [0]]
@@ -0,0 +1,99 @@
+"""
+Tests for the role-filler binding result cache
+"""
+
+import multiprocessing
+import os
+
+from utils.cache import RFBCache
+
+PAIRS = [{'Role': 'Director', 'Filler': 'Joe Bloggs'}]
+
+
+def test_lru_eviction():
+    cache = RFBCache(max_size=2)
+    cache.put('credits', 'a', 'm@1', PAIRS)
+    cache.put('credits', 'b', 'm@1', PAIRS)
+    assert cache.get('credits', 'a', 'm@1') == PAIRS  # `a` is now the most recently used
+    cache.put('credits', 'c', 'm@1', PAIRS)
+    assert cache.get('credits', 'b', 'm@1') is None
+    assert cache.get('chyron', 'a', 'm@1') is None  # scene type is part of the key
+    assert cache.stats()['evictions'] == 1
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 2
+
+
+def test_disk_tier_persists(tmp_path):
+    RFBCache(cache_dir=str(tmp_path)).put('chyron', 'Jane Doe', 'm@1', PAIRS)
+    cache = RFBCache(cache_dir=str(tmp_path))
+    assert cache.get('chyron', 'Jane Doe', 'm@1') == PAIRS
+    assert cache.stats()['diskHits'] == 1
+
+
+def test_model_change_invalidates(tmp_path):
+    cache = RFBCache(cache_dir=str(tmp_path))
+    cache.put('chyron', 'Jane Doe', 'm@1', PAIRS)
+    assert cache.get('chyron', 'Jane Doe', 'm@2') is None
+    assert cache.get('chyron', 'Jane Doe', 'm@1') is None
+    assert cache.stats()['diskSize'] == 0
+
+
+def check_forked_connection(cache, parent_connection):
+    cache.put('chyron', 'Richard Roe', 'm@1', PAIRS)
+    assert cache._db is not parent_connection
+    assert cache._connection_pid == os.getpid()
+
+
+def test_forked_process_opens_own_connection(tmp_path):
+    cache = RFBCache(cache_dir=str(tmp_path))
+    cache.put('chyron', 'Jane Doe', 'm@1', PAIRS)
+    parent_connection = cache._db
+    child = multiprocessing.get_context('fork').Process(target=check_forked_connection,
+                                                        args=(cache, parent_connection))
+    child.start()
+    child.join()
+    assert child.exitcode == 0
+    assert cache._db is parent_connection
+    assert cache.get('chyron', 'Richard Roe', 'm@1') == PAIRS
+
+
+def test_variants_share_model(tmp_path):
+    cache = RFBCache(cache_dir=str(tmp_path))
+    cache.put('credits', 'Jane Doe', 'm@1', PAIRS, variant='window=512,64')
+    assert cache.get('credits', 'Jane Doe', 'm@1', variant='window=128,32') is None
+    cache.put('credits', 'Jane Doe', 'm@1', [], variant='window=128,32')
+    # switching window settings keeps the entries of the other settings
+    assert cache.get('credits', 'Jane Doe', 'm@1', variant='window=512,64') == PAIRS
+    assert cache.get('credits', 'Jane Doe', 'm@1', variant='window=128,32') == []
+    assert cache.stats()['diskSize'] == 2
+
+
+def test_put_many(tmp_path):
+    cache = RFBCache(max_size=2, cache_dir=str(tmp_path))
+    cache.put_many([('credits', 'Joe Bloggs', PAIRS), ('chyron', 'Jane Doe', []), ('chyron', 'Richard Roe', PAIRS)],
+                   'm@1', variant='window=512,64')
+    # all entries reach the disk in one go, and the most recent ones stay in memory
+    assert cache.stats()['diskSize'] == 3 and cache.stats()['size'] == 2
+    assert cache.get('chyron', 'Jane Doe', 'm@1', variant='window=512,64') == []
+    assert cache.get('credits', 'Joe Bloggs', 'm@1', variant='window=512,64') == PAIRS
+    assert cache.stats()['diskHits'] == 1
+
+
+
+def test_batch_results_are_cached(checkpoint, tmp_path):
+    from tests.helpers import StubTagger
+    from utils.model import model_identity
+    from utils.rfb import bind_role_fillers_batch
+
+    tagger = StubTagger(checkpoint)
+    cache = RFBCache(cache_dir=str(tmp_path))
+    ocr_results = ['Director Joe Bloggs', 'Jane Doe Reporter', 'Director Joe Bloggs']
+    scene_types = ['credits', 'chyron', 'credits']
+    results = bind_role_fillers_batch(ocr_results, scene_types, clf=tagger, cache=cache)
+    # the duplicate input is stored once
+    assert cache.stats()['diskSize'] == 2 and cache.stats()['misses'] == 3
+    input_tokens = []
+    assert bind_role_fillers_batch(ocr_results, scene_types, clf=tagger, cache=cache,
+                                   input_tokens=input_tokens) == results
+    assert cache.stats()['hits'] == 3 and input_tokens == [0, 0, 0]
+    assert model_identity(tagger.model) is model_identity(tagger.model)
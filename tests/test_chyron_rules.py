@@ -0,0 +1,73 @@
+"""
+Tests for the rule-based chyron fast path
+"""
+
+import json
+from bisect import bisect_right
+from itertools import accumulate
+
+import pytest
+
+from tests.helpers import DATA_DIR, gold_spans
+from utils.chyron_rules import recognize_chyron
+from utils.rfb import parse_sequence_tags, respell_pairs
+
+
+def test_recognize_name_and_title():
+    assert recognize_chyron([['Leo', 'Melamed'], ['Chairman,', 'Executive', 'Cmte.']]) == \
+           [{'Role': 'Chairman, Executive Cmte.', 'Filler': 'Leo Melamed'}]
+    assert recognize_chyron([['SEN.', 'BOB', 'GRAHAM'], ['(D)', 'Florida']]) == \
+           [{'Role': '(D) Florida', 'Filler': 'SEN. BOB GRAHAM'}]
+    assert recognize_chyron([['Glenn', 'Olson,'], ['Principal']]) == [{'Role': 'Principal', 'Filler': 'Glenn Olson,'}]
+
+
+def test_ambiguous_chyrons_go_to_the_model():
+    # not two lines
+    assert recognize_chyron([['Leo', 'Melamed', 'Chairman']]) is None
+    assert recognize_chyron([['WGBH'], ['Leo', 'Melamed'], ['Chairman']]) is None
+    # the title comes first
+    assert recognize_chyron([['Executive', 'Producer'], ['Jane', 'Doe']]) is None
+    assert recognize_chyron([['Reporter'], ['Jane', 'Doe']]) is None
+    # the second line could be a name as well
+    assert recognize_chyron([['Jonathan', 'Landay'], ['Christian', 'Science', 'Monitor']]) is None
+    # the first line is not shaped like a name
+    assert recognize_chyron([['mostly', 'lowercase', 'noise'], ['Reporter']]) is None
+    assert recognize_chyron([['Jane', 'Doe', 'Joe', 'Bloggs', 'Ann', 'Smith'], ['Reporters']]) is None
+
+
+def test_rules_spell_like_the_model(checkpoint):
+    torch = pytest.importorskip('torch')
+    from transformers import pipeline
+    from transformers.pipelines.token_classification import AggregationStrategy
+
+    tagger = pipeline('token-classification', model=checkpoint, aggregation_strategy='first')
+    label2id = tagger.model.config.label2id
+    with open(DATA_DIR / 'rfb_test.json') as f:
+        rows = [row for row in map(json.loads, f) if row['tokens'][0] == 'chyron']
+    accepted = respelled = 0
+    for row in rows:
+        lines = [words for _, words in gold_spans(row['tokens'][1:], row['labels'][1:])]
+        pairs = recognize_chyron(lines)
+        if pairs is None:
+            continue
+        accepted += 1
+        # the model path, had the model tagged the name as the filler and the title as the role
+        name, title = lines
+        text = ' '.join(['chyron'] + name + title)
+        line_ends = list(accumulate(len(' '.join(line)) + 1 for line in (['chyron'], name, title)))
+        model_inputs = next(iter(tagger.preprocess(text)))
+        logits = torch.full((1, model_inputs['input_ids'].shape[1], len(label2id)), -10.0)
+        previous = 0
+        for pos, (start, end) in enumerate(model_inputs['offset_mapping'][0].tolist()):
+            line = bisect_right(line_ends, start)
+            if end > start and line > 0:
+                label = f"{'B' if line != previous else 'I'}-{'FILL' if line == 1 else 'ROLE'}"
+                logits[0, pos, label2id[label]] = 10.0
+                previous = line
+            elif end > start:
+                logits[0, pos, label2id['O']] = 10.0
+        entities = tagger.postprocess([{**model_inputs, 'logits': logits}], AggregationStrategy.FIRST)
+        tagged = parse_sequence_tags([(entity['entity_group'], entity['word']) for entity in entities], 'chyron')
+        assert respell_pairs(tagger, pairs) == tagged
+        respelled += pairs != tagged
+    assert accepted >= 10 and respelled > 0
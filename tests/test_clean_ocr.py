@@ -0,0 +1,51 @@
+"""
+Regression tests for `clean_ocr` against the original (pre-compilation, line-by-line) implementation
+"""
+
+import random
+
+from tests.helpers import CLEAN_OCR_NOISE, legacy_clean_ocr, load_sequences
+from utils.clean_ocr import clean_ocr, clean_ocr_batch, clean_ocr_lines
+
+
+def regression_corpus(size=500, seed=0):
+    """
+    Builds multi-line OCR-like documents from `model_in_data` sequences, with merged words, symbol-only lines,
+    years, non-ASCII characters and odd whitespace mixed in.
+    """
+    rng = random.Random(seed)
+    sequences = [tokens for split in ('train', 'val', 'test') for _, tokens in load_sequences(split)]
+    corpus = ['', '\n', '&', '& &\n-', 'A & B', '1999', '&\n2001', 'JohnSmithProducer', 'Dir.,Health Services']
+    for _ in range(size):
+        words = [w for tokens in rng.sample(sequences, rng.randint(1, 4)) for w in tokens]
+        lines, line = [], []
+        for word in words:
+            if rng.random() < 0.1:
+                line.append(rng.choice(CLEAN_OCR_NOISE))
+            if line and rng.random() < 0.1:
+                # merge with the previous word, as OCR often does
+                line[-1] += rng.choice(['', ',', '.']) + word
+            else:
+                line.append(word)
+            if rng.random() < 0.25:
+                lines.append(' '.join(line))
+                line = []
+        lines.append(' '.join(line))
+        corpus.append('\n'.join(lines))
+    return corpus
+
+
+def test_clean_ocr_matches_legacy():
+    for text_document in regression_corpus():
+        assert clean_ocr(text_document) == legacy_clean_ocr(text_document), repr(text_document)
+
+
+def test_clean_ocr_batch():
+    corpus = regression_corpus(size=50, seed=1)
+    assert clean_ocr_batch(corpus) == [legacy_clean_ocr(text_document) for text_document in corpus]
+
+
+def test_clean_ocr_lines():
+    assert clean_ocr_lines('Jane Doe\n--- | ---\nReporter, WGBH') == [['Jane', 'Doe'], ['Reporter,', 'WGBH']]
+    for text_document in regression_corpus(size=50, seed=2):
+        assert [word for line in clean_ocr_lines(text_document) for word in line] == clean_ocr(text_document)
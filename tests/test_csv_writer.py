@@ -0,0 +1,23 @@
+"""
+Tests for CSV serialization of role-filler pairs, against the pandas output the app used to produce
+"""
+
+import pytest
+
+from utils.csv_writer import role_filler_csv
+
+pd = pytest.importorskip('pandas')
+
+
+@pytest.mark.parametrize(
+    "pairs",
+    [
+        [{'Role': 'Director', 'Filler': 'Joe Bloggs'}],
+        [{'Role': '', 'Filler': 'Jane Doe'}, {'Role': 'Audio', 'Filler': ''}],
+        [{'Role': 'Dir., Health Services', 'Filler': 'Jane "JD" Doe'},
+         {'Role': 'Producer\nDirector', 'Filler': 'Müller, O\'Brien & Co.'},
+         {'Role': ' leading space', 'Filler': 'trailing\r'}],
+    ]
+)
+def test_matches_pandas(pairs):
+    assert role_filler_csv(pairs) == pd.DataFrame.from_dict(pairs).to_csv()
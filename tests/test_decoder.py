@@ -0,0 +1,41 @@
+"""
+Tests for the fast decoder, which must give the same results as the HuggingFace pipeline
+"""
+
+import random
+
+from tests.helpers import OCRSampler, load_sequences
+from utils.clean_ocr import clean_ocr
+from utils.model import RFBModel
+from utils.rfb import bind_role_fillers_batch, parse_sequence_tags
+
+
+def test_fast_decoder_matches_pipeline(checkpoint):
+    pipeline_tagger = RFBModel(checkpoint).tagger
+    fast_tagger = RFBModel(checkpoint, decoder='fast').tagger
+    inputs = [f'{scene_type} {" ".join(tokens)}' for scene_type, tokens in load_sequences('test')]
+    # OCR-like noise, punctuation and out-of-vocabulary characters
+    sampler = OCRSampler(noise=0.3, rng=random.Random(0))
+    for scene_type in ['chyron', 'credits'] * 20:
+        inputs.append(f'{scene_type} {" ".join(clean_ocr(sampler.text(sampler.words(scene_type))))}')
+    inputs += ["credits Producer ½ Jane Doe , don't", 'chyron']
+
+    for batch_size in (1, 8):
+        assert fast_tagger(inputs, batch_size=batch_size) == pipeline_tagger(inputs, batch_size=batch_size)
+    assert fast_tagger(inputs[0]) == pipeline_tagger(inputs[0])
+
+    sequences = load_sequences('test')
+    ocr_results = [' '.join(tokens) for _, tokens in sequences]
+    scene_types = [scene_type for scene_type, _ in sequences]
+    # windowed sequences too
+    for window_size in (None, 16):
+        assert bind_role_fillers_batch(ocr_results, scene_types, clf=fast_tagger, window_size=window_size) == \
+               bind_role_fillers_batch(ocr_results, scene_types, clf=pipeline_tagger, window_size=window_size)
+
+
+def test_parse_sequence_tags_repeated_roles():
+    phrases = [('ROLE', 'Producer'), ('FILL', 'Jane Doe'), ('ROLE', 'Director'), ('FILL', 'Joe Bloggs'),
+               ('ROLE', 'Producer'), ('FILL', 'John Smith'), ('ROLE', 'Editor')]
+    assert parse_sequence_tags(phrases, 'credits') == [
+        {'Role': 'Producer', 'Filler': 'Jane Doe'}, {'Role': 'Producer', 'Filler': 'John Smith'},
+        {'Role': 'Director', 'Filler': 'Joe Bloggs'}, {'Role': 'Editor', 'Filler': ''}]
@@ -0,0 +1,23 @@
+"""
+Tests for near-duplicate detection across consecutive frames
+"""
+
+from utils.dedup import RunDeduplicator, is_near_duplicate
+
+
+def test_is_near_duplicate():
+    assert is_near_duplicate('Jane Doe Reporter', 'Jane Doe Reporter', 1.0)
+    assert is_near_duplicate('Jane Doe Reporter', 'Jane Doc Reporter', 0.9)
+    assert not is_near_duplicate('Jane Doe Reporter', 'Joe Bloggs Anchor', 0.9)
+
+
+def test_run_deduplicator():
+    dedup = RunDeduplicator(0.9)
+    assert dedup.match('I', 'Jane Doe Reporter') is None
+    dedup.start('I', 'Jane Doe Reporter', 0)
+    assert dedup.match('I', 'Jane Doc Reporter') == 0
+    # a different label ends the run
+    assert dedup.match('N', 'Jane Doe Reporter') is None
+    dedup.reset()
+    assert dedup.match('I', 'Jane Doe Reporter') is None
+    assert dedup.skipped == 1
@@ -0,0 +1,49 @@
+"""
+Tests for the layer-pruned student of the distillation mode of `model/run_ner.py`
+"""
+
+import pytest
+
+from utils.model import RFBModel
+
+torch = pytest.importorskip('torch')
+run_ner = pytest.importorskip('model.run_ner')
+
+
+def test_select_student_layers():
+    assert run_ner.select_student_layers(12, 4) == [0, 4, 7, 11]
+    assert run_ner.select_student_layers(12, 1) == [11]
+    with pytest.raises(ValueError):
+        run_ner.select_student_layers(2, 3)
+
+
+def test_build_student(checkpoint, tmp_path):
+    from transformers import AutoModelForTokenClassification, AutoTokenizer
+
+    teacher = AutoModelForTokenClassification.from_pretrained(checkpoint)
+    student = run_ner.build_student(teacher, [1])
+    assert student.config.num_hidden_layers == 1
+    teacher_state, student_state = teacher.state_dict(), student.state_dict()
+    for key, value in student_state.items():
+        teacher_key = key.replace('.layer.0.', '.layer.1.')
+        assert torch.equal(value, teacher_state[teacher_key]), key
+
+    # the saved student is a drop-in replacement for the app's tagger
+    student.save_pretrained(tmp_path)
+    AutoTokenizer.from_pretrained(checkpoint).save_pretrained(tmp_path)
+    assert isinstance(RFBModel(str(tmp_path)).tagger('chyron Jane Doe Producer'), list)
+
+
+def test_distillation_loss():
+    torch.manual_seed(0)
+    logits = torch.randn(2, 5, 3)
+    mask = torch.tensor([[1, 1, 1, 0, 0], [1, 1, 1, 1, 1]])
+    gold_loss = torch.tensor(0.7)
+    # a student matching the teacher has no soft loss
+    loss = run_ner.distillation_loss(logits, logits, gold_loss, mask, alpha=0.5)
+    assert torch.isclose(loss, gold_loss * 0.5, atol=1e-6)
+    # padding does not count
+    other = logits.clone()
+    other[0, 3:] = 0
+    assert run_ner.distillation_loss(other, logits, gold_loss, mask, alpha=1.0).abs() < 1e-6
+    assert run_ner.distillation_loss(torch.randn(2, 5, 3), logits, gold_loss, mask, alpha=1.0) > 0
@@ -0,0 +1,55 @@
+"""
+Tests for incremental re-runs, which skip TextDocuments already bound by an earlier view of the app
+"""
+
+import json
+
+from mmif import AnnotationTypes, DocumentTypes, Mmif
+
+from tests.helpers import StubTagger, count_documents, generate_mmif
+
+
+def rfb_views(mmif):
+    return [view for view in mmif.views if 'role-filler-binder' in view.metadata.app]
+
+
+def test_incremental_rerun(checkpoint):
+    from app import RoleFillerBinder
+    from utils.model import rfb_model
+
+    mmif_json = generate_mmif(30, seed=2)
+    app = RoleFillerBinder()
+    rfb_model.set_tagger(StubTagger(checkpoint))
+    try:
+        first = Mmif(app.annotate(mmif_json, incremental=['true']))
+        assert len(rfb_views(first)) == 1
+        num_bound = len(list(rfb_views(first)[0].get_annotations(AnnotationTypes.Alignment)))
+        assert num_bound == count_documents(mmif_json)
+
+        # nothing new: no view is added, even with other batching parameters
+        rerun = Mmif(app.annotate(first.serialize(), incremental=['true'], batchSize=['4']))
+        assert len(list(rerun.views)) == len(list(first.views))
+        # other results are expected with other result-affecting parameters
+        rerun = Mmif(app.annotate(first.serialize(), incremental=['true'], windowSize=['16']))
+        assert len(list(rfb_views(rerun)[-1].get_annotations(AnnotationTypes.Alignment))) == num_bound
+        # and without the incremental mode, everything is processed again
+        rerun = Mmif(app.annotate(first.serialize()))
+        assert len(list(rfb_views(rerun)[-1].get_annotations(AnnotationTypes.Alignment))) == num_bound
+
+        # a TextDocument added by a later OCR run is the only one processed
+        tp_id = next(tp.long_id for tp in first['v_0'].get_annotations(AnnotationTypes.TimePoint)
+                     if tp.get('label') == 'I')
+        ocr_view = first.new_view()
+        ocr_view.metadata.app = 'http://apps.clams.ai/some-ocr/v1'
+        td = ocr_view.new_textdocument('Jane Doe\nProducer')
+        ocr_view.new_annotation(AnnotationTypes.Alignment, source=tp_id, target=td.long_id)
+        rerun = Mmif(app.annotate(first.serialize(), incremental=['true']))
+    finally:
+        rfb_model.set_tagger(None)
+    new_view = rfb_views(rerun)[-1]
+    assert [alignment.get('source') for alignment in new_view.get_annotations(AnnotationTypes.Alignment)] == \
+           [td.long_id]
+    assert len(list(new_view.get_annotations(DocumentTypes.TextDocument))) == 1
+    metadata = json.loads(new_view.metadata.serialize())
+    assert metadata['previousViews'] == [rfb_views(first)[0].id]
+    assert metadata['skippedBoundDocuments'] == num_bound
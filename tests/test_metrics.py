@@ -0,0 +1,78 @@
+"""
+Tests for the Prometheus text exposition of stage metrics
+"""
+
+from tests.helpers import StubTagger
+from utils.batching import TokenBudgetBatcher
+from utils.metrics import (BATCH_PADDED_TOKENS, BATCH_REAL_TOKENS, BATCHES, MICROBATCH_ITEMS, Counter, Gauge,
+                           Histogram, StageTimer, expose_metrics)
+from utils.microbatch import MicroBatcher
+from utils.rfb import tag_inputs
+
+
+def test_histogram_exposition():
+    histogram = Histogram("test_seconds", "Test histogram.", (0.1, 1.0), labelnames=("stage",))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value, stage="parse")
+    assert histogram.expose() == [
+        '# HELP test_seconds Test histogram.',
+        '# TYPE test_seconds histogram',
+        'test_seconds_bucket{stage="parse",le="0.1"} 2',
+        'test_seconds_bucket{stage="parse",le="1"} 3',
+        'test_seconds_bucket{stage="parse",le="+Inf"} 4',
+        'test_seconds_sum{stage="parse"} 3.65',
+        'test_seconds_count{stage="parse"} 4',
+    ]
+
+
+def test_counter_exposition():
+    counter = Counter("test_total", "Test counter.", labelnames=("scene",))
+    counter.inc(scene="credits")
+    counter.inc(2, scene="chyron")
+    assert counter.expose()[2:] == ['test_total{scene="chyron"} 2', 'test_total{scene="credits"} 1']
+    unlabeled = Counter("test_pairs_total", "Test counter.")
+    unlabeled.inc(5)
+    assert unlabeled.expose()[2:] == ['test_pairs_total 5']
+
+
+def test_gauge_exposition():
+    gauge = Gauge("test_depth", "Test gauge.")
+    assert gauge.expose() == ['# HELP test_depth Test gauge.', '# TYPE test_depth gauge']
+    gauge.set(3)
+    assert gauge.expose()[2:] == ['test_depth 3']
+    # a sampled value is read again each time it is exposed
+    items = []
+    gauge.set_function(lambda: len(items))
+    items.extend(range(5))
+    assert gauge.expose()[2:] == ['test_depth 5']
+
+
+def test_stage_timer():
+    timer = StageTimer()
+    for _ in range(3):
+        with timer.stage("clean_ocr"):
+            pass
+    with timer.stage("csv"):
+        pass
+    assert list(timer.summary()) == ["clean_ocr", "csv"]
+    timer.observe()
+    # one observation per stage and request, however many times the stage was entered
+    assert 'rfb_stage_seconds_count{stage="clean_ocr"}' in expose_metrics()
+
+
+def test_batch_counters(checkpoint):
+    batches, real, padded = BATCHES.total(), BATCH_REAL_TOKENS.total(), BATCH_PADDED_TOKENS.total()
+    batcher = TokenBudgetBatcher(max_batch_size=2)
+    inputs = ['chyron Jane Doe', 'credits Director Joe Bloggs Producer Jane Doe', 'chyron Joe']
+    tag_inputs(StubTagger(checkpoint), inputs, batcher)
+    stats = batcher.stats()
+    assert BATCHES.total() - batches == stats['batches']
+    assert BATCH_REAL_TOKENS.total() - real == stats['realTokens']
+    assert BATCH_PADDED_TOKENS.total() - padded == stats['paddedTokens']
+
+    items = MICROBATCH_ITEMS.total()
+    MicroBatcher(lambda inputs: inputs, max_batch_size=4).map(list(range(6)))
+    assert MICROBATCH_ITEMS.total() - items == 6
+    exposed = expose_metrics()
+    assert 'rfb_batch_padded_tokens_total ' in exposed and 'rfb_microbatches_total ' in exposed
+    assert 'rfb_microbatch_queue_depth 0\n' in exposed and 'rfb_microbatch_max_batch_size 4\n' in exposed
@@ -0,0 +1,87 @@
+"""
+Tests for cross-request micro-batching
+"""
+
+import threading
+import time
+
+import pytest
+
+from tests.helpers import load_sequences
+from utils.microbatch import MicroBatcher
+
+
+def test_concurrent_submissions_share_batches():
+    batch_sizes = []
+
+    def run_batch(items):
+        batch_sizes.append(len(items))
+        return [item * 2 for item in items]
+
+    batcher = MicroBatcher(run_batch, max_batch_size=8, max_wait_ms=200)
+    results = {}
+    barrier = threading.Barrier(4)
+
+    def request(idx):
+        barrier.wait()
+        results[idx] = batcher.map(list(range(idx * 10, idx * 10 + 3)))
+
+    threads = [threading.Thread(target=request, args=(idx,)) for idx in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # every request gets back its own results, in order
+    assert results == {idx: [item * 2 for item in range(idx * 10, idx * 10 + 3)] for idx in range(4)}
+    # 12 items from 4 requests fit in 2 batches of at most 8
+    assert sum(batch_sizes) == 12 and max(batch_sizes) <= 8 and len(batch_sizes) < 4
+    stats = batcher.stats()
+    assert stats['items'] == 12 and stats['batches'] == len(batch_sizes) and stats['queueDepth'] == 0
+    assert 0 < stats['batchFillRatio'] <= 1
+
+
+def test_flush_after_max_wait():
+    batcher = MicroBatcher(lambda items: items, max_batch_size=100, max_wait_ms=20)
+    start = time.perf_counter()
+    assert batcher.map(['a']) == ['a']
+    # a lone item does not wait for a full batch
+    assert time.perf_counter() - start < 5
+    assert batcher.stats()['maxWaitMs'] >= 15
+
+
+def test_errors_reach_every_caller():
+    def run_batch(items):
+        raise ValueError("broken model")
+
+    batcher = MicroBatcher(run_batch, max_batch_size=4, max_wait_ms=1)
+    futures = batcher.submit([1, 2, 3])
+    for future in futures:
+        with pytest.raises(ValueError):
+            future.result()
+    # the consumer keeps serving after a failed batch
+    batcher.run_batch = lambda items: items
+    assert batcher.map([4]) == [4]
+
+
+def test_missing_results_fail_the_batch():
+    batcher = MicroBatcher(lambda items: items[:-1], max_batch_size=4, max_wait_ms=50)
+    futures = batcher.submit([1, 2, 3])
+    # no caller is left waiting on a result that never comes
+    for future in futures:
+        with pytest.raises(RuntimeError):
+            future.result(timeout=5)
+
+
+def test_queued_tagging_matches_direct(checkpoint):
+    pytest.importorskip('torch')
+    from transformers import pipeline
+    from utils.batching import TokenBudgetBatcher
+    from utils.rfb import bind_role_fillers_batch, tag_inputs
+
+    tagger = pipeline('token-classification', model=checkpoint, aggregation_strategy='first')
+    sequences = load_sequences('test')[:20]
+    ocr_results = [' '.join(tokens) for _, tokens in sequences]
+    scene_types = [scene_type for scene_type, _ in sequences]
+    queue = MicroBatcher(lambda inputs: tag_inputs(tagger, inputs, TokenBudgetBatcher()), max_batch_size=8)
+    assert bind_role_fillers_batch(ocr_results, scene_types, clf=tagger, queue=queue) == \
+           bind_role_fillers_batch(ocr_results, scene_types, clf=tagger, batch_size=1)
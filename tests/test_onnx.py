@@ -0,0 +1,56 @@
+"""
+Tests for the ONNX Runtime inference backend
+"""
+
+import multiprocessing
+import os
+
+import pytest
+
+from tests.helpers import load_sequences
+from utils.model import ONNX_EXPORT_MARKER, RFBModel, export_onnx
+from utils.rfb import bind_role_fillers_batch
+
+pytest.importorskip('optimum.onnxruntime')
+
+
+def test_onnx_matches_pytorch(checkpoint, tmp_path):
+    pytorch_tagger = RFBModel(checkpoint, backend='pytorch').tagger
+    onnx_tagger = RFBModel(checkpoint, backend='onnx', onnx_dir=str(tmp_path)).tagger
+    sequences = load_sequences('test')
+    ocr_results = [' '.join(tokens) for _, tokens in sequences]
+    scene_types = [scene_type for scene_type, _ in sequences]
+
+    pytorch_entities = pytorch_tagger([f'{s} {o}' for s, o in zip(scene_types, ocr_results)], batch_size=8)
+    onnx_entities = onnx_tagger([f'{s} {o}' for s, o in zip(scene_types, ocr_results)], batch_size=8)
+    for expected, actual in zip(pytorch_entities, onnx_entities):
+        assert [(e['entity_group'], e['word'], e['start'], e['end']) for e in actual] == \
+               [(e['entity_group'], e['word'], e['start'], e['end']) for e in expected]
+        assert [e['score'] for e in actual] == pytest.approx([e['score'] for e in expected], abs=1e-4)
+
+    assert bind_role_fillers_batch(ocr_results, scene_types, clf=onnx_tagger) == \
+           bind_role_fillers_batch(ocr_results, scene_types, clf=pytorch_tagger)
+
+
+def test_onnx_export_is_cached(checkpoint, tmp_path):
+    RFBModel(checkpoint, backend='onnx', onnx_dir=str(tmp_path)).load()
+    exports = [path for path in tmp_path.iterdir() if path.is_dir()]
+    modified = (exports[0] / 'model.onnx').stat().st_mtime_ns
+    RFBModel(checkpoint, backend='onnx', onnx_dir=str(tmp_path)).load()
+    assert [path for path in tmp_path.iterdir() if path.is_dir()] == exports
+    assert len(exports) == 1 and (exports[0] / 'model.onnx').stat().st_mtime_ns == modified
+
+
+def test_onnx_export_concurrent_and_incomplete(checkpoint, tmp_path):
+    # workers loading the backend at the same time all end up with the same export
+    ctx = multiprocessing.get_context('fork')
+    with ctx.Pool(2) as pool:
+        export_dirs = pool.starmap(export_onnx, [(checkpoint, str(tmp_path))] * 2)
+    assert export_dirs[0] == export_dirs[1]
+    assert [path.name for path in tmp_path.iterdir() if path.is_dir()] == [os.path.basename(export_dirs[0])]
+
+    # an export interrupted before it was marked complete is done again
+    os.remove(os.path.join(export_dirs[0], ONNX_EXPORT_MARKER))
+    os.remove(os.path.join(export_dirs[0], 'model.onnx'))
+    assert export_onnx(checkpoint, str(tmp_path)) == export_dirs[0]
+    assert os.path.exists(os.path.join(export_dirs[0], 'model.onnx'))
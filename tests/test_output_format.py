@@ -0,0 +1,37 @@
+"""
+Tests for the output formats of the app (the `outputFormat` runtime parameter)
+"""
+
+from mmif import AnnotationTypes, DocumentTypes, Mmif
+
+from tests.helpers import OUTPUT_FORMATS, StubTagger, generate_mmif, read_pairs
+
+
+def test_output_formats_hold_the_same_pairs(checkpoint):
+    from app import RoleFillerBinder
+    from utils.model import rfb_model
+
+    mmif_json = generate_mmif(30, seed=3)
+    app = RoleFillerBinder()
+    rfb_model.set_tagger(StubTagger(checkpoint))
+    try:
+        outputs = {output_format: Mmif(app.annotate(mmif_json, outputFormat=[output_format]))
+                   for output_format in OUTPUT_FORMATS}
+        # the incremental mode recognizes the documents bound in every format
+        reruns = {output_format: Mmif(app.annotate(mmif.serialize(), outputFormat=[output_format],
+                                                   incremental=['true']))
+                  for output_format, mmif in outputs.items()}
+    finally:
+        rfb_model.set_tagger(None)
+    pairs = {output_format: sorted(read_pairs(mmif, output_format)) for output_format, mmif in outputs.items()}
+    assert pairs['csv']
+    assert pairs['annotations'] == pairs['csv']
+    assert pairs['document'] == pairs['csv']
+
+    annotations_view = outputs['annotations'].views.get_last_contentful_view()
+    assert not list(annotations_view.get_annotations(DocumentTypes.TextDocument))
+    assert not list(annotations_view.get_annotations(AnnotationTypes.Alignment))
+    document_view = outputs['document'].views.get_last_contentful_view()
+    assert len(list(document_view.get_annotations(DocumentTypes.TextDocument))) == 1
+    for output_format, mmif in reruns.items():
+        assert len(list(mmif.views)) == len(list(outputs[output_format].views))
@@ -0,0 +1,74 @@
+"""
+Tests for the chunked, multiprocess preparation of the training data
+"""
+
+import pandas as pd
+import pytest
+from sklearn.model_selection import train_test_split
+
+from tests.helpers import DATA_DIR, load_sequences
+from utils.prepare_data import get_labels, get_tokens, prepare
+
+TAGS = {'B-ROLE': 'BR', 'I-ROLE': 'IR', 'B-FILL': 'BF', 'I-FILL': 'IF'}
+
+
+@pytest.fixture
+def annotation_csv(tmp_path):
+    """An annotation export rebuilt from all the splits of `model_in_data`."""
+    rows = []
+    for split in ('train', 'val', 'test'):
+        split_labels = pd.read_json(DATA_DIR / f'rfb_{split}.json', lines=True)['labels']
+        for guid, ((scene_type, tokens), labels) in enumerate(zip(load_sequences(split), split_labels)):
+            if any('@' in token for token in tokens):
+                continue
+            annotation = ' '.join(f'{token}@{TAGS[label]}:{idx}' if label in TAGS else f'{token}@{label}'
+                                  for idx, (token, label) in enumerate(zip(tokens, labels[1:])))
+            rows.append({'guid': f'{split}-{guid}', 'scene_label': scene_type, 'cleaned_text': ' '.join(tokens),
+                         'labels': annotation})
+    path = tmp_path / 'annotations.csv'
+    pd.DataFrame(rows).to_csv(path, index=False)
+    return path
+
+
+def in_memory_splits(path):
+    """The splits as the original, in-memory version of `prepare_data.py` wrote them."""
+    original_df = pd.read_csv(path)
+    tokens = (original_df['scene_label'] + " " + original_df['cleaned_text']).map(get_tokens)
+    labels = [['O'] + label_seq for label_seq in original_df['labels'].map(get_labels).tolist()]
+    output_df = pd.DataFrame(data={"tokens": tokens, "labels": labels})
+    train, val = train_test_split(output_df, test_size=0.2, random_state=42)
+    val, test = train_test_split(val, test_size=0.5, random_state=42)
+    return {split: df.to_json(orient='records', lines=True) for split, df in zip(('train', 'val', 'test'),
+                                                                                 (train, val, test))}
+
+
+def test_prepare_matches_in_memory_splits(annotation_csv, tmp_path):
+    expected = in_memory_splits(annotation_csv)
+    # the last setting spools to many more buckets than it keeps open
+    for chunk_size, workers, bucket_size, max_open_buckets in ((100000, 1, 100000, 64), (37, 2, 50, 64),
+                                                               (37, 1, 5, 3)):
+        out_dir = tmp_path / f'out-{workers}-{bucket_size}'
+        report = prepare(str(annotation_csv), str(out_dir), chunk_size=chunk_size, workers=workers,
+                         bucket_size=bucket_size, max_open_buckets=max_open_buckets)
+        assert report['train'] + report['val'] + report['test'] == len(pd.read_csv(annotation_csv))
+        assert report['rows_per_second'] > 0
+        for split in ('train', 'val', 'test'):
+            assert (out_dir / f'rfb_{split}.json').read_text() == expected[split]
+
+
+def test_prepare_parquet(annotation_csv, tmp_path):
+    prepare(str(annotation_csv), str(tmp_path / 'json'), chunk_size=50, bucket_size=40)
+    prepare(str(annotation_csv), str(tmp_path / 'parquet'), output_format='parquet', chunk_size=50, bucket_size=40)
+    for split in ('train', 'val', 'test'):
+        assert pd.read_parquet(tmp_path / 'parquet' / f'rfb_{split}.parquet').applymap(list).to_dict('records') == \
+               pd.read_json(tmp_path / 'json' / f'rfb_{split}.json', lines=True).to_dict('records')
+
+
+def test_prepare_rejects_misaligned_rows(tmp_path):
+    path = tmp_path / 'bad.csv'
+    rows = [{'guid': guid, 'scene_label': 'chyron', 'cleaned_text': 'Jane Doe Producer',
+             'labels': 'Jane@BF:0 Doe@IF:1 Producer@BR:2'} for guid in range(10)]
+    rows[7]['labels'] = 'Jane@BF:0 Doe@IF:1'
+    pd.DataFrame(rows).to_csv(path, index=False)
+    with pytest.raises(AssertionError, match='in row 7'):
+        prepare(str(path), str(tmp_path / 'out'), workers=2)
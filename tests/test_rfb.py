@@ -93,3 +93,43 @@ def test_parse_credits(test_input, expected):
 
     """
     assert parse_sequence_tags(test_input, 'credits') == expected
+
+
+def test_batched_matches_per_document(checkpoint):
+    import random
+
+    from tests.helpers import load_sequences
+    from utils.batching import TokenBudgetBatcher
+    from utils.model import RFBModel
+    from utils.rfb import bind_role_fillers, bind_role_fillers_batch
+
+    tagger = RFBModel(checkpoint).tagger
+    rng = random.Random(0)
+    sequences = load_sequences('test')
+    # short chyrons mixed with credits of many lines, so that batches pad short sequences to much longer ones
+    ocr_results, scene_types = [], []
+    for scene_type in ['chyron', 'credits'] * 15:
+        words = [word for _, tokens in rng.sample(sequences, 1 if scene_type == 'chyron' else rng.randint(2, 8))
+                 for word in tokens]
+        ocr_results.append(' '.join(words))
+        scene_types.append(scene_type)
+    lengths = [len(tagger.tokenizer(f"{scene_type} {ocr}")["input_ids"]) for ocr, scene_type in
+               zip(ocr_results, scene_types)]
+    assert max(lengths) > 4 * min(lengths) and max(lengths) <= 512
+    expected = [bind_role_fillers(ocr, scene_type, clf=tagger) for ocr, scene_type in zip(ocr_results, scene_types)]
+
+    assert bind_role_fillers_batch(ocr_results, scene_types, clf=tagger, batch_size=8) == expected
+    assert bind_role_fillers_batch(ocr_results, scene_types, clf=tagger,
+                                   batcher=TokenBudgetBatcher(max_tokens=1024, max_batch_size=16)) == expected
+
+
+def test_word_input_lengths(checkpoint):
+    from tests.helpers import load_sequences
+    from utils.model import RFBModel
+    from utils.rfb import input_lengths, word_input_lengths
+
+    tagger = RFBModel(checkpoint).tagger
+    sequences = [(scene_type, ' '.join(tokens)) for scene_type, tokens in load_sequences('test')[:200]]
+    assert word_input_lengths(tagger, *zip(*sequences)) == \
+           input_lengths(tagger, [f"{scene_type} {sequence}" for scene_type, sequence in sequences])
+    assert word_input_lengths(tagger, [], []) == []
@@ -0,0 +1,86 @@
+"""
+Tests for the incremental tagging of scrolling credit rolls
+"""
+
+import json
+
+from mmif import AnnotationTypes, Mmif
+
+from tests.helpers import StubTagger, generate_mmif, read_pairs
+from utils.alignment import get_annotations_of_type
+from utils.scrolling import ScrollTracker, context_spans, line_key, new_line_spans, roll_pairs, visible_pairs
+
+
+def test_new_line_spans():
+    previous = ['producer', 'janedoe', 'director', 'johnsmith']
+    # scrolled by two lines, with a different reading of a line kept
+    assert new_line_spans(previous, ['director', 'johnsmith', 'editor', 'alexlee']) == [(2, 4)]
+    assert new_line_spans(previous, ['director', 'j0hnsmith', 'editor']) == [(1, 3)]
+    assert new_line_spans(previous, previous) == []
+    # nothing in common
+    assert new_line_spans(previous, ['editor', 'alexlee']) is None
+    assert context_spans([(2, 3), (5, 6)], 8, 1) == [(1, 7)]
+    assert context_spans([(6, 8)], 8, 2) == [(4, 8)]
+    assert line_key(['Jane', 'DOE,']) == line_key(['jane', 'Doe'])
+
+
+def test_scroll_tracker():
+    frames = [['Producer'], ['Jane', 'Doe'], ['Director'], ['John', 'Smith'], ['Editor'], ['Alex', 'Lee']]
+    tracker = ScrollTracker(context=1)
+    assert tracker.plan(frames[:4]) is None
+    assert tracker.plan(frames[1:5]) == [(2, 4)]
+    # new lines with their context covering the whole frame are tagged in full
+    assert tracker.plan(frames[4:6]) is None
+    tracker.reset()
+    assert tracker.plan(frames[3:6]) is None
+    assert tracker.rolls == 2
+
+    pairs = [[{'Role': 'Producer', 'Filler': 'Jane Doe'}],
+             [{'Role': 'Producer', 'Filler': 'Jane Doe'}, {'Role': 'Director', 'Filler': 'John Smith'}]]
+    assert roll_pairs(pairs) == pairs[1]
+    # pairs of lines that scrolled out of the frame are not carried over
+    assert visible_pairs(pairs[1], frames[2:5]) == [pairs[1][1]]
+    assert visible_pairs([{'Role': 'Director', 'Filler': 'John Smith'}], [['DIRECTOR'], ['John', 'Smith,']])
+
+
+def test_scrolling_credits(checkpoint):
+    from app import RoleFillerBinder
+    from utils.model import rfb_model
+
+    mmif_json = generate_mmif(30, {'C': 1}, lengths={'credits': (60, 80)}, ocr_rate=1.0, run_length=10.0,
+                              scroll_lines=2, seed=4)
+    app = RoleFillerBinder()
+    rfb_model.set_tagger(StubTagger(checkpoint))
+    try:
+        output = Mmif(app.annotate(mmif_json, scrollingCredits=['true'], recordTimings=['true']))
+        untimed = Mmif(app.annotate(mmif_json, scrollingCredits=['true']))
+        annotated = Mmif(app.annotate(mmif_json, scrollingCredits=['true'], outputFormat=['annotations']))
+    finally:
+        rfb_model.set_tagger(None)
+    view = output.views.get_last_contentful_view()
+    report = json.loads(view.metadata.serialize())['scrollingCredits']
+    assert report['frames'] == 30
+    assert report['rolls'] == 1
+    assert report['incrementalFrames'] > 0
+    assert report['avoidedTokens'] == report['fullTokens'] - report['taggedTokens'] > 0
+    # the tokens are reported whether timings are recorded or not
+    untimed_report = json.loads(untimed.views.get_last_contentful_view().metadata.serialize())['scrollingCredits']
+    assert untimed_report == report
+
+    # every frame keeps its own pairs, those of the lines it shares with the previous frame included
+    frame_pairs = {}
+    for document, role, filler in read_pairs(output, 'csv'):
+        frame_pairs.setdefault(document, []).append((role, filler))
+    assert len(frame_pairs) == 30
+    # and the roll gets one deduplicated list over its frames, in a TimeFrame that binds no TextDocument
+    assert not get_annotations_of_type(view, AnnotationTypes.Annotation)
+    roll, = get_annotations_of_type(view, AnnotationTypes.TimeFrame)
+    assert roll.get('roll') == 1 and sorted(roll.get('documents')) == sorted(frame_pairs)
+    assert len(roll.get('targets')) == 30
+    pairs = [tuple(pair) for pair in roll.get('rollPairs')]
+    assert len(pairs) == len(set(pairs)) == len({pair for frame in frame_pairs.values() for pair in frame})
+    assert len(pairs) < sum(len(frame) for frame in frame_pairs.values())
+    # the Annotations of the frames hold the same pairs as the other output formats, and nothing of the roll
+    assert sorted(read_pairs(annotated, 'annotations')) == sorted(read_pairs(output, 'csv'))
+    assert all(annotation.get('roll') == 1 for annotation in
+               get_annotations_of_type(annotated.views.get_last_contentful_view(), AnnotationTypes.Annotation))
@@ -0,0 +1,42 @@
+"""
+Tests for the synthetic MMIF generator, and an end-to-end run of the app on its output with the stub tagger
+"""
+
+import json
+
+from mmif import AnnotationTypes, DocumentTypes, Mmif
+
+from tests.helpers import StubTagger, count_documents, generate_mmif
+
+
+def test_generate_mmif():
+    mmif_json = generate_mmif(50, {'C': 1}, lengths={'credits': (30, 40)}, ocr_rate=1.0, seed=3)
+    assert mmif_json == generate_mmif(50, {'C': 1}, lengths={'credits': (30, 40)}, ocr_rate=1.0, seed=3)
+    assert mmif_json != generate_mmif(50, {'C': 1}, lengths={'credits': (30, 40)}, noise=0.2, ocr_rate=1.0, seed=3)
+    mmif = Mmif(mmif_json)
+    timepoints = list(mmif['v_0'].get_annotations(AnnotationTypes.TimePoint))
+    assert len(timepoints) == 50
+    assert {tp.get('label') for tp in timepoints} == {'C'}
+    texts = [td.text_value for td in mmif['v_1'].get_annotations(DocumentTypes.TextDocument)]
+    assert len(texts) == 50
+    # frames of a run may read one character differently, e.g. a dropped space between two words
+    assert all(29 <= len(text.split()) <= 40 for text in texts)
+    assert count_documents(mmif_json) == 50
+
+
+def test_annotate_with_stub_tagger(checkpoint):
+    from app import RoleFillerBinder
+    from utils.model import rfb_model
+
+    mmif_json = generate_mmif(30, run_length=3.0, seed=1)
+    rfb_model.set_tagger(StubTagger(checkpoint))
+    try:
+        out = Mmif(RoleFillerBinder().annotate(mmif_json, recordTimings=['true']))
+    finally:
+        rfb_model.set_tagger(None)
+    rfb_view = out.get_view_by_id('v_2')
+    rfb_docs = list(rfb_view.get_annotations(DocumentTypes.TextDocument))
+    # every processed TextDocument has at least one word, so at least one pair
+    assert len(rfb_docs) == count_documents(mmif_json)
+    assert len(list(rfb_view.get_annotations(AnnotationTypes.Alignment))) == len(rfb_docs)
+    assert 'annotate' in json.loads(rfb_view.metadata.serialize())['timings']
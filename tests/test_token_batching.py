@@ -0,0 +1,38 @@
+"""
+Tests for the token budget batching and the throughput reporting of `model/run_ner.py`
+"""
+
+import random
+
+import pytest
+
+torch = pytest.importorskip('torch')
+run_ner = pytest.importorskip('model.run_ner')
+
+
+def test_token_budget_batch_sampler():
+    rng = random.Random(0)
+    lengths = [rng.randint(3, 40) for _ in range(500)] + [128]
+    sampler = run_ner.TokenBudgetBatchSampler(lengths, max_tokens=256, seed=1, chunk_size=100)
+    num_batches = len(sampler)
+    first_epoch = list(sampler)
+    assert len(first_epoch) == num_batches
+    assert sorted(idx for batch in first_epoch for idx in batch) == list(range(len(lengths)))
+    assert all(max(lengths[idx] for idx in batch) * len(batch) <= 256 for batch in first_epoch)
+    # far fewer padded tokens than batches of a fixed size in random order
+    padded = sum(max(lengths[idx] for idx in batch) * len(batch) for batch in first_epoch)
+    assert padded < 1.2 * sum(lengths)
+
+    second_epoch = list(sampler)
+    assert second_epoch != first_epoch
+    assert list(run_ner.TokenBudgetBatchSampler(lengths, max_tokens=256, seed=1, chunk_size=100)) == first_epoch
+    with pytest.raises(ValueError):
+        run_ner.TokenBudgetBatchSampler(lengths, max_tokens=100)
+
+
+def test_throughput_callback():
+    callback = run_ner.ThroughputCallback()
+    callback.count_batch({'input_ids': torch.ones(2, 4), 'attention_mask': torch.tensor([[1, 1, 1, 1], [1, 0, 0, 0]])})
+    stats = callback.stats()
+    assert stats['padding_ratio'] == 0.375
+    assert stats['real_tokens_per_second'] > 0
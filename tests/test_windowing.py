@@ -0,0 +1,75 @@
+"""
+Tests for sliding-window inference over sequences longer than the model's maximum input length
+"""
+
+import random
+
+import pytest
+
+from tests.helpers import load_sequences
+from utils.windowing import plan_windows, stitch_windows, window_text
+
+
+def word_entities(text, offset=0):
+    """One entity group per word, labeled from the word alone, with character offsets into the text."""
+    entities = []
+    for word in text.split():
+        start = text.index(word, offset)
+        offset = start + len(word)
+        entities.append({"entity_group": "ROLE" if word[0].isupper() else "FILL", "word": word,
+                         "start": start, "end": offset})
+    return entities
+
+
+def test_plan_windows():
+    assert plan_windows([1, 1, 1], max_tokens=8, overlap=2) == [(0, 3)]
+    assert plan_windows([2] * 10, max_tokens=8, overlap=4) == [(0, 4), (2, 6), (4, 8), (6, 10)]
+    assert plan_windows([2] * 10, max_tokens=8, overlap=0) == [(0, 4), (4, 8), (8, 10)]
+    # a word over the limit gets a window of its own, and windows always move forward
+    assert plan_windows([1, 20, 1], max_tokens=8, overlap=30) == [(0, 1), (1, 2), (2, 3)]
+
+
+def test_windows_cover_all_words():
+    rng = random.Random(0)
+    for _ in range(200):
+        lengths = [rng.randint(1, 5) for _ in range(rng.randint(1, 100))]
+        windows = plan_windows(lengths, max_tokens=16, overlap=rng.randint(0, 12))
+        assert windows[0][0] == 0 and windows[-1][1] == len(lengths)
+        for (start, end), (next_start, next_end) in zip(windows, windows[1:]):
+            assert start < next_start <= end < next_end
+        assert all(sum(lengths[start:end]) <= 16 for start, end in windows)
+
+
+def test_stitch_windows_matches_whole_sequence():
+    rng = random.Random(0)
+    sequences = load_sequences('test')
+    for _ in range(50):
+        scene_type = rng.choice(['credits', 'chyron'])
+        words = [word for _, tokens in rng.sample(sequences, 8) for word in tokens]
+        windows = plan_windows([len(word) for word in words], max_tokens=40, overlap=rng.randint(0, 20))
+        outputs = [word_entities(window_text(scene_type, words, window)) for window in windows]
+        expected = word_entities(f"{scene_type} {' '.join(words)}")
+        stitched = stitch_windows(scene_type, words, windows, outputs)
+        assert [(e["entity_group"], e["word"]) for e in stitched] == [(e["entity_group"], e["word"]) for e in expected]
+
+
+def test_windowed_inference(checkpoint):
+    pytest.importorskip('torch')
+    from transformers import pipeline
+    from utils.rfb import bind_role_fillers_batch
+
+    tagger = pipeline('token-classification', model=checkpoint, aggregation_strategy='first')
+    sequences = load_sequences('test')
+    short = [' '.join(tokens) for _, tokens in sequences[:10]]
+    scene_types = [scene_type for scene_type, _ in sequences[:10]]
+    # sequences under the window size are not affected by windowing
+    assert bind_role_fillers_batch(short, scene_types, clf=tagger, window_size=512) == \
+           bind_role_fillers_batch(short, scene_types, clf=tagger, window_size=None)
+
+    long_roll = ' '.join(word for _, tokens in sequences for word in tokens)
+    assert len(tagger.tokenizer(f"credits {long_roll}", verbose=False)["input_ids"]) > 512
+    results = bind_role_fillers_batch(short + [long_roll], scene_types + ['credits'], clf=tagger, window_size=64)
+    assert len(results) == 11
+    # with the whole roll tagged, bindings reach the last words of the roll, which truncation would drop
+    tail = set(long_roll.split()[-50:])
+    assert any(pair["Role"] in tail or pair["Filler"] in tail for pair in results[-1])
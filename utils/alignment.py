@@ -0,0 +1,48 @@
+"""
+Index of the TextDocuments aligned to TimePoints.
+
+mmif-python resolves every Alignment once when an MMIF is deserialized, and keeps the aligned annotations on both
+sides of it. The index reads those, only for TimePoints whose label the app processes, so that the lookup per
+TimePoint in `_annotate` is a dict lookup and unsupported TimePoints are never looked up at all. (A pass over the
+Alignment annotations themselves would resolve each of them a second time, which measured slower.)
+
+Annotation types are compared with `is_type` rather than `==`, as the version handling of `==` makes it the main cost
+of a pass over tens of thousands of annotations.
+"""
+
+from itertools import islice
+from typing import Dict, Iterable, List
+
+from mmif import Annotation, DocumentTypes, View
+from mmif.vocabulary.base_types import TypesBase
+
+
+def is_type(at_type: TypesBase, other: TypesBase) -> bool:
+    """Returns True if two annotation types are the same, regardless of their version, like `at_type == other`."""
+    return at_type.shortname == other.shortname and at_type.base_uri == other.base_uri
+
+
+def get_annotations_of_type(view: View, at_type: TypesBase) -> List[Annotation]:
+    """Returns the annotations of a type in a view, like `view.get_annotations(at_type)` without properties."""
+    return [annotation for annotation in view.annotations if is_type(annotation.at_type, at_type)]
+
+
+def index_aligned_text_documents(timepoints: Iterable[Annotation]) -> Dict[str, List[Annotation]]:
+    """
+    Maps TimePoints to the TextDocuments aligned to them, in one pass over the TimePoints.
+
+    Args:
+        timepoints (Iterable[Annotation]): The TimePoints to index, already filtered by label.
+
+    Returns:
+        Dict[str, List[Annotation]]: TextDocuments aligned to each TimePoint, in order of appearance of their
+            Alignments, by long id of the TimePoint. TimePoints without any aligned TextDocument are left out.
+    """
+    index = {}
+    for tp_ann in timepoints:
+        # `get_all_aligned` yields each Alignment followed by the annotation on its other side
+        aligned_tds = [aligned for aligned in islice(tp_ann.get_all_aligned(), 1, None, 2)
+                       if is_type(aligned.at_type, DocumentTypes.TextDocument)]
+        if aligned_tds:
+            index.setdefault(tp_ann.long_id, []).extend(aligned_tds)
+    return index
@@ -0,0 +1,73 @@
+"""
+Length-bucketed batching of sequences under a token budget.
+
+Chyrons are a handful of words while credit rolls can be hundreds, so fixed-size batches in input order would pad
+every chyron up to the longest credit roll of its batch. Instead, sequences are sorted by their subword length and
+cut into batches whose padded size (number of sequences times the longest sequence) stays under a token budget.
+"""
+
+import threading
+from typing import List, Optional
+
+
+class TokenBudgetBatcher:
+    """
+    Plans batches of sequences by subword length, and keeps count of real and padded tokens.
+
+    Args:
+        max_tokens (int): Maximum padded size of a batch, in subword tokens. A single sequence longer than this
+            still gets a batch of its own. None means no token budget.
+        max_batch_size (int): Maximum number of sequences in a batch. None means no limit.
+    """
+
+    def __init__(self, max_tokens: Optional[int] = None, max_batch_size: Optional[int] = None):
+        self.max_tokens = max_tokens
+        self.max_batch_size = max_batch_size
+        self.real_tokens = 0
+        self.padded_tokens = 0
+        self.batches = 0
+        self._lock = threading.Lock()
+
+    def plan(self, lengths: List[int]) -> List[List[int]]:
+        """
+        Groups sequences into batches.
+
+        Args:
+            lengths (List[int]): Subword length of each sequence.
+
+        Returns:
+            List[List[int]]: Batches of indices into `lengths`, sequences sorted by length within and across batches.
+        """
+        order = sorted(range(len(lengths)), key=lengths.__getitem__)
+        batches = []
+        batch = []
+        for idx in order:
+            # sequences come in increasing length, so the current one is the longest of the batch
+            if batch and ((self.max_batch_size and len(batch) >= self.max_batch_size)
+                          or (self.max_tokens and (len(batch) + 1) * lengths[idx] > self.max_tokens)):
+                batches.append(batch)
+                batch = []
+            batch.append(idx)
+        if batch:
+            batches.append(batch)
+
+        with self._lock:
+            for batch in batches:
+                self.real_tokens += sum(lengths[idx] for idx in batch)
+                self.padded_tokens += len(batch) * lengths[batch[-1]]
+            self.batches += len(batches)
+        return batches
+
+    @property
+    def padding_efficiency(self) -> float:
+        """Share of real (non-padding) tokens among all tokens of the planned batches, from 0 to 1."""
+        return self.real_tokens / self.padded_tokens if self.padded_tokens else 1.0
+
+    def stats(self) -> dict:
+        """Returns batch and token counts of all batches planned so far, and their padding efficiency."""
+        return {
+            "batches": self.batches,
+            "realTokens": self.real_tokens,
+            "paddedTokens": self.padded_tokens,
+            "paddingEfficiency": self.padding_efficiency,
+        }
@@ -0,0 +1,185 @@
+"""
+Memoization of role-filler binding results.
+
+OCR text recurs a lot in the archive (station IDs, recurring chyrons, identical credit cards across sampled frames),
+so results of `bind_role_fillers` are cached under (scene type, cleaned input sequence, model identity, variant),
+where the variant holds inference settings that change results without changing the model (e.g. window sizes).
+The cache has a bounded in-memory LRU tier and an optional on-disk tier (a SQLite file) that persists across
+restarts. Because the model identity is part of every key, switching to a different checkpoint never serves stale
+results; entries of the previous checkpoint are dropped as soon as a new model identity is seen. Entries of other
+variants of the same model are kept, so requests with different settings can share the cache.
+
+The cache is created before gunicorn forks its workers, and a SQLite connection must not be used by more than one
+process, so each process opens its own connection to the file on first use.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
+
+
+class RFBCache:
+    """
+    Two-tier (memory + optional disk) LRU cache for role-filler binding results.
+
+    Args:
+        max_size (int): Maximum number of entries kept in memory. Least recently used entries are evicted first.
+        cache_dir (str): Optional directory for the persistent on-disk tier.
+        max_disk_size (int): Maximum number of entries kept on disk. Oldest entries are evicted first.
+    """
+
+    DB_NAME = "rfb_cache.sqlite3"
+
+    def __init__(self, max_size: int = 10000, cache_dir: Optional[str] = None, max_disk_size: int = 1000000):
+        self.max_size = max_size
+        self.max_disk_size = max_disk_size
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._memory = OrderedDict()
+        self._model_id = None
+        self._disk_puts = 0
+        self._lock = threading.Lock()
+        self._db_path = None
+        self._connection = None
+        self._connection_pid = None
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._db_path = os.path.join(cache_dir, self.DB_NAME)
+            with sqlite3.connect(self._db_path) as db:
+                # lets worker processes read while another one writes
+                db.execute("PRAGMA journal_mode=WAL")
+                db.execute("CREATE TABLE IF NOT EXISTS bindings "
+                           "(key TEXT PRIMARY KEY, model TEXT, value TEXT, created INTEGER)")
+                db.execute("CREATE INDEX IF NOT EXISTS bindings_model ON bindings (model)")
+            db.close()
+
+    @property
+    def _db(self) -> Optional[sqlite3.Connection]:
+        """The connection of the current process to the disk tier, opened on first use in each process."""
+        if self._db_path is None:
+            return None
+        if self._connection_pid != os.getpid():
+            # a connection inherited from the parent process is left alone, as it is still the parent's
+            self._connection = sqlite3.connect(self._db_path, timeout=30, check_same_thread=False)
+            self._connection_pid = os.getpid()
+        return self._connection
+
+    @staticmethod
+    def make_key(scene_type: str, input_seq: str, model_id: str, variant: str = "") -> str:
+        """Builds a cache key from the scene type, the cleaned input sequence, the model identity and the variant."""
+        return hashlib.sha256(json.dumps([model_id, variant, scene_type, input_seq]).encode('utf-8')).hexdigest()
+
+    def get(self, scene_type: str, input_seq: str, model_id: str, variant: str = "") -> Optional[List[dict]]:
+        """
+        Looks up role-filler pairs for an input sequence.
+
+        Args:
+            scene_type (str): The scene type the sequence was read from.
+            input_seq (str): The cleaned input sequence.
+            model_id (str): Identity of the model; a new identity invalidates the entries of all others.
+            variant (str): Inference settings the result depends on, besides the model.
+
+        Returns:
+            Optional[List[dict]]: The cached role-filler pairs, or None on a cache miss.
+        """
+        key = self.make_key(scene_type, input_seq, model_id, variant)
+        with self._lock:
+            self._switch_model(model_id)
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return self._memory[key]
+            if self._db is not None:
+                row = self._db.execute("SELECT value FROM bindings WHERE key = ?", (key,)).fetchone()
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._put_memory(key, value)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return value
+            self.misses += 1
+            return None
+
+    def put(self, scene_type: str, input_seq: str, model_id: str, pairs: List[dict], variant: str = "") -> None:
+        """Stores role-filler pairs for an input sequence in both tiers."""
+        self.put_many([(scene_type, input_seq, pairs)], model_id, variant)
+
+    def put_many(self, entries: Sequence[Tuple[str, str, List[dict]]], model_id: str, variant: str = "") -> None:
+        """
+        Stores the role-filler pairs of many input sequences in both tiers, in a single transaction on disk.
+
+        Args:
+            entries (Sequence[Tuple[str, str, List[dict]]]): (scene type, cleaned input sequence, pairs) triples.
+            model_id (str): Identity of the model the pairs were found with.
+            variant (str): Inference settings the pairs depend on, besides the model.
+        """
+        if not entries:
+            return
+        rows = [(self.make_key(scene_type, input_seq, model_id, variant), pairs)
+                for scene_type, input_seq, pairs in entries]
+        with self._lock:
+            self._switch_model(model_id)
+            for key, pairs in rows:
+                self._put_memory(key, pairs)
+            if self._db is not None:
+                with self._db:
+                    self._db.executemany("INSERT OR REPLACE INTO bindings VALUES (?, ?, ?, strftime('%s', 'now'))",
+                                         [(key, model_id, json.dumps(pairs)) for key, pairs in rows])
+                trim = (self._disk_puts + len(rows)) // 1000 > self._disk_puts // 1000
+                self._disk_puts += len(rows)
+                if trim:
+                    self._trim_disk()
+
+    def _put_memory(self, key: str, pairs: List[dict]) -> None:
+        self._memory[key] = pairs
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_size:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _switch_model(self, model_id: str) -> None:
+        # entries of any other model can never be hit again, as the model identity is part of the key
+        if model_id == self._model_id:
+            return
+        self.evictions += len(self._memory)
+        self._memory.clear()
+        if self._db is not None:
+            deleted = self._db.execute("DELETE FROM bindings WHERE model != ?", (model_id,)).rowcount
+            self.evictions += max(deleted, 0)
+            self._trim_disk()
+        self._model_id = model_id
+
+    def _trim_disk(self) -> None:
+        deleted = self._db.execute("DELETE FROM bindings WHERE key NOT IN "
+                                   "(SELECT key FROM bindings ORDER BY created DESC LIMIT ?)",
+                                   (self.max_disk_size,)).rowcount
+        self._db.commit()
+        self.evictions += max(deleted, 0)
+
+    def clear(self) -> None:
+        """Empties both tiers of the cache."""
+        with self._lock:
+            self._memory.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM bindings")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        """Returns hit/miss/eviction counters and current sizes of the cache."""
+        with self._lock:
+            disk_size = self._db.execute("SELECT COUNT(*) FROM bindings").fetchone()[0] \
+                if self._db is not None else 0
+            return {
+                "hits": self.hits,
+                "diskHits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._memory),
+                "diskSize": disk_size,
+            }
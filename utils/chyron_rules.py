@@ -0,0 +1,79 @@
+"""
+Rule-based recognizer of trivially structured chyrons, used as a fast path in front of the model.
+
+Most chyrons show a person's name on one line and their title or affiliation on the next, e.g.
+
+    Leo Melamed
+    Chairman, Executive Cmte.
+
+The recognizer binds such chyrons directly, from the line structure of the OCR text (see `clean_ocr_lines`), the
+casing of the words and the length of the lines. Anything it is not confident about (more or fewer than two lines, a
+first line that does not look like a name, a second line that looks like one without any title word) is left to the
+model. The recognizer keeps the OCR words as they are; the app respells them as the model path does (see
+`respell_pairs`).
+"""
+
+import re
+from typing import List, Optional
+
+# a capitalized or all-caps word, possibly hyphenated or with an apostrophe (O'Neil, Smith-Jones), possibly followed
+# by a period (initials, abbreviated honorifics) or a comma (Olson, Principal)
+NAME_WORD_PATTERN = re.compile(r"[A-Z](?:[a-z]+|[A-Z]*)(?:['-][A-Z][a-zA-Z]*)*[.,]?")
+# honorifics that are part of a name on screen, lowercased and without trailing punctuation
+HONORIFICS = frozenset({'sen', 'rep', 'gov', 'dr', 'mr', 'mrs', 'ms', 'rev', 'gen', 'sgt', 'lt', 'col', 'hon', 'judge',
+                        'mayor', 'rabbi', 'imam', 'father'})
+# words that mark a line as a title or an affiliation rather than a name, lowercased and without trailing punctuation
+TITLE_WORDS = frozenset({
+    'president', 'vice', 'chairman', 'chairwoman', 'chair', 'chmn', 'director', 'dir', 'reporter', 'correspondent',
+    'anchor', 'editor', 'producer', 'secretary', 'sec', 'senator', 'representative', 'governor', 'mayor', 'member',
+    'professor', 'prof', 'manager', 'executive', 'exec', 'chief', 'officer', 'commissioner', 'administrator',
+    'spokesman', 'spokeswoman', 'spokesperson', 'attorney', 'counsel', 'analyst', 'author', 'economist', 'resident',
+    'candidate', 'founder', 'owner', 'teacher', 'student', 'principal', 'superintendent', 'coordinator', 'specialist',
+    'advisor', 'adviser', 'consultant', 'assistant', 'deputy', 'former', 'news', 'service', 'university', 'univ',
+    'college', 'school', 'department', 'dept', 'association', 'assn', 'council', 'committee', 'cmte', 'commission',
+    'company', 'corporation', 'corp', 'inc', 'institute', 'foundation', 'center', 'board', 'office', 'agency',
+    'bureau', 'hospital', 'party', 'union', 'league', 'club', 'group', 'exchange', 'times', 'post', 'journal',
+    'state', 'county', 'city', 'national', 'natl', 'federal', 'international', 'democrat', 'republican', 'of', 'for',
+    'the', 'and', '&',
+})
+
+
+def is_title_word(word: str) -> bool:
+    return word.rstrip('.,:;').lower() in TITLE_WORDS
+
+
+def is_name_line(words: List[str]) -> bool:
+    """Returns True if a line is two to four capitalized words, not counting a leading honorific, and no title word."""
+    if words and words[0].rstrip('.,').lower() in HONORIFICS:
+        words = words[1:]
+    if not 2 <= len(words) <= 4:
+        return False
+    return all(NAME_WORD_PATTERN.fullmatch(word) and not is_title_word(word) for word in words) \
+        and sum(len(word.rstrip('.,')) > 1 for word in words) >= 2
+
+
+def is_title_line(words: List[str]) -> bool:
+    """
+    Returns True if a line reads as a title or affiliation: up to twelve words, either one of them a title word or not
+    shaped like a name (e.g. a single word, or words in lowercase).
+    """
+    return 1 <= len(words) <= 12 and (any(is_title_word(word) for word in words) or not is_name_line(words))
+
+
+def recognize_chyron(lines: List[List[str]]) -> Optional[List[dict]]:
+    """
+    Binds a chyron of a name line followed by a title line, without the model.
+
+    Args:
+        lines (List[List[str]]): The cleaned words of each line of the OCR text, as returned by `clean_ocr_lines`.
+
+    Returns:
+        List[dict]: The role-filler pair of the chyron, as `parse_sequence_tags` returns it, or None if the chyron is
+            not trivially structured and must go through the model.
+    """
+    if len(lines) != 2:
+        return None
+    name, title = lines
+    if not is_name_line(name) or not is_title_line(title):
+        return None
+    return [{"Role": " ".join(title), "Filler": " ".join(name)}]
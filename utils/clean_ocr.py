@@ -1,44 +1,62 @@
 """
 Utility functions for cleaning OCR data.
 """
-from typing import List
+from typing import Iterable, List
 import re
 
+ALLOWABLE_CHARS = frozenset({'&'})
+
+# whitespace is inserted between punctuation-merged words ("Dir.,Health" -> "Dir., Health") and before a capital
+# letter that follows three lowercase letters ("ProducerJane" -> "Producer Jane")
+SEGMENT_PATTERN = re.compile(r"(?<=[A-Za-z][,.])(?=[A-Za-z])|(?<=[a-z]{3})(?=[A-Z])")
+# `\w` is exactly `str.isalnum` plus the underscore
+ALNUM_PATTERN = re.compile(r"[^\W_]")
+YEAR_PATTERN = re.compile(r"[12][0-9]{3}")
+
 
 def has_alnum(string: str) -> bool:
     """Returns True if the input string contains any alphanumeric characters."""
-    return any(char.isalnum() for char in string)
+    return ALNUM_PATTERN.search(string) is not None
 
 
 def has_alpha(string: str) -> bool:
     """Returns True if the input string contains any alpha characters."""
-    return any(char.isalpha() for char in string)
+    return string.isalpha() or any(map(str.isalpha, string))
 
 
 def contains_year(string: str) -> bool:
     """Returns True if the string contains a valid year from 1000-2999."""
-    return re.search(r"^[12][0-9]{3}$", string) is not None
+    return YEAR_PATTERN.fullmatch(string) is not None
 
 
 def segment_string(string: str):
     """Inserts whitespace in a string to segment improperly merged words"""
-    string = re.sub(r"(?<=[A-Za-z][,.])(?=[A-Za-z])", " ", string)
-    return re.sub(r"(?<=[a-z]{3})(?=[A-Z])", " ", string)
+    return SEGMENT_PATTERN.sub(" ", string)
 
 
-def clean_ocr(text_document: str) -> List[str]:
-    """Cleans ocr text document"""
-    allowable_chars = {r'&'}
+def clean_ocr_lines(text_document: str) -> List[List[str]]:
+    """Cleans ocr text document like `clean_ocr`, keeping the words of each line apart. Lines left empty are dropped."""
     cleaned = []
-    for line in text_document.split('\n'):
-        line = line.strip()
-        if not has_alnum(line):
-            continue
-        else:
-            line = segment_string(line)
-            line = [
-                w for w in line.split() if (len(w) > 1 and has_alpha(w)) or w in allowable_chars or contains_year(w)
-            ]
-        if line:
-            cleaned.extend(line)
+    # segmentation never spans a line break, so the whole document is segmented in one pass
+    for line in segment_string(text_document).split('\n'):
+        # same filter as `has_alpha` and `contains_year`, inlined as this is the hot loop
+        words = [
+            w for w in line.split()
+            if (len(w) > 1 and (w.isalpha() or any(map(str.isalpha, w))))
+            or w in ALLOWABLE_CHARS or (len(w) == 4 and YEAR_PATTERN.fullmatch(w) is not None)
+        ]
+        # a kept word other than `&` has letters or digits, which proves the line has some; otherwise the line must
+        # be checked, as lines without any alphanumeric characters are dropped entirely
+        if words and (any(w not in ALLOWABLE_CHARS for w in words) or has_alnum(line)):
+            cleaned.append(words)
     return cleaned
+
+
+def clean_ocr(text_document: str) -> List[str]:
+    """Cleans ocr text document"""
+    return [word for line in clean_ocr_lines(text_document) for word in line]
+
+
+def clean_ocr_batch(text_documents: Iterable[str]) -> List[List[str]]:
+    """Cleans many ocr text documents, returning the cleaned words of each in order"""
+    return [clean_ocr(text_document) for text_document in text_documents]
@@ -0,0 +1,32 @@
+"""
+Lightweight CSV serialization of role-filler pairs.
+
+The output is format-compatible with `pandas.DataFrame.from_dict(pairs).to_csv()`, which the app used before:
+a header row whose first (index) column is empty, then one row per pair prefixed with its 0-based index.
+"""
+import csv
+import io
+import os
+from typing import List, TextIO
+
+
+def write_role_filler_csv(pairs: List[dict], stream: TextIO) -> None:
+    """
+    Writes role-filler pairs as CSV rows to a text stream.
+
+    Args:
+        pairs (List[dict]): Role-filler pairs in format [{"Role": role, "Filler": filler}]
+        stream (TextIO): The stream to write to.
+    """
+    # columns in order of first appearance, as pandas does for a list of records
+    columns = list(dict.fromkeys(key for pair in pairs for key in pair))
+    writer = csv.writer(stream, lineterminator=os.linesep)
+    writer.writerow(["", *columns])
+    writer.writerows([idx, *(pair.get(column, "") for column in columns)] for idx, pair in enumerate(pairs))
+
+
+def role_filler_csv(pairs: List[dict]) -> str:
+    """Returns role-filler pairs as a CSV string."""
+    stream = io.StringIO()
+    write_role_filler_csv(pairs, stream)
+    return stream.getvalue()
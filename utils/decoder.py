@@ -0,0 +1,193 @@
+"""
+Decoding of token classification logits into entity groups, without the HuggingFace pipeline.
+
+The token classification pipeline tokenizes, runs and post-processes every sequence on its own, and its "first"
+aggregation goes through several dicts per token. `FastTagger` tokenizes a whole batch at once, from the words of each
+sequence (as joined by `clean_ocr`), takes the softmax and argmax of the logits of the batch at once in NumPy, and
+groups the labels into entity groups in one pass over the tokens of each sequence.
+
+Its output is the same as the output of the pipeline with `aggregation_strategy="first"`: words are split the way the
+pipeline splits them (subword tokens continue a word, punctuation starts a new one), a word takes the label of its
+first token, and adjacent words are grouped under the same B-/I- rules, with "O" groups left out.
+"""
+
+from typing import List, Union
+
+import numpy as np
+
+
+def get_tag(label: str):
+    """Splits a label into its B/I prefix and its tag, as the pipeline does. Labels without a prefix continue."""
+    if label.startswith("B-") or label.startswith("I-"):
+        return label[0], label[2:]
+    return "I", label
+
+
+def is_word_aware(tokenizer) -> bool:
+    """
+    Returns True if the tokenizer marks subword tokens, so that subwords can be told apart from punctuation, see
+    `gather_pre_entities` of the pipeline.
+    """
+    backend_model = getattr(getattr(tokenizer, "_tokenizer", None), "model", None)
+    return bool(getattr(backend_model, "continuing_subword_prefix", None))
+
+
+def split_words(text: str, words: List[str], tokens: List[str], word_ids: List[int], input_ids: List[int],
+                offsets: List[List[int]], unk_id: int, word_aware: bool) -> List[list]:
+    """
+    Splits the tokens of a sequence into words the way the pipeline does: subword tokens continue a word, anything
+    else (punctuation included) starts a new one, and unknown tokens stand for their text.
+
+    Args:
+        text, words, tokens, word_ids, input_ids, offsets: As for `FastTagger.decode`.
+        unk_id (int): The id of the unknown token of the tokenizer.
+        word_aware (bool): Whether the tokenizer marks subword tokens, see `is_word_aware`.
+
+    Returns:
+        List[list]: The words of the sequence, as [tokens, position of the first token, start, end].
+    """
+    word_starts = [0] * len(words)
+    for idx in range(1, len(words)):
+        word_starts[idx] = word_starts[idx - 1] + len(words[idx - 1]) + 1
+    pipeline_words = []
+    for pos, word_id in enumerate(word_ids):
+        if word_id is None:
+            continue
+        token_start, token_end = offsets[pos]
+        word_ref = words[word_id][token_start:token_end]
+        start = word_starts[word_id] + token_start
+        token = tokens[pos]
+        if input_ids[pos] == unk_id:
+            token = word_ref
+            is_subword = False
+        elif word_aware:
+            is_subword = len(token) != len(word_ref)
+        else:
+            is_subword = start > 0 and " " not in text[start - 1:start + 1]
+        if is_subword and pipeline_words:
+            pipeline_words[-1][0].append(token)
+            pipeline_words[-1][3] = start + token_end - token_start
+        else:
+            pipeline_words.append([[token], pos, start, start + token_end - token_start])
+    return pipeline_words
+
+
+def respell(tokenizer, texts: List[str]) -> List[str]:
+    """
+    Spells texts the way the pipeline spells an entity group that covers all of a text: the tokens of each word are
+    joined back into a string by the tokenizer, and so are the words, which respaces punctuation ("O'Neil" comes out
+    as "O ' Neil").
+    """
+    if not texts:
+        return []
+    words = [text.split(" ") for text in texts]
+    encoded = tokenizer(words, is_split_into_words=True, add_special_tokens=False, return_offsets_mapping=True)
+    unk_id, word_aware = tokenizer.unk_token_id, is_word_aware(tokenizer)
+    convert = tokenizer.convert_tokens_to_string
+    return [convert([convert(word[0]) for word in split_words(text, words[pos], encoded.tokens(pos),
+                                                              encoded.word_ids(pos), encoded["input_ids"][pos],
+                                                              encoded["offset_mapping"][pos], unk_id, word_aware)])
+            for pos, text in enumerate(texts)]
+
+
+class FastTagger:
+    """
+    Stands in for the token classification pipeline of the app, with the same call interface and output.
+
+    Args:
+        model: A token classification model (PyTorch or ONNX Runtime), as loaded for the pipeline.
+        tokenizer: The fast tokenizer of the model.
+    """
+
+    def __init__(self, model, tokenizer):
+        self.model = model
+        self.tokenizer = tokenizer
+        self.labels = [model.config.id2label[idx] for idx in range(len(model.config.id2label))]
+        self.tags = [get_tag(label) for label in self.labels]
+        self.word_aware = is_word_aware(tokenizer)
+
+    def __call__(self, inputs: Union[str, List[str]], batch_size: int = None):
+        """
+        Tags one sequence, or a list of sequences in batches of `batch_size` (1 by default, like the pipeline).
+
+        Returns:
+            The entity groups of the sequence, or a list of them for a list of sequences.
+        """
+        if isinstance(inputs, str):
+            return self.tag_batch([inputs])[0]
+        batch_size = batch_size or 1
+        outputs = []
+        for start in range(0, len(inputs), batch_size):
+            outputs.extend(self.tag_batch(inputs[start:start + batch_size]))
+        return outputs
+
+    def tag_batch(self, texts: List[str]) -> List[List[dict]]:
+        """Runs one forward pass over a batch of sequences and decodes the entity groups of each."""
+        import torch
+
+        words = [text.split(" ") for text in texts]
+        encoded = self.tokenizer(words, is_split_into_words=True, truncation=True, padding=True,
+                                 return_offsets_mapping=True, return_tensors="pt")
+        offsets = encoded.pop("offset_mapping").tolist()
+        with torch.inference_mode():
+            logits = self.model(**encoded.to(self.model.device)).logits.cpu().numpy()
+        maxes = np.max(logits, axis=-1, keepdims=True)
+        shifted_exp = np.exp(logits - maxes)
+        scores = shifted_exp / shifted_exp.sum(axis=-1, keepdims=True)
+        label_ids = scores.argmax(axis=-1)
+        input_ids = encoded["input_ids"].tolist()
+        return [self.decode(texts[pos], words[pos], encoded.tokens(pos), encoded.word_ids(pos), input_ids[pos],
+                            offsets[pos], label_ids[pos].tolist(), scores[pos])
+                for pos in range(len(texts))]
+
+    def decode(self, text: str, words: List[str], tokens: List[str], word_ids: List[int], input_ids: List[int],
+               offsets: List[List[int]], label_ids: List[int], scores: np.ndarray) -> List[dict]:
+        """
+        Groups the token labels of one sequence into entity groups.
+
+        Args:
+            text (str): The sequence, i.e. its `words` joined by single spaces.
+            words (List[str]): The words the sequence was tokenized from.
+            tokens, word_ids, input_ids, offsets: The tokens of the sequence, the index of the word each comes from
+                (None for special and padding tokens), their ids and their character offsets within their word.
+            label_ids (List[int]): The predicted label of each token.
+            scores (np.ndarray): The label probabilities of each token.
+
+        Returns:
+            List[dict]: The entity groups of the sequence, as the pipeline returns them.
+        """
+        # words as the pipeline splits them: [tokens, label id, score, start, end]
+        pipeline_words = []
+        for word_tokens, pos, start, end in split_words(text, words, tokens, word_ids, input_ids, offsets,
+                                                        self.tokenizer.unk_token_id, self.word_aware):
+            label_id = label_ids[pos]
+            pipeline_words.append([word_tokens, label_id, scores[pos, label_id], start, end])
+
+        groups = []
+        group = []
+        for word in pipeline_words:
+            if group:
+                bi, tag = self.tags[word[1]]
+                if tag != self.tags[group[-1][1]][1] or bi == "B":
+                    groups.append(group)
+                    group = []
+            group.append(word)
+        if group:
+            groups.append(group)
+
+        convert = self.tokenizer.convert_tokens_to_string
+        entities = []
+        for group in groups:
+            entity = self.labels[group[0][1]].split("-", 1)[-1]
+            if entity == "O":
+                continue
+            # the mean score of a single word is its score
+            score = group[0][2] if len(group) == 1 else np.mean(np.nanmean([word[2] for word in group]))
+            entities.append({
+                "entity_group": entity,
+                "score": score,
+                "word": convert([convert(word[0]) for word in group]),
+                "start": group[0][3],
+                "end": group[-1][4],
+            })
+        return entities
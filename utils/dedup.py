@@ -0,0 +1,66 @@
+"""
+Utility functions for detecting near-duplicate OCR text across consecutive frames.
+
+Upstream scene detection emits many TimePoints for the same on-screen text, and their OCR results differ only by a
+few characters of noise. Frames whose cleaned text is similar enough to the first frame of a run of same-label
+TimePoints can reuse the role-filler pairs of that first (representative) frame instead of being tagged again.
+"""
+from difflib import SequenceMatcher
+from typing import Optional
+
+
+def is_near_duplicate(text_a: str, text_b: str, threshold: float) -> bool:
+    """
+    Returns True if the similarity ratio (from 0 to 1) of two strings, based on their longest matching blocks,
+    is at least `threshold`.
+    """
+    if text_a == text_b:
+        return True
+    matcher = SequenceMatcher(None, text_a, text_b, autojunk=False)
+    # check the cheap upper bounds of the ratio first, most pairs of different texts are rejected by them
+    return (matcher.real_quick_ratio() >= threshold
+            and matcher.quick_ratio() >= threshold
+            and matcher.ratio() >= threshold)
+
+
+class RunDeduplicator:
+    """
+    Tracks a run of consecutive same-label frames and finds frames that are near-duplicates of the run's
+    representative frame.
+
+    Args:
+        threshold (float): Minimum similarity (from 0 to 1) for a frame to count as a near-duplicate.
+    """
+
+    def __init__(self, threshold: float):
+        self.threshold = threshold
+        self.skipped = 0
+        self._label = None
+        self._text = None
+        self._representative = None
+
+    def reset(self) -> None:
+        """Ends the current run."""
+        self._label = None
+        self._text = None
+        self._representative = None
+
+    def match(self, label: str, text: str) -> Optional[int]:
+        """
+        Checks a frame against the current run.
+
+        Returns:
+            Optional[int]: The key of the representative frame if the frame is a near-duplicate of it, otherwise None.
+        """
+        if label != self._label or self._text is None:
+            return None
+        if not is_near_duplicate(self._text, text, self.threshold):
+            return None
+        self.skipped += 1
+        return self._representative
+
+    def start(self, label: str, text: str, key: int) -> None:
+        """Starts a new run with the given frame as its representative."""
+        self._label = label
+        self._text = text
+        self._representative = key
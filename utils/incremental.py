@@ -0,0 +1,63 @@
+"""
+Detection of the TextDocuments an earlier run of the app has already bound, for incremental re-runs.
+
+Pipelines often re-run the whole CLAMS chain on an MMIF that already holds an RFB view. An earlier view can stand in
+for a new run if it was signed by the same app (the identifier includes the app version) with the same
+result-affecting parameters. Such a view has processed every eligible TextDocument that was in the MMIF when it was
+created: the ones it found role-filler pairs in are the sources of its Alignments, and the others had no pairs. So a
+TextDocument only needs to be tagged if no such view has an Alignment from it and the view came before the
+TextDocument or its TimePoint was added to the MMIF.
+"""
+
+from typing import Dict, List
+
+from mmif import Annotation, AnnotationTypes, Mmif
+
+from utils.alignment import get_annotations_of_type
+
+# parameters that change how fast the results are computed, or what is reported about it, but not the results
+NEUTRAL_PARAMETERS = frozenset({'batchSize', 'maxBatchTokens', 'recordTimings', 'incremental', 'pretty'})
+
+
+def result_parameters(parameters: dict) -> dict:
+    """Returns the parameters of a run that its results depend on, leaving out the raw user parameters."""
+    return {name: value for name, value in parameters.items()
+            if name not in NEUTRAL_PARAMETERS and not name.startswith('#')}
+
+
+class PreviousBindings:
+    """
+    The RFB views of an MMIF that a run with the given app identifier and parameters can reuse.
+
+    Args:
+        mmif (Mmif): The input MMIF.
+        app_identifier (str): The identifier of the app, as recorded in the metadata of its views.
+        parameters (dict): The refined runtime parameters of the current run.
+    """
+
+    def __init__(self, mmif: Mmif, app_identifier: str, parameters: dict):
+        self._view_order: Dict[str, int] = {view.id: idx for idx, view in enumerate(mmif.views)}
+        expected = result_parameters(parameters)
+        self.views = [view for view in mmif.views if view.metadata.app == app_identifier
+                      and not view.metadata.has_error()
+                      and result_parameters(view.metadata.appConfiguration or {}) == expected]
+        self._last_view = self._view_order[self.views[-1].id] if self.views else -1
+        # results are aligned to their source, or anchored to it with the `document` property (`outputFormat`); the
+        # TimeFrames of scrolling credit rolls span the TextDocuments of several frames, and do not bind any of them
+        self._aligned_sources = {alignment.get('source') for view in self.views
+                                 for alignment in get_annotations_of_type(view, AnnotationTypes.Alignment)}
+        self._aligned_sources.update(annotation.get('document') for view in self.views
+                                     for annotation in get_annotations_of_type(view, AnnotationTypes.Annotation))
+        self.skipped = 0
+
+    @property
+    def view_ids(self) -> List[str]:
+        return [view.id for view in self.views]
+
+    def is_bound(self, td_ann: Annotation, tp_ann: Annotation) -> bool:
+        """Returns True if an earlier view has processed a TextDocument aligned to a TimePoint, and counts it."""
+        bound = td_ann.long_id in self._aligned_sources or (
+            self._view_order.get(td_ann.parent, len(self._view_order)) < self._last_view
+            and self._view_order.get(tp_ann.parent, len(self._view_order)) < self._last_view)
+        self.skipped += bound
+        return bound
@@ -0,0 +1,180 @@
+"""
+Per-stage latency metrics and counters, exposed in the Prometheus text format.
+
+Each request times its stages (MMIF parsing, `clean_ocr`, tokenization, the model forward, `parse_sequence_tags`,
+CSV serialization) with a `StageTimer`, which adds up the time spent in each stage and records the per-request totals
+in the `rfb_stage_seconds` histogram when the request ends. Counters of processed documents and emitted pairs, and a
+histogram of model input lengths, are updated along the way, as are counters of model batches with their real and
+padded tokens, and of micro-batches with the items they held and the time those waited in the queue. Gauges report the
+current depth of the micro-batching queue, sampled when the metrics are exposed, and its maximum batch size.
+
+Metrics live in the memory of the process: with several gunicorn workers, each worker reports its own.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+SECONDS_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+TOKEN_BUCKETS = (8, 16, 32, 64, 128, 256, 512, 1024)
+
+
+def format_labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    """Formats label pairs as `{name="value",...}`, or an empty string when there are none."""
+    pairs = [f'{name}="{value}"' for name, value in zip(names, values)] + ([extra] if extra else [])
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """A monotonically increasing count, optionally split by label values."""
+
+    def __init__(self, name: str, description: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.labelnames = tuple(labelnames)
+        self._values = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] += amount
+
+    def total(self) -> float:
+        """Returns the count summed over all label values."""
+        with self._lock:
+            return sum(self._values.values())
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{format_labels(self.labelnames, key)} {format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Counts of observed values in cumulative buckets, with their sum, optionally split by label values."""
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(buckets)
+        self.labelnames = tuple(labelnames)
+        # per label values: count per bucket (the last one being +Inf), and sum
+        self._counts = {}
+        self._sums = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            counts = self._counts.setdefault(key, [0] * (len(self.buckets) + 1))
+            counts[bisect_left(self.buckets, value)] += 1
+            self._sums[key] += value
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, counts in sorted(self._counts.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = 'le="+Inf"' if bound == float("inf") else f'le="{format_value(bound)}"'
+                    lines.append(f"{self.name}_bucket{format_labels(self.labelnames, key, le)} {cumulative}")
+                lines.append(f"{self.name}_sum{format_labels(self.labelnames, key)} {format_value(self._sums[key])}")
+                lines.append(f"{self.name}_count{format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Gauge:
+    """A value that goes up and down, either set or sampled from a function each time it is exposed."""
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._value = None
+        self._function = None
+        self._lock = threading.Lock()
+
+    def set(self, value: float) -> None:
+        with self._lock:
+            self._value = value
+            self._function = None
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Samples the value from `function` when it is read, instead of keeping a set value."""
+        with self._lock:
+            self._function = function
+
+    def value(self) -> Optional[float]:
+        """Returns the current value, or None if it was never set."""
+        with self._lock:
+            return self._function() if self._function is not None else self._value
+
+    def expose(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} gauge"]
+        value = self.value()
+        if value is not None:
+            lines.append(f"{self.name} {format_value(value)}")
+        return lines
+
+
+STAGE_SECONDS = Histogram("rfb_stage_seconds", "Time spent in each processing stage, per request.",
+                          SECONDS_BUCKETS, labelnames=("stage",))
+SEQUENCE_TOKENS = Histogram("rfb_sequence_tokens", "Length of model inputs in subword tokens.", TOKEN_BUCKETS)
+DOCUMENTS = Counter("rfb_documents_total", "TextDocuments processed, by scene type.", labelnames=("scene",))
+PAIRS = Counter("rfb_pairs_total", "Role-filler pairs emitted.")
+FAST_PATH_DOCUMENTS = Counter("rfb_fast_path_documents_total",
+                              "TextDocuments bound by the rule-based chyron recognizer, without the model.")
+BATCHES = Counter("rfb_batches_total", "Batches run through the model.")
+BATCH_REAL_TOKENS = Counter("rfb_batch_real_tokens_total",
+                            "Subword tokens of batches run through the model, padding excluded.")
+BATCH_PADDED_TOKENS = Counter("rfb_batch_padded_tokens_total",
+                              "Subword tokens of batches run through the model, padding included.")
+MICROBATCHES = Counter("rfb_microbatches_total", "Micro-batches taken off the cross-request queue.")
+MICROBATCH_ITEMS = Counter("rfb_microbatch_items_total", "Model inputs taken off the cross-request queue.")
+MICROBATCH_WAIT_SECONDS = Counter("rfb_microbatch_wait_seconds_total",
+                                  "Time model inputs waited in the cross-request queue, summed over inputs.")
+MICROBATCH_QUEUE_DEPTH = Gauge("rfb_microbatch_queue_depth", "Model inputs waiting in the cross-request queue.")
+MICROBATCH_MAX_BATCH_SIZE = Gauge("rfb_microbatch_max_batch_size",
+                                  "Maximum number of model inputs in a micro-batch of the cross-request queue.")
+REGISTRY = [STAGE_SECONDS, SEQUENCE_TOKENS, DOCUMENTS, PAIRS, FAST_PATH_DOCUMENTS, BATCHES, BATCH_REAL_TOKENS,
+            BATCH_PADDED_TOKENS, MICROBATCHES, MICROBATCH_ITEMS, MICROBATCH_WAIT_SECONDS, MICROBATCH_QUEUE_DEPTH,
+            MICROBATCH_MAX_BATCH_SIZE]
+
+
+def expose_metrics() -> str:
+    """Returns all metrics of the process in the Prometheus text exposition format."""
+    return "\n".join(line for metric in REGISTRY for line in metric.expose()) + "\n"
+
+
+class StageTimer:
+    """Adds up the time spent in each stage of one request."""
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = defaultdict(float)
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += time.perf_counter() - start
+
+    def observe(self) -> None:
+        """Records the time of each stage in the `rfb_stage_seconds` histogram."""
+        for name, seconds in self.seconds.items():
+            STAGE_SECONDS.observe(seconds, stage=name)
+
+    def summary(self) -> Dict[str, float]:
+        """Returns the time of each stage in milliseconds."""
+        return {name: round(seconds * 1000, 3) for name, seconds in self.seconds.items()}
@@ -0,0 +1,122 @@
+"""
+Cross-request dynamic micro-batching.
+
+When several MMIFs are annotated at once, each request thread would otherwise run its own (often small) batches
+through the model, competing for the same cores. Instead, request threads put their sequences on a shared queue and
+wait on futures, while a single consumer thread coalesces queued sequences from all requests into shared batches.
+
+A batch is flushed as soon as it holds `max_batch_size` sequences, or `max_wait_ms` milliseconds after its oldest
+sequence was queued, whichever comes first. The depth of the queue and the maximum batch size are reported as gauges
+on `/metrics`, so that the fill ratio of the batches can be computed there from the micro-batch counters.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, List
+
+from utils.metrics import (MICROBATCH_ITEMS, MICROBATCH_MAX_BATCH_SIZE, MICROBATCH_QUEUE_DEPTH, MICROBATCH_WAIT_SECONDS,
+                           MICROBATCHES)
+
+
+class MicroBatcher:
+    """
+    Queue with a single consumer thread that runs queued items through a batch function.
+
+    Args:
+        run_batch (Callable[[List], List]): Function that processes a batch of items and returns one result per item,
+            in order. Only ever called from the consumer thread.
+        max_batch_size (int): Maximum number of items in a batch.
+        max_wait_ms (float): Maximum time an item waits in the queue for more items to batch with.
+    """
+
+    def __init__(self, run_batch: Callable[[List], List], max_batch_size: int = 64, max_wait_ms: float = 10.0):
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.batches = 0
+        self.items = 0
+        self.total_wait_ms = 0.0
+        self.max_observed_wait_ms = 0.0
+        self._queue = queue.Queue()
+        self._consumer = None
+        self._lock = threading.Lock()
+        MICROBATCH_MAX_BATCH_SIZE.set(max_batch_size)
+        MICROBATCH_QUEUE_DEPTH.set_function(lambda: self.queue_depth)
+
+    def submit(self, items: List[Any]) -> List[Future]:
+        """
+        Queues items to be processed in the next batches.
+
+        Returns:
+            List[Future]: One future per item, resolving to the result of the item.
+        """
+        with self._lock:
+            # started on first use rather than in the constructor, as threads do not survive a fork of the process
+            if self._consumer is None or not self._consumer.is_alive():
+                self._consumer = threading.Thread(target=self._consume, name="rfb-microbatch", daemon=True)
+                self._consumer.start()
+        futures = []
+        queued_at = time.perf_counter()
+        for item in items:
+            future = Future()
+            self._queue.put((item, future, queued_at))
+            futures.append(future)
+        return futures
+
+    def map(self, items: List[Any]) -> List[Any]:
+        """Processes items through the queue and waits for their results."""
+        return [future.result() for future in self.submit(items)]
+
+    def _consume(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = batch[0][2] + self.max_wait_ms / 1000
+            while len(batch) < self.max_batch_size:
+                try:
+                    # past the deadline, still take items that are already waiting, but do not wait for more
+                    batch.append(self._queue.get(timeout=max(deadline - time.perf_counter(), 0)))
+                except queue.Empty:
+                    break
+            started_at = time.perf_counter()
+            with self._lock:
+                self.batches += 1
+                self.items += len(batch)
+                for _, _, queued_at in batch:
+                    wait_ms = (started_at - queued_at) * 1000
+                    self.total_wait_ms += wait_ms
+                    self.max_observed_wait_ms = max(self.max_observed_wait_ms, wait_ms)
+                    MICROBATCH_WAIT_SECONDS.inc(wait_ms / 1000)
+            MICROBATCHES.inc()
+            MICROBATCH_ITEMS.inc(len(batch))
+            try:
+                results = list(self.run_batch([item for item, _, _ in batch]))
+                if len(results) != len(batch):
+                    raise RuntimeError(f"Got {len(results)} results for a batch of {len(batch)} items")
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+            else:
+                for (_, future, _), result in zip(batch, results):
+                    future.set_result(result)
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of items currently waiting in the queue."""
+        return self._queue.qsize()
+
+    def stats(self) -> dict:
+        """
+        Returns the current queue depth, and the number of batches, their mean fill ratio (items per batch over
+        `max_batch_size`) and the mean and maximum time items waited in the queue, over all batches so far.
+        """
+        with self._lock:
+            return {
+                "queueDepth": self.queue_depth,
+                "batches": self.batches,
+                "items": self.items,
+                "batchFillRatio": self.items / (self.batches * self.max_batch_size) if self.batches else 0.0,
+                "meanWaitMs": self.total_wait_ms / self.items if self.items else 0.0,
+                "maxWaitMs": self.max_observed_wait_ms,
+            }
@@ -0,0 +1,318 @@
+"""
+On-demand loading of the RFB token classification model.
+
+The model is not loaded at import time. Instead, a single shared `RFBModel` holder loads the tokenizer, the model and
+the HuggingFace pipeline on first use (or on an explicit `warmup()` call), guarded by a lock so that concurrent
+request threads never load the weights twice.
+
+Three inference backends are available: `pytorch` (the default) runs the model eagerly with PyTorch, `int8` runs it
+with PyTorch after dynamic int8 quantization of its linear layers (CPU only, see `model/quantization_guardrail.py`
+for its accuracy check), and `onnx` exports the model to ONNX once, caches the export on disk and runs it with ONNX
+Runtime. The ONNX backend requires the optional `optimum[onnxruntime]` package.
+
+With the `fast` decoder, the pipeline is only used to load the model: inputs are tagged by `utils.decoder.FastTagger`,
+which decodes the logits of a whole batch at once instead of post-processing every sequence with the pipeline.
+
+In production, the model can be preloaded in the main process before gunicorn forks its workers (see
+`RFBModel.preload`), so that all workers share a single copy of the weights.
+"""
+
+import fcntl
+import gc
+import hashlib
+import logging
+import os
+import shutil
+import threading
+import time
+import weakref
+
+from transformers import AutoConfig, AutoTokenizer, AutoModelForTokenClassification
+
+DEFAULT_MODEL = "clamsproject/bert-base-cased-ner-rfb"
+BACKENDS = ("pytorch", "int8", "onnx")
+DECODERS = ("pipeline", "fast")
+DEFAULT_ONNX_DIR = os.path.join(os.path.expanduser("~"), ".cache", "clams", "rfb-onnx")
+# written in an ONNX export directory once the export is complete
+ONNX_EXPORT_MARKER = ".export-complete"
+
+# dummy inputs used to exercise both scene types once before serving real requests
+WARMUP_SEQUENCES = [
+    ("credits", "Executive Producer Jane Doe Director Joe Bloggs"),
+    ("chyron", "Jane Doe Reporter, Health Services"),
+]
+
+logger = logging.getLogger(__name__)
+
+# identities of the loaded models, computed once per model (see `model_identity`)
+_model_identities = weakref.WeakKeyDictionary()
+
+
+def checkpoint_identity(config) -> str:
+    """
+    Returns a string that identifies the exact weights of a checkpoint, given its config.
+    Hub checkpoints are identified by name and commit hash, local checkpoints by path and the size and modification
+    time of their files, so that retraining into the same directory yields a new identity.
+    """
+    name = config.name_or_path
+    revision = getattr(config, "_commit_hash", None)
+    if os.path.isdir(name):
+        digest = hashlib.sha1()
+        for fname in sorted(os.listdir(name)):
+            fstat = os.stat(os.path.join(name, fname))
+            digest.update(f"{fname}:{fstat.st_size}:{fstat.st_mtime_ns};".encode('utf-8'))
+        revision = digest.hexdigest()
+    return f"{name}@{revision}"
+
+
+def model_identity(model) -> str:
+    """
+    Returns a string that identifies a loaded model, for use in cache keys. Besides the checkpoint, the identity
+    includes the model class and quantization, which differ between inference backends. It is computed once per
+    model, as identifying a local checkpoint reads the metadata of all its files, and the weights of a loaded model
+    do not change.
+    """
+    identity = _model_identities.get(model)
+    if identity is None:
+        quantization = getattr(model, "rfb_quantization", None)
+        identity = f"{checkpoint_identity(model.config)}/{type(model).__name__}"
+        if quantization:
+            identity += f"+{quantization}"
+        _model_identities[model] = identity
+    return identity
+
+
+def quantize_dynamic_int8(model):
+    """
+    Applies dynamic int8 quantization to the linear layers of a PyTorch model: weights are stored as int8, and
+    activations are quantized on the fly. This cuts the memory and the CPU latency of the model.
+
+    Returns:
+        The quantized model, in eval mode and on CPU.
+    """
+    import torch
+    quantized = torch.ao.quantization.quantize_dynamic(model.to("cpu").eval(), {torch.nn.Linear}, dtype=torch.qint8)
+    quantized.rfb_quantization = "dynamic-int8"
+    return quantized
+
+
+def export_onnx(model_name_or_path: str, export_root: str = DEFAULT_ONNX_DIR) -> str:
+    """
+    Exports a token classification checkpoint to ONNX, unless the same checkpoint has already been exported.
+
+    Args:
+        model_name_or_path (str): A HuggingFace hub model name or a path to a local checkpoint directory.
+        export_root (str): Directory under which exports are cached, one subdirectory per checkpoint identity.
+
+    Returns:
+        str: The directory holding the exported `model.onnx` and its config.
+    """
+    try:
+        from optimum.onnxruntime import ORTModelForTokenClassification
+    except ImportError as e:
+        raise ImportError("The `onnx` backend requires the `optimum[onnxruntime]` package.") from e
+    identity = checkpoint_identity(AutoConfig.from_pretrained(model_name_or_path))
+    export_dir = os.path.join(export_root, hashlib.sha1(identity.encode('utf-8')).hexdigest())
+    marker = os.path.join(export_dir, ONNX_EXPORT_MARKER)
+    if os.path.exists(marker):
+        return export_dir
+    os.makedirs(export_root, exist_ok=True)
+    # the onnx backend cannot be preloaded, so all workers of a pool load it at the same time: they take turns, and
+    # the first one exports the model for the others
+    with open(f"{export_dir}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if not os.path.exists(marker):
+            if os.path.exists(export_dir):
+                logger.warning(f"Removing incomplete ONNX export `{export_dir}`")
+                shutil.rmtree(export_dir)
+            logger.info(f"Exporting `{identity}` to ONNX in `{export_dir}`")
+            # export to a temporary directory first, and mark it as complete once saved, so an interrupted export is
+            # never mistaken for a complete one
+            tmp_dir = f"{export_dir}.{os.getpid()}.tmp"
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            ORTModelForTokenClassification.from_pretrained(model_name_or_path, export=True).save_pretrained(tmp_dir)
+            open(os.path.join(tmp_dir, ONNX_EXPORT_MARKER), "w").close()
+            os.replace(tmp_dir, export_dir)
+    return export_dir
+
+
+class RFBModel:
+    """
+    Thread-safe holder for the RFB tagger that loads the model lazily.
+
+    Args:
+        model_name_or_path (str): A HuggingFace hub model name or a path to a local checkpoint directory.
+        backend (str): The inference backend, one of `BACKENDS`.
+        onnx_dir (str): Directory where ONNX exports are cached, used by the `onnx` backend.
+        intra_op_threads (int): Number of threads used within an operation (e.g. a matrix multiplication). None keeps
+            the default of the backend, which is one thread per core.
+        inter_op_threads (int): Number of threads used to run independent operations in parallel. None keeps the
+            default of the backend.
+        decoder (str): How model outputs are turned into entity groups, one of `DECODERS`. `pipeline` uses the
+            post-processing of the HuggingFace pipeline, `fast` uses `FastTagger`, with the same results.
+    """
+
+    def __init__(self, model_name_or_path: str = DEFAULT_MODEL, backend: str = "pytorch",
+                 onnx_dir: str = DEFAULT_ONNX_DIR, intra_op_threads: int = None, inter_op_threads: int = None,
+                 decoder: str = "pipeline"):
+        self.model_name_or_path = model_name_or_path
+        self.backend = backend
+        self.decoder = decoder
+        self.onnx_dir = onnx_dir
+        self.intra_op_threads = intra_op_threads
+        self.inter_op_threads = inter_op_threads
+        self._threads_pid = None
+        self.load_seconds = None
+        self.warmup_seconds = None
+        # set when the model is meant to be loaded by the first request rather than ahead of it
+        self.lazy = False
+        self._tagger = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_loaded(self) -> bool:
+        """Returns True if the model weights are in memory."""
+        return self._tagger is not None
+
+    @property
+    def tagger(self):
+        """The token classification pipeline, loaded on first access."""
+        if self._tagger is None:
+            self.load()
+        return self._tagger
+
+    def configure(self, model_name_or_path: str = None, backend: str = None, onnx_dir: str = None,
+                  intra_op_threads: int = None, inter_op_threads: int = None, decoder: str = None) -> None:
+        """
+        Points the holder to a different checkpoint, backend or decoder. Must be called before the model is loaded.
+        """
+        if backend is not None and backend not in BACKENDS:
+            raise ValueError(f"Unknown backend `{backend}`, must be one of {BACKENDS}.")
+        if decoder is not None and decoder not in DECODERS:
+            raise ValueError(f"Unknown decoder `{decoder}`, must be one of {DECODERS}.")
+        with self._lock:
+            if self._tagger is not None:
+                raise RuntimeError(f"Model `{self.model_name_or_path}` is already loaded.")
+            self.model_name_or_path = model_name_or_path or self.model_name_or_path
+            self.backend = backend or self.backend
+            self.onnx_dir = onnx_dir or self.onnx_dir
+            self.intra_op_threads = intra_op_threads or self.intra_op_threads
+            self.inter_op_threads = inter_op_threads or self.inter_op_threads
+            self.decoder = decoder or self.decoder
+
+    def apply_threads(self) -> None:
+        """
+        Sets the thread pool sizes of PyTorch in the current process, once per process. Thread settings are not
+        reliably inherited by forked processes, so each gunicorn worker applies them again after the fork. The ONNX
+        backend takes its thread settings when its session is created instead.
+        """
+        if self._threads_pid == os.getpid() or self.backend == "onnx":
+            return
+        self._threads_pid = os.getpid()
+        import torch
+        if self.intra_op_threads:
+            torch.set_num_threads(self.intra_op_threads)
+        if self.inter_op_threads:
+            try:
+                torch.set_num_interop_threads(self.inter_op_threads)
+            except RuntimeError:
+                # can only be set once per process, before any inter-op parallel work; a forked worker keeps the
+                # value set in its parent
+                logger.debug("Inter-op threads already set, keeping the current value")
+        logger.info(f"Using {torch.get_num_threads()} intra-op and {torch.get_num_interop_threads()} inter-op "
+                    f"threads")
+
+    def load(self):
+        """
+        Loads the tokenizer, the model and the pipeline, if not already loaded. Safe to call from many threads.
+
+        Returns:
+            Pipeline: The loaded token classification pipeline.
+        """
+        with self._lock:
+            if self._tagger is None:
+                # the pipelines module pulls in heavy dependencies (pandas, scipy, ...), so it is only imported here
+                from transformers import pipeline
+                self.apply_threads()
+                logger.info(f"Loading RFB model from `{self.model_name_or_path}` with the {self.backend} backend")
+                start = time.perf_counter()
+                tokenizer = AutoTokenizer.from_pretrained(self.model_name_or_path)
+                if self.backend == "onnx":
+                    from optimum.onnxruntime import ORTModelForTokenClassification
+                    import onnxruntime
+                    session_options = onnxruntime.SessionOptions()
+                    session_options.intra_op_num_threads = self.intra_op_threads or 0
+                    session_options.inter_op_num_threads = self.inter_op_threads or 0
+                    model = ORTModelForTokenClassification.from_pretrained(
+                        export_onnx(self.model_name_or_path, self.onnx_dir), session_options=session_options)
+                    self._tagger = pipeline("token-classification", model=model, tokenizer=tokenizer,
+                                            aggregation_strategy="first")
+                elif self.backend == "int8":
+                    model = quantize_dynamic_int8(AutoModelForTokenClassification.from_pretrained(
+                        self.model_name_or_path))
+                    self._tagger = pipeline("token-classification", model=model, tokenizer=tokenizer,
+                                            device="cpu", aggregation_strategy="first")
+                else:
+                    model = AutoModelForTokenClassification.from_pretrained(self.model_name_or_path)
+                    self._tagger = pipeline("token-classification", model=model, tokenizer=tokenizer,
+                                            device_map="auto", aggregation_strategy="first")
+                if self.decoder == "fast":
+                    from utils.decoder import FastTagger
+                    self._tagger = FastTagger(self._tagger.model, self._tagger.tokenizer)
+                self.load_seconds = time.perf_counter() - start
+                logger.info(f"Loaded RFB model in {self.load_seconds:.2f} seconds")
+        return self._tagger
+
+    def set_tagger(self, tagger) -> None:
+        """
+        Uses an already built token classification pipeline, or a stand-in with the same interface (e.g. the stub
+        tagger of `tests.helpers`), instead of loading one. Pass None to unload it.
+        """
+        with self._lock:
+            self._tagger = tagger
+
+    def preload(self) -> None:
+        """
+        Loads the model in the current process before worker processes are forked from it. The weights are never
+        written to after loading, so forked workers share them through copy-on-write memory instead of each loading
+        a copy of their own.
+
+        No forward pass is run, as thread pools started by a forward pass do not survive a fork; warm up each worker
+        after the fork instead.
+        """
+        if self.backend == "onnx":
+            raise ValueError("The `onnx` backend cannot be preloaded: ONNX Runtime sessions are not fork-safe.")
+        self.load()
+        # move every object allocated so far out of reach of the garbage collector, whose bookkeeping writes would
+        # otherwise copy the memory pages holding them into each worker
+        gc.collect()
+        gc.freeze()
+
+    def warmup(self) -> None:
+        """
+        Loads the model and runs a dummy credits and chyron sequence through it, so that one-time costs
+        (memory allocation, kernel selection, etc.) are not paid by the first real request.
+        """
+        tagger = self.load()
+        start = time.perf_counter()
+        tagger([f"{scene_type} {text}" for scene_type, text in WARMUP_SEQUENCES], batch_size=len(WARMUP_SEQUENCES))
+        self.warmup_seconds = time.perf_counter() - start
+        logger.info(f"Warmed up RFB model in {self.warmup_seconds:.2f} seconds")
+
+    def status(self) -> dict:
+        """Returns a readiness report of the model."""
+        return {
+            "model": self.model_name_or_path,
+            "backend": self.backend,
+            "decoder": self.decoder,
+            "loaded": self.is_loaded,
+            "lazy": self.lazy,
+            "loadSeconds": self.load_seconds,
+            "warmupSeconds": self.warmup_seconds,
+            "intraOpThreads": self.intra_op_threads,
+            "interOpThreads": self.inter_op_threads,
+        }
+
+
+# the single model instance shared by the whole process
+rfb_model = RFBModel()
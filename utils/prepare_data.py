@@ -5,15 +5,36 @@ The input file is expected to be a csv with the following columns: ['guid', 'sce
 An exception will be raised if for any row, the number of tokens in 'cleaned_text' does not match the number of tags
 in 'labels'.
 
-Outputs 3 json files for train/val/test data partitions.
+Outputs 3 json files for train/val/test data partitions (or parquet files, with `--format parquet`, which `run_ner.py`
+loads as well).
 
-Usage: python3 prepare_data.py --data path/to/data.csv
+The csv is streamed in chunks of `--chunk_size` rows, which are converted and validated by a pool of `--workers`
+processes, so that memory stays bounded whatever the size of the export. The rows are shuffled and partitioned exactly
+as by `train_test_split` on the whole data set: a first pass counts the rows, which is all the split needs, and the
+converted rows are spooled to temporary buckets of `--bucket_size` rows in the order of their split, which are then
+sorted one at a time into the output files. At most `--max_open_buckets` bucket files are kept open at a time, so
+that small buckets of a large export do not run into the limit of open files of the process.
+
+Usage: python3 prepare_data.py --data path/to/data.csv [--workers 4] [--format parquet]
 """
 
 import argparse
+import json
+import os
+import tempfile
+import time
+from collections import OrderedDict, deque
+from multiprocessing import Pool
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+import numpy as np
 import pandas as pd
 from sklearn.model_selection import train_test_split
 
+SPLITS = ('train', 'val', 'test')
+CSV_DTYPES = {'scene_label': str, 'cleaned_text': str, 'labels': str}
+
 
 def get_tokens(cleaned_text: str):
     """
@@ -37,25 +58,212 @@ def get_labels(silver_annotation: str):
     return labels
 
 
-if __name__ == '__main__':
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--data', type=str, required=True, help='Path to annotation csv file')
-    args = parser.parse_args()
+def to_json_line(tokens: List[str], labels: List[str]) -> str:
+    """Serializes an example as `DataFrame.to_json(orient='records', lines=True)` does, escaped slashes included."""
+    return json.dumps({"tokens": tokens, "labels": labels}, separators=(',', ':')).replace('/', '\\/')
 
-    original_df = pd.read_csv(args.data)
-    tokens = original_df['scene_label'] + " " + original_df['cleaned_text']
-    tokens = tokens.map(get_tokens)
-    labels = original_df['labels'].map(get_labels).tolist()
-    labels = [['O'] + label_seq for label_seq in labels]  # first element will be the scene classification
-    for idx, tok_seq in enumerate(tokens):
-        lab_seq = labels[idx]
+
+def prepare_chunk(chunk: Tuple[int, List[Tuple[str, str, str]]]) -> List[str]:
+    """
+    Converts and validates a chunk of csv rows.
+
+    Args:
+        chunk (Tuple[int, List[Tuple[str, str, str]]]): The index of the first row of the chunk in the csv, and the
+            (scene_label, cleaned_text, labels) values of its rows.
+
+    Returns:
+        List[str]: The examples of the chunk, as json lines.
+    """
+    start, rows = chunk
+    lines = []
+    for idx, (scene_label, cleaned_text, annotation) in enumerate(rows, start):
+        tok_seq = get_tokens(scene_label + " " + cleaned_text)
+        lab_seq = ['O'] + get_labels(annotation)  # first element will be the scene classification
         # require the token and tag seqs to be the same length
         assert len(lab_seq) == len(tok_seq), \
-            (f"Length of tokens ({len(tok_seq)}) does not match length of labels ({len(lab_seq)}):\n"
+            (f"Length of tokens ({len(tok_seq)}) does not match length of labels ({len(lab_seq)}) in row {idx}:\n"
              f"({tok_seq}, {lab_seq})")
-    output_df = pd.DataFrame(data={"tokens": tokens, "labels": labels})
-    train, val = train_test_split(output_df, test_size=0.2, random_state=42)
-    train.to_json('../model_in_data/rfb_train.json', orient='records', lines=True)
+        lines.append(to_json_line(tok_seq, lab_seq))
+    return lines
+
+
+def read_chunks(data: str, chunk_size: int) -> Iterator[Tuple[int, List[Tuple[str, str, str]]]]:
+    """Streams the rows of the csv, in chunks of `chunk_size` rows, as `prepare_chunk` takes them."""
+    start = 0
+    for frame in pd.read_csv(data, usecols=list(CSV_DTYPES), dtype=CSV_DTYPES, chunksize=chunk_size):
+        rows = list(zip(frame['scene_label'], frame['cleaned_text'], frame['labels']))
+        yield start, rows
+        start += len(rows)
+
+
+def count_rows(data: str, chunk_size: int) -> int:
+    return sum(len(frame) for frame in pd.read_csv(data, usecols=['labels'], dtype=str, chunksize=chunk_size))
+
+
+def split_positions(num_rows: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Shuffles and partitions the rows into train, val and test splits (8:1:1), exactly as `train_test_split` does on
+    the whole data set.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: For each row of the csv, the index of its split in `SPLITS`, and its position in
+            that split.
+    """
+    train, val = train_test_split(np.arange(num_rows), test_size=0.2, random_state=42)
     val, test = train_test_split(val, test_size=0.5, random_state=42)
-    val.to_json('../model_in_data/rfb_val.json', orient='records', lines=True)
-    test.to_json('../model_in_data/rfb_test.json', orient='records', lines=True)
+    split_of = np.empty(num_rows, dtype=np.int8)
+    position = np.empty(num_rows, dtype=np.int64)
+    for split_idx, rows in enumerate((train, val, test)):
+        split_of[rows] = split_idx
+        position[rows] = np.arange(len(rows))
+    return split_of, position
+
+
+def iter_prepared(chunks: Iterator, workers: int) -> Iterator[Tuple[int, List[str]]]:
+    """
+    Yields the (first row index, json lines) of each chunk, in order. With more than one worker, chunks are converted
+    by a process pool, with at most two chunks per worker in flight, so that the reader does not run ahead.
+    """
+    if workers <= 1:
+        for start, rows in chunks:
+            yield start, prepare_chunk((start, rows))
+        return
+    with Pool(workers) as pool:
+        pending = deque()
+        for start, rows in chunks:
+            pending.append((start, pool.apply_async(prepare_chunk, ((start, rows),))))
+            if len(pending) >= 2 * workers:
+                start, result = pending.popleft()
+                yield start, result.get()
+        while pending:
+            start, result = pending.popleft()
+            yield start, result.get()
+
+
+class SplitWriter:
+    """Writes the examples of a split to json lines, or to parquet in row groups."""
+
+    def __init__(self, path: Path, output_format: str):
+        self.path = path
+        self.output_format = output_format
+        if output_format == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            self.pa = pa
+            schema = pa.schema([('tokens', pa.list_(pa.string())), ('labels', pa.list_(pa.string()))])
+            self.writer = pq.ParquetWriter(path, schema)
+        else:
+            self.writer = open(path, 'w')
+
+    def write(self, lines: List[str]):
+        if self.output_format == 'parquet':
+            examples = [json.loads(line) for line in lines]
+            self.writer.write_table(self.pa.Table.from_pylist(examples, schema=self.writer.schema))
+        else:
+            self.writer.writelines(line + '\n' for line in lines)
+
+    def close(self):
+        self.writer.close()
+
+
+class BucketSpool:
+    """
+    Appends entries to bucket files in a directory, keeping the most recently used files open.
+
+    Args:
+        spool_dir (str): Directory of the bucket files.
+        max_open (int): Maximum number of bucket files open at a time; the least recently used one is closed first.
+    """
+
+    def __init__(self, spool_dir: str, max_open: int = 64):
+        self.spool_dir = spool_dir
+        self.max_open = max(max_open, 1)
+        self._files = OrderedDict()
+
+    def path(self, key: Tuple[int, int]) -> str:
+        return os.path.join(self.spool_dir, f'{key[0]}-{key[1]}.tsv')
+
+    def write(self, key: Tuple[int, int], entries: List[str]) -> None:
+        if key in self._files:
+            self._files.move_to_end(key)
+        else:
+            if len(self._files) >= self.max_open:
+                self._files.popitem(last=False)[1].close()
+            # buckets are reopened after being closed, so they are only ever appended to
+            self._files[key] = open(self.path(key), 'a')
+        self._files[key].writelines(entries)
+
+    def close(self) -> None:
+        for f in self._files.values():
+            f.close()
+        self._files.clear()
+
+
+def prepare(data: str, out_dir: str = '../model_in_data', output_format: str = 'json', chunk_size: int = 10000,
+            workers: int = 1, bucket_size: int = 100000, max_open_buckets: int = 64) -> dict:
+    """
+    Converts the annotation csv into train/val/test files, with bounded memory.
+
+    Args:
+        data (str): Path to the annotation csv file.
+        out_dir (str): Directory the `rfb_{split}.{json,parquet}` files are written to.
+        output_format (str): "json" (json lines) or "parquet".
+        chunk_size (int): Number of csv rows read, and converted by a worker, at a time.
+        workers (int): Number of worker processes converting and validating the rows; 1 converts them in process.
+        bucket_size (int): Number of examples of a split sorted in memory at a time when writing the outputs.
+        max_open_buckets (int): Maximum number of bucket files open at a time while spooling the examples.
+
+    Returns:
+        dict: The number of examples in each split, and the number of rows processed per second.
+    """
+    start_time = time.perf_counter()
+    num_rows = count_rows(data, chunk_size)
+    split_of, position = split_positions(num_rows)
+    sizes = [int((split_of == split_idx).sum()) for split_idx in range(len(SPLITS))]
+    with tempfile.TemporaryDirectory(prefix='rfb-prepare-') as spool_dir:
+        # spool every example to the bucket of its position in its split, a chunk at a time per bucket
+        spool = BucketSpool(spool_dir, max_open_buckets)
+        for start, lines in iter_prepared(read_chunks(data, chunk_size), workers):
+            buckets = {}
+            for row_idx, line in enumerate(lines, start):
+                key = (int(split_of[row_idx]), int(position[row_idx]) // bucket_size)
+                buckets.setdefault(key, []).append(f'{position[row_idx]}\t{line}\n')
+            for key, entries in buckets.items():
+                spool.write(key, entries)
+        spool.close()
+
+        # then sort the buckets one at a time into the outputs
+        os.makedirs(out_dir, exist_ok=True)
+        for split_idx, split in enumerate(SPLITS):
+            writer = SplitWriter(Path(out_dir) / f'rfb_{split}.{output_format}', output_format)
+            for bucket_idx in range(-(-sizes[split_idx] // bucket_size)):
+                with open(spool.path((split_idx, bucket_idx))) as f:
+                    entries = [entry.rstrip('\n').split('\t', 1) for entry in f]
+                entries.sort(key=lambda entry: int(entry[0]))
+                writer.write([line for _, line in entries])
+            writer.close()
+    elapsed = time.perf_counter() - start_time
+    report = dict(zip(SPLITS, sizes))
+    report['rows_per_second'] = num_rows / elapsed if elapsed > 0 else 0.0
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', type=str, required=True, help='Path to annotation csv file')
+    parser.add_argument('--out_dir', type=str, default='../model_in_data', help='Directory to write the splits to')
+    parser.add_argument('--format', type=str, default='json', choices=['json', 'parquet'],
+                        help='Output format of the splits; run_ner.py loads both')
+    parser.add_argument('--chunk_size', type=int, default=10000, help='Number of csv rows processed at a time')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help='Number of processes converting and validating rows (1 to convert them in process)')
+    parser.add_argument('--bucket_size', type=int, default=100000,
+                        help='Number of examples held in memory at a time when writing the splits')
+    parser.add_argument('--max_open_buckets', type=int, default=64,
+                        help='Maximum number of temporary bucket files open at a time')
+    args = parser.parse_args()
+
+    report = prepare(args.data, args.out_dir, args.format, args.chunk_size, args.workers, args.bucket_size,
+                     args.max_open_buckets)
+    print(f"train: {report['train']}, val: {report['val']}, test: {report['test']} examples "
+          f"({report['rows_per_second']:.0f} rows/s)")
@@ -1,11 +1,22 @@
-from transformers import AutoTokenizer, AutoModelForTokenClassification, pipeline
+import threading
 from collections import defaultdict
 from typing import List
 
-tokenizer = AutoTokenizer.from_pretrained("clamsproject/bert-base-cased-ner-rfb")
-model = AutoModelForTokenClassification.from_pretrained("clamsproject/bert-base-cased-ner-rfb")
-tagger = pipeline("token-classification", model=model, tokenizer=tokenizer, device_map="auto",
-                  aggregation_strategy="first")
+from utils.batching import TokenBudgetBatcher
+from utils.decoder import respell
+from utils.metrics import BATCH_PADDED_TOKENS, BATCH_REAL_TOKENS, BATCHES, SEQUENCE_TOKENS, StageTimer
+from utils.model import model_identity, rfb_model
+from utils.windowing import plan_windows, stitch_windows, window_text
+
+# fast tokenizers are not thread-safe ("Already borrowed"), so request threads take turns in running the model
+inference_lock = threading.Lock()
+
+
+def __getattr__(name):
+    # `tagger` used to be a module-level pipeline; keep it importable, but only load the model when it is asked for
+    if name == "tagger":
+        return rfb_model.tagger
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def parse_sequence_tags(phrases, scene_type) -> List[dict]:
@@ -30,8 +41,7 @@ def parse_sequence_tags(phrases, scene_type) -> List[dict]:
             role, word = phrase
             if role == start_phrase:
                 if cur_role or cur_fillers:
-                    bindings[cur_role] = cur_fillers if cur_role not in bindings \
-                        else bindings[cur_role] + cur_fillers
+                    bindings[cur_role].extend(cur_fillers)
                 cur_role = ""
                 cur_fillers = []
 
@@ -41,8 +51,7 @@ def parse_sequence_tags(phrases, scene_type) -> List[dict]:
                 cur_fillers.append(word)
 
         if cur_role or cur_fillers:
-            bindings[cur_role] = cur_fillers if cur_role not in bindings \
-                else bindings[cur_role] + cur_fillers
+            bindings[cur_role].extend(cur_fillers)
 
         binding_pairs = [{"Role": role, "Filler": filler} for role, fillers in bindings.items() for filler in fillers]
         # Account for empty fillers
@@ -54,18 +63,216 @@ def parse_sequence_tags(phrases, scene_type) -> List[dict]:
         return {}
 
 
-def bind_role_fillers(ocr_results, scene_type, clf=tagger):
+def bind_role_fillers(ocr_results, scene_type, clf=None):
     """
     Runs model from a given checkpoint on OCR results and returns BIO-annotated string.
 
     Args:
-        clf (Pipeline): A HuggingFace pipeline for Token Classification
+        clf (Pipeline): A HuggingFace pipeline for Token Classification. Defaults to the shared (lazily loaded) tagger.
         ocr_results (str): OCR results from a video frame.
         scene_type (str): The type of scene, either "credits" or "chyron".
     """
 
+    if clf is None:
+        clf = rfb_model.tagger
     rfb_sent = f"{scene_type} {ocr_results}"
 
-    outputs = clf(rfb_sent)
+    timer = StageTimer()
+    with inference_lock, timer.stage("forward"):
+        outputs = clf(rfb_sent)
     words = [(entry["entity_group"], entry["word"]) for entry in outputs]
-    return parse_sequence_tags(words, scene_type)
+    with timer.stage("parse_tags"):
+        parsed = parse_sequence_tags(words, scene_type)
+    timer.observe()
+    return parsed
+
+
+def max_input_length(clf) -> int:
+    """Returns the maximum number of subword tokens, special tokens included, the model of a pipeline accepts."""
+    # tokenizers without a set limit report a huge sentinel value
+    return min(clf.tokenizer.model_max_length, getattr(clf.model.config, "max_position_embeddings", 512))
+
+
+def input_lengths(clf, inputs: List[str]) -> List[int]:
+    """Returns the number of subword tokens, special tokens included and without truncation, of each model input."""
+    if not inputs:
+        return []
+    with inference_lock:
+        return [len(input_ids) for input_ids in clf.tokenizer(inputs, verbose=False)["input_ids"]]
+
+
+def word_input_lengths(clf, scene_types: List[str], sequences: List[str]) -> List[int]:
+    """
+    Returns the same counts as `input_lengths` for the model inputs of OCR sequences ("<scene type> <sequence>"), from
+    the subword tokens of each distinct word, tokenized once. Much cheaper on sequences that share most of their words,
+    such as the frames of a scrolling credit roll.
+    """
+    if not sequences:
+        return []
+    split = [[scene_type] + sequence.split() for scene_type, sequence in zip(scene_types, sequences)]
+    words = list({word for sequence_words in split for word in sequence_words})
+    with inference_lock:
+        encoded = clf.tokenizer(words, is_split_into_words=True, add_special_tokens=False, verbose=False)
+        special_len = clf.tokenizer.num_special_tokens_to_add()
+    word_lengths = dict.fromkeys(words, 0)
+    for word_id in encoded.word_ids():
+        word_lengths[words[word_id]] += 1
+    return [special_len + sum(word_lengths[word] for word in sequence_words) for sequence_words in split]
+
+
+def respell_pairs(clf, pairs: List[dict]) -> List[dict]:
+    """
+    Spells the roles and fillers of role-filler pairs taken from the OCR text as the model path would, had the model
+    tagged the same words (see `respell`), so that both paths give the same strings.
+    """
+    if not pairs:
+        return []
+    with inference_lock:
+        spelled = respell(clf.tokenizer, [text for pair in pairs for text in (pair["Role"], pair["Filler"])])
+    return [{"Role": role, "Filler": filler} for role, filler in zip(spelled[::2], spelled[1::2])]
+
+
+def tag_inputs(clf, inputs: List[str], batcher: TokenBudgetBatcher, timer: StageTimer = None) -> List[List[dict]]:
+    """
+    Runs model inputs through a token classification pipeline, in the batches planned by `batcher`. When a `timer`
+    is given, the time spent in tokenization and in the model is added to its `tokenize` and `forward` stages.
+
+    Returns:
+        List[List[dict]]: The entity groups predicted on each input, in the same order as the inputs.
+    """
+    timer = timer or StageTimer()
+    with inference_lock:
+        with timer.stage("tokenize"):
+            lengths = [len(input_ids) for input_ids in clf.tokenizer(inputs, truncation=True)["input_ids"]]
+        outputs = [None] * len(inputs)
+        with timer.stage("forward"):
+            for batch in batcher.plan(lengths):
+                batch_outputs = clf([inputs[pos] for pos in batch], batch_size=len(batch))
+                for pos, output in zip(batch, batch_outputs):
+                    outputs[pos] = output
+                BATCHES.inc()
+                BATCH_REAL_TOKENS.inc(sum(lengths[pos] for pos in batch))
+                BATCH_PADDED_TOKENS.inc(len(batch) * max(lengths[pos] for pos in batch))
+    for length in lengths:
+        SEQUENCE_TOKENS.observe(length)
+    return outputs
+
+
+def bind_role_fillers_batch(ocr_results, scene_types, clf=None, batch_size=16, cache=None, batcher=None,
+                            window_size=None, window_overlap=64, queue=None, timer=None,
+                            input_tokens=None) -> List[List[dict]]:
+    """
+    Batched version of `bind_role_fillers`. Runs the model on many OCR results at once, in forward passes of
+    several sequences instead of one pass per sequence. Sequences are sorted by subword length before batching,
+    so that short chyrons are not padded to the length of long credit rolls.
+
+    Args:
+        clf (Pipeline): A HuggingFace pipeline for Token Classification. Defaults to the shared (lazily loaded) tagger.
+        ocr_results (List[str]): OCR results from many video frames.
+        scene_types (List[str]): The type of scene for each OCR result, either "credits" or "chyron".
+        batch_size (int): The maximum number of sequences to pass through the model at once, when no `batcher` is given.
+        cache (RFBCache): An optional cache of previous results. Only inputs missing from the cache are run through
+            the model, and their results are added to the cache.
+        batcher (TokenBudgetBatcher): An optional batcher that forms batches under a token budget, and keeps count
+            of padding.
+        window_size (int): Maximum number of subword tokens, special tokens included, of a model input. Longer
+            sequences are split into overlapping windows that are batched with the other inputs, and whose
+            predictions are stitched back together. Defaults to the maximum input length of the model.
+        window_overlap (int): Maximum number of subword tokens shared by two consecutive windows of a sequence.
+        queue (MicroBatcher): An optional queue, shared with concurrent callers, that runs model inputs in batches
+            coalesced across callers (see `tag_inputs`). When given, `batch_size` and `batcher` are not used.
+        timer (StageTimer): An optional timer of the request, to which the time spent in tokenization, in the model
+            (`forward`, including the wait in the `queue` if any) and in parsing the tags (`parse_tags`) is added.
+            Without one, the time of each stage is directly recorded in the stage metrics.
+        input_tokens (List[int]): An optional list, filled with the number of subword tokens run through the model for
+            each input: the tokens of all its windows for a windowed sequence, and 0 for a result taken from the
+            cache or from an identical input of the same call.
+
+    Returns:
+        List[List[dict]]: Role-filler pairs for each input, in the same order as the inputs.
+    """
+    if input_tokens is not None:
+        input_tokens[:] = [0] * len(ocr_results)
+    if not ocr_results:
+        return []
+    if clf is None:
+        clf = rfb_model.tagger
+    own_timer = timer is None
+    timer = timer or StageTimer()
+
+    max_len = min(window_size or max_input_length(clf), max_input_length(clf))
+    results = [None] * len(ocr_results)
+    todo = list(range(len(ocr_results)))
+    if cache is not None:
+        model_id = model_identity(clf.model)
+        # results of windowed sequences depend on the window settings, which must not invalidate other entries
+        variant = f"window={max_len},{window_overlap}"
+        for idx in todo:
+            results[idx] = cache.get(scene_types[idx], ocr_results[idx], model_id, variant)
+        todo = [idx for idx in todo if results[idx] is None]
+    if not todo:
+        if own_timer:
+            timer.observe()
+        return results
+
+    # identical inputs in the same batch are only run once when caching
+    if cache is not None:
+        duplicates = defaultdict(list)
+        for idx in todo:
+            duplicates[(scene_types[idx], ocr_results[idx])].append(idx)
+        todo = [idxs[0] for idxs in duplicates.values()]
+
+    # model inputs, with the position in `todo` of the sequence each comes from; sequences over the maximum length
+    # give one input per window
+    rfb_sents = [f"{scene_types[idx]} {ocr_results[idx]}" for idx in todo]
+    with inference_lock, timer.stage("tokenize"):
+        full_lengths = [len(input_ids) for input_ids in clf.tokenizer(rfb_sents, verbose=False)["input_ids"]]
+        inputs, sources, windowed = [], [], {}
+        for pos, (idx, sent, length) in enumerate(zip(todo, rfb_sents, full_lengths)):
+            if length <= max_len:
+                inputs.append(sent)
+                sources.append(pos)
+                if input_tokens is not None:
+                    input_tokens[idx] = length
+                continue
+            scene_len = len(clf.tokenizer(scene_types[idx], add_special_tokens=False)["input_ids"])
+            words = ocr_results[idx].split()
+            word_lengths = [0] * len(words)
+            encoded = clf.tokenizer(words, is_split_into_words=True, add_special_tokens=False, verbose=False)
+            for word_id in encoded.word_ids():
+                word_lengths[word_id] += 1
+            special_len = clf.tokenizer.num_special_tokens_to_add()
+            windows = plan_windows(word_lengths, max(max_len - special_len - scene_len, 1), window_overlap)
+            windowed[pos] = (words, windows)
+            for window in windows:
+                inputs.append(window_text(scene_types[idx], words, window))
+                sources.append(pos)
+            if input_tokens is not None:
+                input_tokens[idx] = sum(special_len + scene_len + sum(word_lengths[start:end])
+                                        for start, end in windows)
+
+    if queue is not None:
+        with timer.stage("forward"):
+            input_outputs = queue.map(inputs)
+    else:
+        if batcher is None:
+            batcher = TokenBudgetBatcher(max_batch_size=batch_size)
+        input_outputs = tag_inputs(clf, inputs, batcher, timer=timer)
+    outputs = [[] for _ in todo]
+    for pos, output in zip(sources, input_outputs):
+        outputs[pos].append(output)
+    for pos, (words, windows) in windowed.items():
+        outputs[pos] = [stitch_windows(scene_types[todo[pos]], words, windows, outputs[pos])]
+
+    for idx, (output, ) in zip(todo, outputs):
+        with timer.stage("parse_tags"):
+            results[idx] = parse_sequence_tags([(entry["entity_group"], entry["word"]) for entry in output],
+                                               scene_types[idx])
+        if cache is not None:
+            for dup_idx in duplicates[(scene_types[idx], ocr_results[idx])][1:]:
+                results[dup_idx] = results[idx]
+    if cache is not None:
+        cache.put_many([(scene_types[idx], ocr_results[idx], results[idx]) for idx in todo], model_id, variant)
+    if own_timer:
+        timer.observe()
+    return results
@@ -0,0 +1,125 @@
+"""
+Utility functions for tagging scrolling credit rolls incrementally.
+
+In a scrolling credit roll, consecutive frames share most of their lines: each frame shows the lines of the previous
+one moved up, minus the lines that left the top, plus the lines that entered at the bottom. Aligning the lines of
+consecutive frames finds the newly visible ones, which are tagged along with a few lines of context around them
+instead of tagging the whole frame again. The pairs of the lines a frame shares with the previous one are carried
+over from the previous frame, and the pairs found across the frames of a roll are merged into one deduplicated list.
+"""
+from difflib import SequenceMatcher
+from typing import List, Optional, Tuple
+
+
+def line_key(line: List[str]) -> str:
+    """Returns the comparison key of an OCR line: its letters and digits, lowercased, so that spacing, punctuation
+    and case differences between two readings of the same line do not matter."""
+    return ''.join(char for word in line for char in word.lower() if char.isalnum())
+
+
+def new_line_spans(previous: List[str], current: List[str]) -> Optional[List[Tuple[int, int]]]:
+    """
+    Aligns the line keys of two consecutive frames, in order, and finds the lines of the current frame that are not
+    in the previous one.
+
+    Returns:
+        Optional[List[Tuple[int, int]]]: The (start, end) line ranges of the new lines of the current frame, or None
+            if the frames have no line in common.
+    """
+    matcher = SequenceMatcher(None, previous, current, autojunk=False)
+    spans, pos, matched = [], 0, 0
+    for _, start, size in matcher.get_matching_blocks():
+        # the last block is a dummy of size 0 at the end of both sequences
+        if start > pos:
+            spans.append((pos, start))
+        pos = start + size
+        matched += size
+    if current and not matched:
+        return None
+    return spans
+
+
+def context_spans(spans: List[Tuple[int, int]], num_lines: int, context: int) -> List[Tuple[int, int]]:
+    """Widens line ranges by `context` lines on each side, within the frame, and merges the ones that overlap."""
+    merged = []
+    for start, end in spans:
+        start, end = max(start - context, 0), min(end + context, num_lines)
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class ScrollTracker:
+    """
+    Tracks a run of consecutive credits frames (a roll), and plans which lines of each frame need to be tagged.
+
+    Args:
+        context (int): Number of lines above and below the new lines of a frame that are tagged with them.
+    """
+
+    def __init__(self, context: int):
+        self.context = context
+        self.rolls = 0
+        self._keys = None
+
+    def reset(self) -> None:
+        """Ends the current roll."""
+        self._keys = None
+
+    def plan(self, lines: List[List[str]]) -> Optional[List[Tuple[int, int]]]:
+        """
+        Adds a frame to the current roll, or starts a new roll with it.
+
+        Args:
+            lines (List[List[str]]): The cleaned words of each line of the frame.
+
+        Returns:
+            Optional[List[Tuple[int, int]]]: The (start, end) ranges of the lines to tag, or None if the whole frame
+                must be tagged: the first frame of a roll, a frame without lines in common with the previous one, or
+                a frame whose new lines and their context cover it entirely.
+        """
+        keys = [line_key(line) for line in lines]
+        previous, self._keys = self._keys, keys
+        if previous is None:
+            self.rolls += 1
+            return None
+        spans = new_line_spans(previous, keys)
+        if spans is None:
+            return None
+        spans = context_spans(spans, len(keys), self.context)
+        if sum(end - start for start, end in spans) >= len(keys):
+            return None
+        return spans
+
+
+def visible_pairs(pairs: List[dict], lines: List[List[str]]) -> List[dict]:
+    """
+    Returns the role-filler pairs whose role and filler are both read in the lines of a frame, compared as by
+    `line_key`. Used to carry the pairs of a frame over to the next frame of a roll, which only tags its new lines.
+    """
+    frame_key = ''.join(line_key(line) for line in lines)
+    return [pair for pair in pairs
+            if line_key(pair['Role'].split()) in frame_key and line_key(pair['Filler'].split()) in frame_key]
+
+
+def roll_pairs(frame_pairs: List[List[dict]]) -> List[dict]:
+    """
+    Merges the role-filler pairs of the frames of a roll into one list, without duplicates.
+
+    Args:
+        frame_pairs (List[List[dict]]): The pairs found in each frame of the roll, in order.
+
+    Returns:
+        List[dict]: Each distinct pair of the roll, in the order they are first found in.
+    """
+    seen = set()
+    merged = []
+    for pairs in frame_pairs:
+        for pair in pairs:
+            key = (pair['Role'], pair['Filler'])
+            if key not in seen:
+                seen.add(key)
+                merged.append(pair)
+    return merged
@@ -0,0 +1,96 @@
+"""
+Sliding-window inference for sequences longer than the model's maximum input length.
+
+Long scrolling credit rolls can exceed the 512-subword limit of BERT, in which case every token past the limit would
+be cut off. Such sequences are split at word boundaries into overlapping windows, each prefixed by the scene type
+token like a regular input. The entity groups predicted on each window are then stitched back into one sequence:
+every window owns the words up to the middle of its overlap with the next window, and an entity group is kept from
+the window that owns its first word.
+"""
+
+from bisect import bisect_right
+from typing import List, Tuple
+
+
+def plan_windows(word_lengths: List[int], max_tokens: int, overlap: int) -> List[Tuple[int, int]]:
+    """
+    Splits a sequence of words into overlapping windows.
+
+    Args:
+        word_lengths (List[int]): Number of subword tokens of each word.
+        max_tokens (int): Maximum number of subword tokens in a window. A single word longer than this gets a window
+            of its own.
+        overlap (int): Maximum number of subword tokens shared by two consecutive windows.
+
+    Returns:
+        List[Tuple[int, int]]: Start (inclusive) and end (exclusive) word indices of each window.
+    """
+    windows = []
+    start = 0
+    while True:
+        end = start
+        size = 0
+        while end < len(word_lengths) and (end == start or size + word_lengths[end] <= max_tokens):
+            size += word_lengths[end]
+            end += 1
+        windows.append((start, end))
+        if end >= len(word_lengths):
+            return windows
+        # step back from the end of the window to share up to `overlap` tokens, always moving forward and leaving
+        # room for at least one new word in the next window
+        shared = min(overlap, max_tokens - word_lengths[end])
+        next_start = end
+        size = 0
+        while next_start - 1 > start and size + word_lengths[next_start - 1] <= shared:
+            next_start -= 1
+            size += word_lengths[next_start]
+        start = next_start
+
+
+def window_text(scene_type: str, words: List[str], window: Tuple[int, int]) -> str:
+    """Returns the model input of a window: the scene type token followed by the words of the window."""
+    return " ".join([scene_type] + words[window[0]:window[1]])
+
+
+def stitch_windows(scene_type: str, words: List[str], windows: List[Tuple[int, int]],
+                   outputs: List[List[dict]]) -> List[dict]:
+    """
+    Merges the entity groups predicted on overlapping windows into one coherent sequence of entity groups.
+
+    Args:
+        scene_type (str): The scene type token that prefixes every window.
+        words (List[str]): The words of the whole sequence, without the scene type.
+        windows (List[Tuple[int, int]]): The windows, as returned by `plan_windows`.
+        outputs (List[List[dict]]): Entity groups predicted on each window, with character offsets (`start`, `end`)
+            into the window text.
+
+    Returns:
+        List[dict]: The entity groups of the whole sequence, in order.
+    """
+    # window k owns the words from bounds[k] up to bounds[k + 1]
+    bounds = [0] + [(windows[k][0] + windows[k - 1][1]) // 2 for k in range(1, len(windows))] + [len(words)]
+    prefix_len = len(scene_type) + 1
+    stitched = []
+    covered = -1
+    for k, ((start, end), entities) in enumerate(zip(windows, outputs)):
+        # character offsets of the words in the window text
+        offsets = []
+        offset = prefix_len
+        for word in words[start:end]:
+            offsets.append(offset)
+            offset += len(word) + 1
+        # entity groups of the previous windows may reach into this one
+        previous_covered = covered
+        for entity in entities:
+            if entity["start"] < prefix_len:
+                # an entity group on the scene type token is only taken from the first window, like unwindowed input
+                if k > 0:
+                    continue
+                first = -1
+            else:
+                first = start + bisect_right(offsets, entity["start"]) - 1
+                if first < bounds[k] or first >= bounds[k + 1] or first < previous_covered:
+                    continue
+            stitched.append(entity)
+            covered = start + bisect_right(offsets, entity["end"] - 1)
+    return stitched